@@ -1,28 +1,534 @@
 import io
+import re
+import copy
 import chess
 import chess.pgn
-from stockfish import Stockfish
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from typing import NamedTuple, Optional
+from position_features import tactical_facts
+from async_engine import EngineClient
+from scheduler import llm_slot
+
+
+# Fixed instruction preamble shared by every prompt. Its key/value cache is
+# computed once and reused, so prefill only processes the per-game lines.
+PROMPT_PREFIX = (
+    "You are a chess expert. Explain why the following moves were bad.\n"
+    "For each move provide concise tactical/strategic reasons and avoid hallucination.\n"
+    "Lines starting with 'facts:' are computed from the position and are correct — "
+    "build the explanation on them instead of repeating them.\n\n"
+)
+
+# Bump whenever the prompt wording changes — cached explanations of older
+# prompts are then ignored.
+PROMPT_VERSION = 2
+
+# With precomputed facts the model only has to connect them, so a short
+# answer per move is enough.
+TOKENS_PER_MOVE_WITH_FACTS = 120
+MAX_NEW_TOKENS = 350
+STREAM_TIMEOUT_S = 600     # longest wait for the next token (CPU prefill of a long prompt included)
+
+# assistant_model value for drafts copied from the prompt (n-gram lookup) instead of a draft model
+PROMPT_LOOKUP = "prompt_lookup"
+PROMPT_LOOKUP_TOKENS = 10
+
+
+class WorstMove(NamedTuple):
+    """One bad ply. Unpacks like the old (move_number, san, loss) tuples via `num, san, loss, *_`."""
+    move_number: int
+    san: str
+    loss: int
+    fen: str = ""     # position BEFORE the move
+    uci: str = ""
+    refutation: str = ""   # opponent's best reply (UCI)
+    facts: str = ""        # position_features.tactical_facts line
+
+
+def split_explanations(text, bad_moves):
+    """
+    Splits an LLM answer into one section per requested move.
+    Sections start at "Move N" headings; returns {index in bad_moves: section}
+    for every move whose heading was found (missing ones are simply absent).
+    """
+    headings = list(re.finditer(r"^\W*Move\s+(\d+)\b", text, flags=re.MULTILINE))
+    sections = {}
+    for i, match in enumerate(headings):
+        end = headings[i + 1].start() if i + 1 < len(headings) else len(text)
+        section = text[match.start():end].strip()
+        num = int(match.group(1))
+        heading = section.splitlines()[0]
+
+        candidates = [idx for idx, m in enumerate(bad_moves) if m[0] == num and idx not in sections]
+        # white and black bad moves can share a move number — prefer the SAN match
+        by_san = [idx for idx in candidates if bad_moves[idx][1] in heading]
+        if by_san or candidates:
+            sections[(by_san or candidates)[0]] = section
+    return sections
+
+
+def section_body(section, san=""):
+    """
+    A section without its "Move N: SAN" heading. The cache key ignores the
+    move counters, so the same explanation is reused at other move numbers
+    and gets its heading from the current move (section_with_heading).
+    """
+    body = re.sub(r"^\W*Move\s+\d+\b[\s.:]*", "", section, count=1)
+    for heading_san in (san, f"({san})"):
+        if san and body.startswith(heading_san):
+            body = body[len(heading_san):]
+            break
+    body = re.sub(r"^[\s*:\-–—]*\(eval change:[^)]*\)", "", body, count=1)
+    return body.lstrip(" \t*:-–—").strip()
+
+
+def section_with_heading(m, body):
+    return f"Move {m.move_number}: {m.san}\n{body}"
+
+
+def explanation_end(text, bad_moves):
+    """
+    Structural stop criterion for streamed answers.
+    Returns the length of `text` to keep once every requested move has been
+    explained, or None while the answer is still incomplete. A move counts as
+    explained once its section has a finished paragraph (text + blank line),
+    or once the model starts a heading for a move nobody asked about.
+    """
+    if not bad_moves:
+        return None
+    headings = list(re.finditer(r"^\W*Move\s+\d+\b", text, flags=re.MULTILINE))
+    sections = split_explanations(text, bad_moves)
+    if len(sections) < len(bad_moves):
+        return None
+
+    if len(headings) > len(bad_moves):
+        return headings[len(bad_moves)].start()
+
+    last = text[headings[-1].start():]
+    body = last.split("\n", 1)[1] if "\n" in last else ""
+    match = re.search(r"\S[^\n]*\n[ \t]*\n", body)
+    if match is None:
+        return None
+    return len(text) - len(body) + match.end()
+
+
+def _stop_when_explained(pieces, bad_moves):
+    """
+    Passes streamed text through, trimmed at explanation_end().
+    A short unfinished line is held back until it is complete, so the start
+    of an extra "Move N" heading is never shown before the cut.
+    """
+    text = ""
+    emitted = 0
+    for piece in pieces:
+        text += piece
+        end = explanation_end(text, bad_moves) if bad_moves else None
+        if end is not None:
+            if end > emitted:
+                yield text[emitted:end]
+            return
+
+        last_line = text[text.rfind("\n") + 1:]
+        safe = len(text) - len(last_line) if len(last_line) < 16 else len(text)
+        if safe > emitted:
+            yield text[emitted:safe]
+            emitted = safe
+
+    if len(text) > emitted:
+        yield text[emitted:]
 
 
 class LLMChessAnalyzer:
-    def __init__(self, model_path: str, stockfish_path: str = "stockfish.exe"):
+    def __init__(
+        self,
+        model_path: Optional[str],
+        stockfish_path: str = "stockfish.exe",
+        device: str = "auto",
+        quantization: Optional[str] = None,
+        num_threads: Optional[int] = None,
+        cache_path: Optional[str] = "cache/explanations.sqlite",
+        pattern_index=None,
+        retrieval_index=None,
+        priority: str = "interactive",
+        assistant_model: Optional[str] = None,
+    ):
+        """
+        model_path=None skips loading the LLM (Stockfish-only analysis).
+        transformers / torch are imported only when a model is actually loaded.
+
+        CPU inference options:
+          - model_path ending with ".gguf" -> llama.cpp backend (llama-cpp-python),
+            weights are mmap'd and already quantized (Q4_K_M, Q8_0, ...)
+          - device="cpu" + quantization="int8" / "int4" -> transformers with
+            quanto weight-only quantization (bf16 activations)
+          - num_threads -> torch / llama.cpp thread count
+
+        cache_path: sqlite file of per-move explanations (None disables caching).
+        pattern_index: PatternIndex (or path to data/patterns.npz) — similar
+        mistakes from earlier games are added to the prompt as examples.
+        retrieval_index: RetrievalIndex (or its folder, opened read-only) —
+        the top-k analogous explained cases are added to the prompt.
+        priority: scheduler class (interactive / watch / bulk) for the engine
+        pool and the machine-wide LLM slots (scheduler.py).
+        assistant_model: speculative (assisted) decoding. A small draft model
+        proposes several tokens, and the main model checks them in one forward
+        pass and keeps the ones it would have picked itself, so the text is
+        the greedy output, produced in fewer main-model steps. Either the HF
+        path / id of a small causal LM (same tokenizer as the main model is
+        fastest, others go through universal assisted decoding), or
+        PROMPT_LOOKUP: drafts are copied from the prompt (the facts lines get
+        repeated a lot), no second model — the only kind llama.cpp offers.
+        stockfish_path=None starts no engine (LLM-only use, bench_speculative.py).
+        """
+        self.tokenizer = None
+        self.model = None
+        self.backend = None
+        self.device = device
+        self.quantization = quantization
+        self.num_threads = num_threads
+        self._prefix_ids = None
+        self._prefix_kv = None
+        self.model_id = model_path
+        self.assistant = None
+        self.assistant_tokenizer = None
+        self.cache = None
+        self.pattern_index = pattern_index
+        self.priority = priority
+
+        if isinstance(pattern_index, str):
+            from pattern_index import PatternIndex
+            self.pattern_index = PatternIndex.load(pattern_index)
+
+        self.retrieval_index = retrieval_index
+        if isinstance(retrieval_index, str):
+            from retrieval_index import RetrievalIndex
+            self.retrieval_index = RetrievalIndex(retrieval_index, read_only=True)
+
+        if model_path:
+            self._load_model(model_path)
+            if assistant_model:
+                self._load_assistant(assistant_model)
+            if cache_path:
+                from explanation_cache import ExplanationCache
+                self.cache = ExplanationCache(cache_path)
+
+        self.engine = None
+        if stockfish_path:
+            self.engine = EngineClient(
+                stockfish_path,
+                size=1,
+                depth=18,
+                options={"Threads": 4, "Minimum Thinking Time": 30}
+            )
+            print("[LLMChessAnalyzer] Stockfish initialized.")
+
+    def _load_model(self, model_path: str):
         print("[LLMChessAnalyzer] Loading model...")
 
+        if model_path.lower().endswith(".gguf"):
+            self._load_gguf(model_path)
+        else:
+            self._load_transformers(model_path)
+
+        print(f"[LLMChessAnalyzer] Model loaded successfully ({self.backend}).")
+
+    def _load_transformers(self, model_path: str):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+        kwargs = {"low_cpu_mem_usage": True}   # safetensors shards are mmap'd, no full copy
+
+        if self.device == "cpu":
+            kwargs["device_map"] = "cpu"
+            kwargs["dtype"] = torch.bfloat16    # half of fp32 RSS, fast on AVX512-BF16 / AMX
+        else:
+            kwargs["device_map"] = self.device
+            kwargs["dtype"] = "auto"
+
+        if self.quantization:
+            if self.quantization not in ("int8", "int4"):
+                raise ValueError(f"Unsupported quantization: {self.quantization} (use int8 / int4)")
+            from transformers import QuantoConfig
+            kwargs["quantization_config"] = QuantoConfig(weights=self.quantization)
+
         self.tokenizer = AutoTokenizer.from_pretrained(model_path)
-        self.model = AutoModelForCausalLM.from_pretrained(
-            model_path,
-            device_map="auto",
-            dtype="auto",
+        self.model = AutoModelForCausalLM.from_pretrained(model_path, **kwargs)
+        self.model.eval()
+        self.backend = "transformers"
+
+    def _load_gguf(self, model_path: str):
+        try:
+            from llama_cpp import Llama
+        except ImportError:
+            raise RuntimeError("GGUF models need llama-cpp-python: pip install llama-cpp-python")
+
+        self.model = Llama(
+            model_path=model_path,
+            n_ctx=4096,
+            n_threads=self.num_threads,
+            use_mmap=True,
+            verbose=False,
+        )
+        self.backend = "llama_cpp"
+
+    def _load_assistant(self, assistant_model: str):
+        if assistant_model == PROMPT_LOOKUP:
+            if self.backend == "llama_cpp":
+                from llama_cpp.llama_speculative import LlamaPromptLookupDecoding
+                self.model.draft_model = LlamaPromptLookupDecoding(num_pred_tokens=PROMPT_LOOKUP_TOKENS)
+            self.assistant = PROMPT_LOOKUP
+            print("[LLMChessAnalyzer] Prompt lookup drafts enabled.")
+            return
+
+        if self.backend == "llama_cpp":
+            raise RuntimeError(
+                "llama-cpp-python only supports prompt lookup drafts — "
+                f"use assistant_model={PROMPT_LOOKUP!r} with .gguf models"
+            )
+
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        # same placement / dtype as the main model; the draft is small, so never quantized
+        kwargs = {"low_cpu_mem_usage": True, "device_map": self.device}
+        kwargs["dtype"] = torch.bfloat16 if self.device == "cpu" else "auto"
+        self.assistant = AutoModelForCausalLM.from_pretrained(assistant_model, **kwargs)
+        self.assistant.eval()
+
+        tokenizer = AutoTokenizer.from_pretrained(assistant_model)
+        if tokenizer.get_vocab() != self.tokenizer.get_vocab():
+            self.assistant_tokenizer = tokenizer     # different vocabulary: universal assisted decoding
+        print(f"[LLMChessAnalyzer] Draft model loaded ({assistant_model}).")
+
+    def _assisted_kwargs(self):
+        """generate() kwargs of the assisted mode ({} when off or on llama.cpp, where it is set on the model)."""
+        if self.assistant is None or self.backend != "transformers":
+            return {}
+        if self.assistant == PROMPT_LOOKUP:
+            return {"prompt_lookup_num_tokens": PROMPT_LOOKUP_TOKENS}
+        kwargs = {"assistant_model": self.assistant}
+        if self.assistant_tokenizer is not None:
+            kwargs.update(tokenizer=self.tokenizer, assistant_tokenizer=self.assistant_tokenizer)
+        return kwargs
+
+    # -----------------------------------------------------
+
+    def _prefix_cache(self):
+        """
+        Key/value cache of PROMPT_PREFIX, computed on first use.
+        Returns (prefix_ids, past_key_values) — callers must deepcopy the cache,
+        generate() extends it in place.
+        """
+        if self._prefix_kv is None:
+            import torch
+
+            ids = self.tokenizer(PROMPT_PREFIX, return_tensors="pt").input_ids.to(self.model.device)
+            with torch.no_grad():
+                self._prefix_kv = self.model(input_ids=ids, use_cache=True).past_key_values
+            self._prefix_ids = ids
+        return self._prefix_ids, self._prefix_kv
+
+    def _cached_prefix_for(self, input_ids):
+        """Prefix cache if input_ids really start with the prefix tokens, else None."""
+        prefix_ids, prefix_kv = self._prefix_cache()
+        n = prefix_ids.shape[1]
+        if input_ids.shape[1] <= n or not bool((input_ids[0, :n] == prefix_ids[0]).all()):
+            return None
+        return prefix_kv
+
+    def _generate(self, prompt: str, max_new_tokens: int = 350, bad_moves=None) -> str:
+        """Greedy generation on whichever backend was loaded. Returns completion only."""
+        return "".join(self._generate_stream(prompt, max_new_tokens, bad_moves)).strip()
+
+    def _generate_stream(self, prompt: str, max_new_tokens: int = 350, bad_moves=None):
+        """
+        Yields completion text as it is generated (new tokens only, decoded
+        incrementally). With bad_moves given, generation stops as soon as
+        explanation_end() says every move has been explained.
+        Runs inside one of the machine-wide LLM slots (scheduler.llm_slot).
+        """
+        with llm_slot(self.priority):
+            yield from self._generate_stream_unlocked(prompt, max_new_tokens, bad_moves)
+
+    def _generate_stream_unlocked(self, prompt, max_new_tokens, bad_moves):
+        if self.backend == "llama_cpp":
+            # llama.cpp keeps the KV of the longest common token prefix between
+            # consecutive calls, so PROMPT_PREFIX is evaluated only once.
+            pieces = (
+                chunk["choices"][0]["text"]
+                for chunk in self.model(prompt, max_tokens=max_new_tokens, temperature=0.0, stream=True)
+            )
+            yield from _stop_when_explained(pieces, bad_moves)
+            return
+
+        import queue
+        import threading
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+        class CollectingStreamer(TextIteratorStreamer):
+            """Also keeps the decoded text, readable from the generate() thread."""
+            text = ""
+
+            def on_finalized_text(self, text, stream_end=False):
+                self.text += text
+                super().on_finalized_text(text, stream_end)
+
+        class StopWhenExplained(StoppingCriteria):
+            aborted = False
+
+            def __call__(self, input_ids, scores, **kwargs):
+                done = self.aborted or (
+                    bad_moves is not None and explanation_end(streamer.text, bad_moves) is not None
+                )
+                return torch.full((input_ids.shape[0],), done, dtype=torch.bool, device=input_ids.device)
+
+        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
+        streamer = CollectingStreamer(
+            self.tokenizer, skip_prompt=True, skip_special_tokens=True, timeout=STREAM_TIMEOUT_S
         )
-        print("[LLMChessAnalyzer] Model loaded successfully.")
+        stop = StopWhenExplained()
+
+        kwargs = self._assisted_kwargs()
+        # assisted decoding prefills the draft from the full prompt anyway — the prefix
+        # cache is only used on the plain path
+        prefix_kv = None if kwargs else self._cached_prefix_for(inputs.input_ids)
+        if prefix_kv is not None:
+            kwargs["past_key_values"] = copy.deepcopy(prefix_kv)
 
-        self.stockfish = Stockfish(
-            path=stockfish_path,
-            depth=18,
-            parameters={"Threads": 4, "Minimum Thinking Time": 30}
+        errors = []
+
+        def run():
+            try:
+                self.model.generate(
+                    **inputs,
+                    max_new_tokens=max_new_tokens,
+                    do_sample=False,
+                    streamer=streamer,
+                    stopping_criteria=StoppingCriteriaList([stop]),
+                    **kwargs,
+                )
+            except BaseException as e:
+                # unblock the consumer; the error is raised on its side
+                errors.append(e)
+                streamer.end()
+
+        def pieces():
+            try:
+                yield from streamer
+            except queue.Empty:
+                raise RuntimeError(f"generate() produced no token for {STREAM_TIMEOUT_S}s") from None
+
+        worker = threading.Thread(target=run, daemon=True)
+        worker.start()
+        try:
+            yield from _stop_when_explained(pieces(), bad_moves)
+        finally:
+            # consumer stopped early (or finished): let generate() exit at the next token
+            stop.aborted = True
+            worker.join(STREAM_TIMEOUT_S)
+        if errors:
+            raise errors[0]
+
+    def _generate_batch(self, prompts, max_new_tokens=350, bad_moves_per_prompt=None):
+        """
+        Batched generation sharing one prefix cache across all sequences.
+        Layout per row: [PROMPT_PREFIX tokens | left padding | suffix tokens];
+        padding sits after the cached prefix, position ids come from the
+        attention mask so every suffix continues right after the prefix.
+        max_new_tokens is one budget for all rows or a list with one per row;
+        each row stops and is trimmed like _generate() with its bad_moves, so
+        the outputs are the ones of sequential _generate() calls.
+        """
+        budgets = max_new_tokens if isinstance(max_new_tokens, list) else [max_new_tokens] * len(prompts)
+        bad_moves_per_prompt = bad_moves_per_prompt or [None] * len(prompts)
+
+        def sequential():
+            return [self._generate(p, b, bad) for p, b, bad in zip(prompts, budgets, bad_moves_per_prompt)]
+
+        if self.backend == "llama_cpp" or self.assistant is not None:
+            # assisted generation verifies one sequence at a time
+            return sequential()
+
+        with llm_slot(self.priority):
+            outputs = self._generate_batch_unlocked(prompts, budgets, bad_moves_per_prompt)
+        if outputs is None:
+            # prompts do not share the prefix: no batching benefit
+            outputs = sequential()
+        return outputs
+
+    def _generate_batch_unlocked(self, prompts, budgets, bad_moves_per_prompt):
+        """None when a prompt does not start with the cached prefix."""
+        import torch
+        from transformers import StoppingCriteria, StoppingCriteriaList
+
+        prefix_ids, prefix_kv = self._prefix_cache()
+        n = prefix_ids.shape[1]
+        pad_id = self.tokenizer.pad_token_id
+        if pad_id is None:
+            pad_id = self.tokenizer.eos_token_id
+
+        suffixes = []
+        for prompt in prompts:
+            ids = self.tokenizer(prompt, return_tensors="pt").input_ids[0]
+            if ids.shape[0] <= n or not bool((ids[:n].to(prefix_ids.device) == prefix_ids[0]).all()):
+                return None
+            suffixes.append(ids[n:])
+
+        width = max(len(x) for x in suffixes)
+        input_ids = torch.full((len(prompts), n + width), pad_id, dtype=torch.long)
+        attention_mask = torch.zeros_like(input_ids)
+        input_ids[:, :n] = prefix_ids[0].cpu()
+        attention_mask[:, :n] = 1
+        for row, ids in enumerate(suffixes):
+            input_ids[row, n + width - len(ids):] = ids
+            attention_mask[row, n + width - len(ids):] = 1
+
+        def completion(ids, row):
+            return self.tokenizer.decode(ids[:budgets[row]], skip_special_tokens=True)
+
+        class StopRowsWhenExplained(StoppingCriteria):
+            """Per row: its own token budget, or explanation_end() on its own text."""
+
+            def __call__(self, input_ids, scores, **kwargs):
+                new = input_ids[:, n + width:]
+                done = [
+                    new.shape[1] >= budgets[row] or (
+                        bad_moves_per_prompt[row] is not None
+                        and explanation_end(completion(new[row], row), bad_moves_per_prompt[row]) is not None
+                    )
+                    for row in range(new.shape[0])
+                ]
+                return torch.tensor(done, dtype=torch.bool, device=input_ids.device)
+
+        cache = copy.deepcopy(prefix_kv)
+        cache.batch_repeat_interleave(len(prompts))
+
+        output = self.model.generate(
+            input_ids=input_ids.to(self.model.device),
+            attention_mask=attention_mask.to(self.model.device),
+            past_key_values=cache,
+            max_new_tokens=max(budgets),
+            do_sample=False,
+            pad_token_id=pad_id,
+            stopping_criteria=StoppingCriteriaList([StopRowsWhenExplained()]),
         )
-        print("[LLMChessAnalyzer] Stockfish initialized.")
+
+        outputs = []
+        for row, ids in enumerate(output[:, n + width:]):
+            ids = ids[:budgets[row]]
+            # replay the row token by token through the same trimming as the streamed path
+            pieces, previous = [], ""
+            for k in range(1, len(ids) + 1):
+                text = self.tokenizer.decode(ids[:k], skip_special_tokens=True)
+                if text.endswith("\ufffd"):
+                    continue            # unfinished multi-byte character, as TextIteratorStreamer waits
+                pieces.append(text[len(previous):])
+                previous = text
+            outputs.append("".join(_stop_when_explained(pieces, bad_moves_per_prompt[row])).strip())
+        return outputs
 
     # -----------------------------------------------------
 
@@ -79,31 +585,26 @@ class LLMChessAnalyzer:
     def find_worst_moves(self, moves_san, n=2):
         """
         Finds the N worst moves based on Stockfish evaluation drop.
-        Returns list of tuples: (move_number (1-based ply pair index), san, loss)
-          e.g. [(13, "Nd4", -466), (59, "Ke3", -278)]
+        Returns list of WorstMove tuples: (move_number (1-based ply pair index), san, loss, fen, uci)
+          e.g. [(13, "Nd4", -466, ...), (59, "Ke3", -278, ...)]
         moves_san should be a list of SAN strings in game order (white, black, white, ...).
         """
+        if self.engine is None:
+            raise RuntimeError("engine required for find_worst_moves (LLMChessAnalyzer was created with stockfish_path=None)")
+
         board = chess.Board()
         records = []  # tuples of (move_index, san, loss)
+        refutations = {}  # ply_idx -> engine's best reply after that ply
 
-        # We'll track evaluation before the move and after the move for each ply.
-        # Use Stockfish by setting fen to board.fen() before and after move.
-        eval_before = None
+        # One game key for the whole game: ucinewgame only once, every ply is
+        # sent as "position startpos moves ..." so the hash stays warm.
+        # The eval after a ply is the eval before the next one, so each
+        # position is searched once — and its PV gives the refutation for free.
+        game = self.engine.new_game_key()
+        val_before = self._score_from_eval(self.engine.evaluate(board, game=game, priority=self.priority).raw)
 
         for ply_idx, move_san in enumerate(moves_san):
-            # evaluation before move (from the current board)
             fen_before = board.fen()
-            try:
-                self.stockfish.set_fen_position(fen_before)
-            except Exception:
-                # fallback: use set_position([]) if wrapper does not accept fen (unlikely)
-                try:
-                    self.stockfish.set_position([])
-                except Exception:
-                    pass
-
-            eval_data_before = self.stockfish.get_evaluation()
-            val_before = self._score_from_eval(eval_data_before)
 
             # parse and push the move on python-chess board
             try:
@@ -117,17 +618,9 @@ class LLMChessAnalyzer:
             board.push(move)
 
             # evaluation after move (on new board)
-            fen_after = board.fen()
-            try:
-                self.stockfish.set_fen_position(fen_after)
-            except Exception:
-                try:
-                    self.stockfish.set_position([])
-                except Exception:
-                    pass
-
-            eval_data_after = self.stockfish.get_evaluation()
-            val_after = self._score_from_eval(eval_data_after)
+            info = self.engine.evaluate(board, game=game, priority=self.priority)
+            val_after = self._score_from_eval(info.raw)
+            refutations[ply_idx] = info.best_move
 
             # loss: after - before (negative = evaluation dropped for side to move BEFORE move)
             # Note: because evaluations are from white's perspective, sign already reflects advantage.
@@ -137,35 +630,93 @@ class LLMChessAnalyzer:
             # ply_idx=0 -> move 1 (white), ply_idx=1 -> move 1 (black), ply_idx=2 -> move 2 (white), ...
             move_number = (ply_idx // 2) + 1
 
-            records.append((move_number, move_san, loss))
+            records.append(WorstMove(move_number, move_san, loss, fen_before, move.uci(),
+                                     refutations[ply_idx]))
+            val_before = val_after
 
         # sort by loss (most negative first)
         records.sort(key=lambda x: x[2])
 
-        # return top n worst
-        return records[:n]
+        # return top n worst, with the tactical facts of each
+        return [
+            m._replace(facts=tactical_facts(chess.Board(m.fen), chess.Move.from_uci(m.uci), m.refutation))
+            for m in records[:n]
+        ]
+
+    def similar_mistakes(self, m, k=2):
+        """Earlier flagged plies most similar to a WorstMove (pattern_index rows)."""
+        if self.pattern_index is None or not m.fen:
+            return []
+        from position_features import ply_features
+
+        vector, tags = ply_features(chess.Board(m.fen), chess.Move.from_uci(m.uci), m.refutation)
+        idx = self.pattern_index.nearest(vector, tags, k=k, exclude_fen=m.fen)
+        return self.pattern_index.rows(idx)
+
+    def analogous_cases(self, m, k=2):
+        """Explained positions most similar to a WorstMove (retrieval_index entries)."""
+        if self.retrieval_index is None or not m.fen:
+            return []
+        return self.retrieval_index.similar_cases(m.fen, m.uci, m.refutation, k=k)
 
     # -----------------------------------------------------
 
+    def build_prompt(self, bad_moves):
+        prompt = PROMPT_PREFIX
+
+        for m in bad_moves:
+            num, san, drop = m[:3]
+            prompt += f"- Move {num}: {san} (eval change: {drop})\n"
+            if isinstance(m, WorstMove) and m.facts:
+                prompt += f"  facts: {m.facts}\n"
+            examples = self.similar_mistakes(m) if isinstance(m, WorstMove) else []
+            for ex in examples:
+                tags = ", ".join(ex["tags"]) or "no tactic"
+                prompt += (
+                    f"  similar earlier mistake: {ex['san']} ({ex['classification']}, "
+                    f"refuted by {ex['refutation_san'] or '?'}; {tags})\n"
+                )
+            cases = self.analogous_cases(m) if isinstance(m, WorstMove) else []
+            for case in cases:
+                explanation = " ".join(case["text"].split())[:240]
+                prompt += f"  analogous case: {case['description']} Explained as: {explanation}\n"
+
+        prompt += "\nExplain concisely and base the explanation on standard chess principles."
+        return prompt
+
     def ask_llm(self, bad_moves):
         """
         bad_moves: list of tuples (move_number, san, loss)
         Example: [(13, "Nd4", -466), (59, "Ke3", -278)]
         """
-        prompt = "You are a chess expert. Explain why the following moves were bad.\n"
-        prompt += "For each move provide concise tactical/strategic reasons and avoid hallucination.\n\n"
+        if self.model is None:
+            raise RuntimeError("No LLM loaded (LLMChessAnalyzer was created with model_path=None).")
 
-        for num, san, drop in bad_moves:
-            prompt += f"- Move {num}: {san} (eval change: {drop})\n"
+        return "".join(self.ask_llm_stream(bad_moves)).strip()
 
-        prompt += "\nExplain concisely and base the explanation on standard chess principles."
+    def ask_llm_stream(self, bad_moves):
+        """Like ask_llm, but yields the explanation text while it is generated."""
+        if self.model is None:
+            raise RuntimeError("No LLM loaded (LLMChessAnalyzer was created with model_path=None).")
 
-        inputs = self.tokenizer(prompt, return_tensors="pt").to(self.model.device)
-        output = self.model.generate(**inputs, max_new_tokens=350)
-        text = self.tokenizer.decode(output[0], skip_special_tokens=True)
+        prompt = self.build_prompt(bad_moves)
+        yield from self._generate_stream(prompt, max_new_tokens=self._token_budget(bad_moves), bad_moves=bad_moves)
+
+    def ask_llm_batch(self, bad_moves_per_game):
+        """ask_llm for several games at once; the instruction prefix is prefilled only once."""
+        if self.model is None:
+            raise RuntimeError("No LLM loaded (LLMChessAnalyzer was created with model_path=None).")
 
-        # strip the prompt if included
-        return text.replace(prompt, "").strip()
+        prompts = [self.build_prompt(bad_moves) for bad_moves in bad_moves_per_game]
+        budgets = [self._token_budget(bad_moves) for bad_moves in bad_moves_per_game]
+        return self._generate_batch(prompts, max_new_tokens=budgets, bad_moves_per_prompt=list(bad_moves_per_game))
+
+    @staticmethod
+    def _token_budget(bad_moves):
+        """Fewer new tokens when every move comes with its facts line."""
+        if bad_moves and all(isinstance(m, WorstMove) and m.facts for m in bad_moves):
+            return min(MAX_NEW_TOKENS, TOKENS_PER_MOVE_WITH_FACTS * len(bad_moves))
+        return MAX_NEW_TOKENS
 
     # -----------------------------------------------------
 
@@ -176,8 +727,8 @@ class LLMChessAnalyzer:
         2. Evaluate moves using Stockfish to find the N worst moves
         3. Ask LLM to explain them
         Returns dict with keys:
-          - worst_moves: list of (move_number, san, loss)
-          - analysis: LLM text
+          - worst_moves: list of WorstMove (move_number, san, loss, fen, uci)
+          - analysis: LLM text (per-move sections come from the explanation cache when available)
         """
         moves_san, moves_uci = self.parse_pgn_moves(pgn_text)
 
@@ -188,9 +739,124 @@ class LLMChessAnalyzer:
             }
 
         worst = self.find_worst_moves(moves_san, n=n_worst)
-        explanation = self.ask_llm(worst) if worst else "No bad moves found."
+        explanation = self.explain_moves(worst) if worst else "No bad moves found."
 
         return {
             "worst_moves": worst,
             "analysis": explanation
         }
+
+    def analyze_games(self, pgn_texts, n_worst: int = 2):
+        """
+        analyze_game for several games: Stockfish runs game by game, the
+        explanations come from one batched LLM pass (explain_games).
+        Returns one analyze_game-style dict per game.
+        """
+        worst_per_game = []
+        for pgn_text in pgn_texts:
+            moves_san, _ = self.parse_pgn_moves(pgn_text)
+            worst_per_game.append(self.find_worst_moves(moves_san, n=n_worst) if moves_san else None)
+
+        games = [worst for worst in worst_per_game if worst]
+        explanations = iter(self.explain_games(games))
+
+        results = []
+        for worst in worst_per_game:
+            if worst is None:
+                results.append({"worst_moves": [], "analysis": "Error: Could not parse PGN moves."})
+            else:
+                results.append({"worst_moves": worst, "analysis": next(explanations) if worst else "No bad moves found."})
+        return results
+
+    # -----------------------------------------------------
+
+    def explain_moves(self, worst):
+        """
+        ask_llm with the per-move explanation cache in front of it:
+        only moves without a cached explanation are sent to the model.
+        """
+        sections, missing = self._cached_sections(worst)
+        text = self.ask_llm([worst[i] for i in missing]) if missing else None
+        return self._merge_sections(worst, sections, missing, text)
+
+    def explain_games(self, worst_per_game):
+        """
+        explain_moves for several games: the moves missing from the cache
+        are explained in one batched generation (ask_llm_batch), one prompt
+        per game. Returns one explanation per game.
+        """
+        cached = [self._cached_sections(worst) for worst in worst_per_game]
+        pending = [g for g, (_, missing) in enumerate(cached) if missing]
+
+        texts = {}
+        if pending:
+            bad_moves_per_game = [[worst_per_game[g][i] for i in cached[g][1]] for g in pending]
+            texts = dict(zip(pending, self.ask_llm_batch(bad_moves_per_game)))
+
+        return [
+            self._merge_sections(worst, sections, missing, texts.get(g))
+            for g, (worst, (sections, missing)) in enumerate(zip(worst_per_game, cached))
+        ]
+
+    def _merge_sections(self, worst, sections, missing, text):
+        """Cached sections + the model's answer for the missing moves, in move order."""
+        if missing:
+            bad_moves = [worst[i] for i in missing]
+            new_sections = self._store_sections(bad_moves, text)
+
+            if new_sections is None:
+                # model did not follow the "Move N" layout — keep its answer whole
+                return "\n\n".join([sections[i] for i in sorted(sections)] + [text])
+
+            for local_idx, section in new_sections.items():
+                sections[missing[local_idx]] = section
+
+        return "\n\n".join(sections[i] for i in sorted(sections))
+
+    def explain_moves_stream(self, worst):
+        """
+        Streaming explain_moves: cached sections are yielded at once,
+        the remaining moves are streamed from the model and cached when done.
+        """
+        sections, missing = self._cached_sections(worst)
+        for i in sorted(sections):
+            yield sections[i] + "\n\n"
+
+        if not missing:
+            return
+
+        bad_moves = [worst[i] for i in missing]
+        text = ""
+        for piece in self.ask_llm_stream(bad_moves):
+            text += piece
+            yield piece
+        self._store_sections(bad_moves, text.strip())
+
+    def _cached_sections(self, worst):
+        """Returns ({index: cached section}, [indices still to explain])."""
+        if self.cache is None:
+            return {}, list(range(len(worst)))
+
+        sections = {}
+        missing = []
+        for idx, m in enumerate(worst):
+            cached = self.cache.get(m.fen, m.uci, self.model_id, PROMPT_VERSION)
+            if cached is None:
+                missing.append(idx)
+            else:
+                sections[idx] = section_with_heading(m, section_body(cached, m.san))
+        return sections, missing
+
+    def _store_sections(self, bad_moves, text):
+        """Splits a fresh answer per move and caches it. None if it cannot be split."""
+        new_sections = split_explanations(text, bad_moves)
+        if len(new_sections) < len(bad_moves):
+            return None
+
+        if self.cache is not None:
+            for local_idx, section in new_sections.items():
+                m = bad_moves[local_idx]
+                if m.fen:
+                    self.cache.put(m.fen, m.uci, self.model_id, PROMPT_VERSION, section_body(section, m.san),
+                                   refutation=m.refutation)
+        return new_sections
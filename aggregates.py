@@ -0,0 +1,209 @@
+# aggregates.py
+"""
+Persisted per-player aggregate state, updated in O(new games).
+
+Everything the trend charts and global summaries need is kept as running
+sums (plus one bounded rolling window), so adding a game never requires
+the earlier games again:
+
+  - rolling window of the last N games (accuracy, CPL, perf, colour, rating)
+  - totals per perf type, per colour and per opening
+    (games, score, accuracy, CPL, inaccuracies / mistakes / blunders, moves)
+  - clock counters per bucket (metrics.clock_metrics): time-trouble and
+    fast-move errors, seconds per phase — for games with [%clk] comments
+
+State lives in data/aggregates/<username>.json.
+"""
+import json
+import os
+from collections import deque
+from typing import Optional
+
+from metrics import PHASES, clock_summary
+
+
+AGGREGATES_DIR = "data/aggregates"
+DEFAULT_WINDOW = 50
+
+
+def _empty_bucket():
+    return {
+        "games": 0, "score": 0.0, "moves": 0,
+        "accuracy_sum": 0.0, "cpl_sum": 0.0,
+        "inaccuracies": 0, "mistakes": 0, "blunders": 0,
+        "clock": _empty_clock(),
+    }
+
+
+def _empty_clock():
+    return {
+        "clocked_moves": 0, "errors": 0,
+        "time_trouble_moves": 0, "time_trouble_errors": 0,
+        "fast_moves": 0, "fast_blunders": 0,
+        "phase_seconds": [0.0] * len(PHASES), "phase_moves": [0] * len(PHASES),
+    }
+
+
+def _add_clock(bucket, stats):
+    # buckets saved before clock stats existed get the counters on first use
+    clock = bucket.setdefault("clock", _empty_clock())
+    for key, value in stats.items():
+        if isinstance(value, list):
+            clock[key] = [a + b for a, b in zip(clock[key], value)]
+        else:
+            clock[key] += value
+
+
+def _player_score(result, color):
+    if result == "1/2-1/2":
+        return 0.5
+    if result == "1-0":
+        return 1.0 if color == "white" else 0.0
+    if result == "0-1":
+        return 1.0 if color == "black" else 0.0
+    return 0.0
+
+
+class PlayerAggregates:
+    def __init__(self, username: str, window: int = DEFAULT_WINDOW, folder: str = AGGREGATES_DIR):
+        self.username = username
+        self.path = os.path.join(folder, f"{username.lower()}.json")
+        self.seen = set()
+        self.window = deque(maxlen=window)
+        self.total = _empty_bucket()
+        self.by_perf = {}
+        self.by_color = {}
+        self.by_opening = {}
+
+    # ---------- PERSISTENCE ----------
+    @classmethod
+    def load(cls, username: str, window: int = DEFAULT_WINDOW, folder: str = AGGREGATES_DIR):
+        agg = cls(username, window, folder)
+        if os.path.exists(agg.path):
+            with open(agg.path, encoding="utf-8") as f:
+                state = json.load(f)
+            agg.seen = set(state["seen"])
+            agg.window.extend(state["window"])
+            agg.total = state["total"]
+            agg.by_perf = state["by_perf"]
+            agg.by_color = state["by_color"]
+            agg.by_opening = state["by_opening"]
+        return agg
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        state = {
+            "username": self.username,
+            "seen": sorted(self.seen),
+            "window": list(self.window),
+            "total": self.total,
+            "by_perf": self.by_perf,
+            "by_color": self.by_color,
+            "by_opening": self.by_opening,
+        }
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp, self.path)
+
+    # ---------- INCREMENTAL UPDATE ----------
+    def update(self, result) -> bool:
+        """
+        Adds one GameAnalysisResult. Returns False if the game was already
+        counted or the player did not play in it.
+        """
+        color = result.color_of(self.username)
+        if color is None or result.game_id in self.seen:
+            return False
+        self.seen.add(result.game_id)
+
+        accuracy = result.white_accuracy if color == "white" else result.black_accuracy
+        cpl = result.white_cpl if color == "white" else result.black_cpl
+        counts = result.mistake_counts(color)
+        moves = (len(result.cpl_list) + (color == "white")) // 2
+        time_stats = getattr(result, "time_stats", None)
+
+        entry = {
+            "game_id": result.game_id,
+            "date": getattr(result, "date", None),
+            "perf": getattr(result, "perf_type", "unknown"),
+            "color": color,
+            "rating": result.white_elo if color == "white" else result.black_elo,
+            "accuracy": accuracy,
+            "cpl": cpl,
+            "score": _player_score(result.result, color),
+            "blunders": counts["Blunder"],
+        }
+        self.window.append(entry)
+
+        opening = getattr(result, "opening", None) or "Unknown"
+        for bucket in (
+            self.total,
+            self.by_perf.setdefault(entry["perf"], _empty_bucket()),
+            self.by_color.setdefault(color, _empty_bucket()),
+            self.by_opening.setdefault(opening, _empty_bucket()),
+        ):
+            bucket["games"] += 1
+            bucket["score"] += entry["score"]
+            bucket["moves"] += moves
+            bucket["accuracy_sum"] += accuracy
+            bucket["cpl_sum"] += cpl
+            bucket["inaccuracies"] += counts["Inaccuracy"]
+            bucket["mistakes"] += counts["Mistake"]
+            bucket["blunders"] += counts["Blunder"]
+            if time_stats:
+                _add_clock(bucket, time_stats[color])
+        return True
+
+    def update_many(self, results) -> int:
+        return sum(self.update(r) for r in results)
+
+    # ---------- DERIVED VALUES ----------
+    @staticmethod
+    def summary(bucket) -> Optional[dict]:
+        """Averages and per-100-moves rates of one bucket."""
+        if not bucket or not bucket["games"]:
+            return None
+        games = bucket["games"]
+        moves = max(1, bucket["moves"])
+        return {
+            "games": games,
+            "score_pct": 100.0 * bucket["score"] / games,
+            "accuracy": bucket["accuracy_sum"] / games,
+            "cpl": bucket["cpl_sum"] / games,
+            "inaccuracies_per_100": 100.0 * bucket["inaccuracies"] / moves,
+            "mistakes_per_100": 100.0 * bucket["mistakes"] / moves,
+            "blunders_per_100": 100.0 * bucket["blunders"] / moves,
+            "clock": clock_summary(bucket["clock"]) if bucket.get("clock", {}).get("clocked_moves") else None,
+        }
+
+    def rolling_accuracy(self, span: int = 10):
+        """(accuracy per game, rolling mean over `span` games) for the window."""
+        values = [e["accuracy"] for e in self.window]
+        rolling = []
+        acc = 0.0
+        for i, v in enumerate(values):
+            acc += v
+            if i >= span:
+                acc -= values[i - span]
+            rolling.append(acc / min(i + 1, span))
+        return values, rolling
+
+    def recent_rating(self, perf: Optional[str] = None) -> Optional[int]:
+        """Median own rating over the window (games of one perf type if given)."""
+        ratings = sorted(
+            e["rating"] for e in self.window
+            if e.get("rating") and (perf is None or e["perf"] == perf)
+        )
+        return ratings[len(ratings) // 2] if ratings else None
+
+    def worst_openings(self, min_games: int = 3, top_n: int = 5):
+        rows = [
+            (name, self.summary(bucket))
+            for name, bucket in self.by_opening.items()
+            if bucket["games"] >= min_games
+        ]
+        rows.sort(key=lambda row: row[1]["score_pct"])
+        return rows[:top_n]
@@ -1,4 +1,5 @@
 #analyzer.py
+import io
 import chess
 import chess.pgn
 import requests
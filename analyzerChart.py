@@ -1,50 +1,194 @@
 # analyzerChart.py
 import io
+import asyncio
 import chess
 import chess.pgn
-from stockfish import Stockfish
 from lichessAPI import LichessClient
+import numpy as np
+from metrics import PHASES, batch_metrics, clock_metrics, game_metrics
+from move_codes import decode_moves, encode_moves
+from position_features import MistakePattern, ply_features
+from static_eval import screen_game
+from async_engine import EngineClient
 
 
 # ============================================================
 #   DATA MODEL
 # ============================================================
+def perf_type_from_headers(headers):
+    """'Rated Blitz game' -> 'blitz'; falls back to the TimeControl estimate."""
+    event = headers.get("Event", "").lower()
+    for perf in ("ultrabullet", "bullet", "blitz", "rapid", "classical", "correspondence"):
+        if perf in event:
+            return perf
+
+    tc = time_control(headers)
+    if tc is None:
+        return "correspondence" if headers.get("TimeControl", "-") == "-" else "unknown"
+    seconds = tc[0] + 40 * tc[1]
+    if seconds < 30:
+        return "ultrabullet"
+    if seconds < 180:
+        return "bullet"
+    if seconds < 480:
+        return "blitz"
+    if seconds < 1500:
+        return "rapid"
+    return "classical"
+
+
+def time_control(headers):
+    """'180+2' -> (180, 2) seconds; None for correspondence / unknown."""
+    tc = headers.get("TimeControl", "-")
+    if "+" not in tc:
+        return None
+    base, inc = tc.split("+", 1)
+    try:
+        return int(base), int(inc)
+    except ValueError:
+        return None
+
+
+def _elo(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return None
+
+
 class GameAnalysisResult:
-    def __init__(self, game_id, white, black, result, mistakes, cpl_list, pgn_game):
+    def __init__(self, game_id, white, black, result, mistakes, cpl_list, pgn_game=None,
+                 headers=None, move_codes=None, clocks=None):
+        """
+        The game itself is not retained: moves are kept as packed 16-bit codes
+        (move_codes.py) + optional clock array, and `pgn_game` rebuilds a
+        chess.pgn.Game only when accessed. Passing a Game still works —
+        it is converted and dropped.
+        """
         self.game_id = self._normalize_gid(game_id)
         self.white = white
         self.black = black
         self.result = result
         self.mistakes = mistakes
-        self.cpl_list = cpl_list
-        self.pgn_game = pgn_game
+        # NOTE: despite the name this holds the raw eval after every ply
+        # (white's perspective) — true per-move CPL is in self.move_cpl
+        self.cpl_list = np.asarray(cpl_list, dtype=np.int32)
+
+        if pgn_game is not None:
+            headers = dict(pgn_game.headers)
+            move_codes = encode_moves(pgn_game.mainline_moves())
+        self.headers = headers or {}
+        self.move_codes = move_codes if move_codes is not None else np.zeros(0, dtype=np.uint16)
+        self.clocks = clocks
+        self.patterns = []      # MistakePattern per flagged ply (position_features.py)
+
+        headers = self.headers
+        self.white_elo = _elo(headers.get("WhiteElo"))
+        self.black_elo = _elo(headers.get("BlackElo"))
+        self.opening = headers.get("Opening")
+        self.eco = headers.get("ECO")
+        self.date = headers.get("UTCDate", headers.get("Date"))
+        self.perf_type = perf_type_from_headers(headers)
 
         # computed fields
-        self.avg_cpl = self.calculate_avg_cpl()
+        self.apply_metrics(game_metrics(cpl_list), 0)
+        self.apply_clock_metrics()
         self.count_inacc = sum("Inaccuracy" in m for m in mistakes)
         self.count_mist = sum("Mistake" in m for m in mistakes)
         self.count_blunder = sum("Blunder" in m for m in mistakes)
-        self.accuracy = self.calculate_accuracy()
+
+    # ---------- MOVES (lazy) ----------
+    def moves(self):
+        """Iterates the mainline as chess.Move objects without building a Game."""
+        return decode_moves(self.move_codes)
+
+    @property
+    def pgn_game(self):
+        """Rebuilds the chess.pgn.Game on demand (not cached — nothing is retained)."""
+        game = chess.pgn.Game()
+        game.headers.update(self.headers)
+        if "FEN" in self.headers:
+            game.setup(self.headers["FEN"])
+
+        node = game
+        for i, move in enumerate(self.moves()):
+            node = node.add_variation(move)
+            if self.clocks is not None and i < len(self.clocks) and self.clocks[i] >= 0:
+                node.set_clock(float(self.clocks[i]))
+        return game
 
     def _normalize_gid(self, gid):
         if gid.startswith("https://"):
             gid = gid.split("/")[-1]
         return gid
 
+    def apply_metrics(self, batch, i):
+        """Takes game i of a metrics.BatchMetrics (vectorized over many games)."""
+        sl = batch.game_slice(i)
+        self.move_cpl = batch.cpl[sl]
+        self.move_accuracy = batch.accuracy[sl]
+        self.win_prob = batch.win_prob[sl]
+        self.avg_cpl = self._num(batch.avg_cpl[i])
+        self.accuracy = self._num(batch.accuracy_game[i], 100.0)
+        self.white_cpl = self._num(batch.white_cpl[i])
+        self.black_cpl = self._num(batch.black_cpl[i])
+        self.white_accuracy = self._num(batch.white_accuracy[i], 100.0)
+        self.black_accuracy = self._num(batch.black_accuracy[i], 100.0)
+        self.phase_cpl = dict(zip(PHASES, batch.phase_cpl[i].tolist()))
+        self.phase_accuracy = dict(zip(PHASES, batch.phase_accuracy[i].tolist()))
+
+    def apply_clock_metrics(self):
+        """
+        Time spent per ply + per-colour time-trouble / fast-move counters
+        (metrics.clock_metrics) from the clocks read during the analysis pass.
+        None when the game has no [%clk] comments or no time control.
+        """
+        self.time_spent = None
+        self.time_stats = None
+        tc = time_control(self.headers)
+        if self.clocks is None or tc is None:
+            return
+        clock = clock_metrics(self.clocks, self.cpl_list, *tc)
+        self.time_spent = clock.time_spent.astype(np.float32)
+        self.time_stats = clock.per_color
+
+    @staticmethod
+    def _num(value, default=0.0):
+        return default if value != value else float(value)   # NaN -> default
+
+    def color_of(self, username):
+        """'white' / 'black' / None for a player name (case-insensitive)."""
+        if self.white and self.white.lower() == username.lower():
+            return "white"
+        if self.black and self.black.lower() == username.lower():
+            return "black"
+        return None
+
+    def mistake_counts(self, color):
+        """Inaccuracy / Mistake / Blunder counts of one side (odd ply = white)."""
+        counts = {"Inaccuracy": 0, "Mistake": 0, "Blunder": 0}
+        for m in self.mistakes:
+            ply = int(m.split(".", 1)[0])
+            if (ply % 2 == 1) != (color == "white"):
+                continue
+            for kind in counts:
+                if kind in m:
+                    counts[kind] += 1
+        return counts
+
     def calculate_avg_cpl(self):
-        if not self.cpl_list:
-            return 0
-        return sum(abs(cp) for cp in self.cpl_list) / len(self.cpl_list)
+        """Average true centipawn loss of both sides (see metrics.py)."""
+        return self.avg_cpl
 
     def calculate_accuracy(self):
-        # simple but surprisingly stable model:
-        return max(0, min(100, 100 - (self.avg_cpl / 30)))
+        """Lichess-style accuracy: mean of per-move accuracies from win% drops."""
+        return self.accuracy
 
     def __str__(self):
         header = f"Game {self.game_id} — {self.white} vs {self.black} — Result: {self.result}"
         stats = (
             f"    Average CPL: {self.avg_cpl:.1f}\n"
-            f"    Accuracy: {self.accuracy:.1f}%\n"
+            f"    Accuracy: {self.accuracy:.1f}% (white {self.white_accuracy:.1f}%, black {self.black_accuracy:.1f}%)\n"
             f"    Inaccuracies: {self.count_inacc}\n"
             f"    Mistakes: {self.count_mist}\n"
             f"    Blunders: {self.count_blunder}\n"
@@ -57,13 +201,24 @@ class GameAnalysisResult:
 #   GAME ANALYZER
 # ============================================================
 class GameAnalyzer:
-    def __init__(self, stockfish_path="stockfish.exe"):
-        self.stockfish = Stockfish(stockfish_path)
-        self.stockfish.update_engine_parameters({
-            "Threads": 4,
-            "Minimum Thinking Time": 30,
-            "Skill Level": 20
-        })
+    ENGINE_OPTIONS = {"Threads": 4, "Minimum Thinking Time": 30, "Skill Level": 20}
+
+    def __init__(self, stockfish_path="stockfish.exe", engine=None, depth=15, priority="interactive",
+                 screen=False):
+        """
+        engine: shared async_engine.EngineClient (e.g. one pool for all watch
+        workers); by default a single-engine client is started here.
+        priority: scheduler class of this analyzer's games (interactive / watch / bulk).
+        screen: only plies the static evaluator (static_eval.py) does not
+        consider quiet go to the engine; quiet plies get the last engine eval
+        + the static eval change and are never flagged.
+        """
+        self.engine = engine or EngineClient(stockfish_path, size=1, depth=depth,
+                                             options=self.ENGINE_OPTIONS)
+        self.priority = priority
+        self.screen = screen
+        self._game = None
+        self._last = None
 
     # ---------- CLASSIFY MISTAKE ----------
     def classify_mistake(self, cp_before, cp_after):
@@ -78,16 +233,21 @@ class GameAnalyzer:
         return "Blunder"
 
     # ---------- SAFE EVAL ----------
-    def eval_position(self, board):
-        """Safe evaluation with mate fallback."""
-        self.stockfish.set_fen_position(board.fen())
-        raw = self.stockfish.get_evaluation()
+    def eval_position(self, board, keep_hash=False):
+        """
+        Eval (cp, white's perspective, mate => ±10000) of a single position.
+        keep_hash=True searches it as part of the previous game (no
+        'ucinewgame'), so the transposition table of the last search is reused.
+        """
+        if not keep_hash or self._game is None:
+            self._game = self.engine.new_game_key()
+        self._last = self.engine.evaluate(board, game=self._game, priority=self.priority)
+        return self._last.cp
 
-        if raw["type"] == "cp":
-            return raw["value"]
-        else:
-            # Mate in X => convert to big cp
-            return -10000 if raw["value"] < 0 else 10000
+    # ---------- REFUTATION ----------
+    def best_reply(self):
+        """Engine's best move in the position last evaluated (UCI), "" if none."""
+        return self._last.best_move if self._last is not None else ""
 
     # ---------- SAFE SAN ----------
     def safe_san(self, board, move):
@@ -98,7 +258,25 @@ class GameAnalyzer:
             return move.uci()
 
     # ---------- ANALYZE FULL GAME ----------
-    def analyze_game(self, pgn_text):
+    def analyze_game(self, pgn_text, patterns=True, timeout=None, user=None):
+        """
+        Blocking wrapper around analyze_game_async (runs on the engine loop).
+        timeout (s): the whole game is cancelled after it -> TimeoutError.
+        """
+        return self.engine.run(self.analyze_game_async(pgn_text, patterns, user), timeout)
+
+    async def analyze_game_async(self, pgn_text, patterns=True, user=None):
+        """
+        One engine is leased for the whole game under the game's key:
+        'ucinewgame' is sent once and every ply goes out as
+        "position startpos moves ...", so the hash stays warm.
+        patterns=True: flagged plies also get their position features; the
+        refutation is the first move of the PV of the search that flagged them.
+        [%clk] comments are read in the same walk over the mainline.
+        Non-interactive games may hand their engine to a more urgent job
+        between plies (scheduler.py); user= is the fairness key.
+        With screen=True quiet plies skip the engine (static_eval.screen_game).
+        """
         game = chess.pgn.read_game(io.StringIO(pgn_text))
         board = game.board()
 
@@ -110,49 +288,220 @@ class GameAnalyzer:
         mistakes = []
         prev_eval = 0
         cpl_list = []
+        clocks = []
+        flagged = []
 
-        for idx, move in enumerate(game.mainline_moves(), start=1):
-            san_before = self.safe_san(board, move)
-            board.push(move)
+        search = None
+        if self.screen:
+            search, static = screen_game(list(game.mainline_moves()), board)
+            anchor_cp, anchor_static = prev_eval, static[0]
 
-            cp = self.eval_position(board)
-            cpl_list.append(cp)
+        async with self.engine.pool.lease(game_id, self.priority, user) as engine:
+            for idx, node in enumerate(game.mainline(), start=1):
+                move = node.move
+                clock = node.clock()
+                clocks.append(-1.0 if clock is None else clock)
+                san_before = self.safe_san(board, move)
+                board_before = board.copy(stack=False) if patterns else None
+                board.push(move)
 
-            delta = cp - prev_eval
-            mistake_type = self.classify_mistake(prev_eval, cp)
+                if search is not None and not search[idx - 1]:
+                    # quiet ply: last engine eval moved by the static change, not classified
+                    cp = int(round(anchor_cp + static[idx] - anchor_static))
+                    cpl_list.append(cp)
+                    prev_eval = cp
+                    continue
 
-            if mistake_type:
-                mistakes.append(f"{idx}. {san_before} — {mistake_type} (Δ = {delta})")
+                info = await engine.evaluate(board)
+                cp = info.cp
+                cpl_list.append(cp)
+                if search is not None:
+                    anchor_cp, anchor_static = cp, static[idx]
 
-            prev_eval = cp
+                # classify from the mover's perspective (odd idx = white moved)
+                if idx % 2 == 1:
+                    delta = cp - prev_eval
+                    mistake_type = self.classify_mistake(prev_eval, cp)
+                else:
+                    delta = prev_eval - cp
+                    mistake_type = self.classify_mistake(-prev_eval, -cp)
 
-        return GameAnalysisResult(
+                if mistake_type:
+                    mistakes.append(f"{idx}. {san_before} — {mistake_type} (Δ = {delta})")
+                    if patterns:
+                        refutation = info.best_move
+                        vector, tags = ply_features(board_before, move, refutation)
+                        flagged.append(MistakePattern(
+                            idx, san_before, board_before.fen(), move.uci(), delta,
+                            mistake_type, refutation, vector, tags, " ".join(info.pv),
+                        ))
+
+                prev_eval = cp
+                await engine.checkpoint()
+
+        analysis = GameAnalysisResult(
             game_id=game_id,
             white=white,
             black=black,
             result=result,
             mistakes=mistakes,
             cpl_list=cpl_list,
-            pgn_game=game
+            pgn_game=game,
+            clocks=np.asarray(clocks, dtype=np.float32) if any(c >= 0 for c in clocks) else None,
         )
+        analysis.patterns = flagged
+        return analysis
+
+
+async def analyze_games_async(analyzer, pgns, on_result=None, on_progress=None, user=None):
+    """
+    Analyses many games concurrently on the analyzer's engine pool (one game
+    per engine at a time). on_result(result) fires as each game finishes,
+    on_progress(done, total) after it; results come back in input order.
+    """
+    done = 0
+
+    async def one(pgn):
+        nonlocal done
+        result = await analyzer.analyze_game_async(pgn, user=user)
+        done += 1
+        if on_result is not None:
+            on_result(result)
+        if on_progress is not None:
+            on_progress(done, len(pgns))
+        return result
+
+    return await asyncio.gather(*(one(pgn) for pgn in pgns))
+
+
+def sampling_units(pgns, usernames):
+    """
+    (units, strata) for sampling.SamplingPlan: one (game index, colour) unit
+    per side played by one of `usernames`, stratified by (perf type, colour).
+    Only the headers are parsed.
+    """
+    names = {u.lower() for u in usernames}
+    units, strata = [], []
+    for i, pgn in enumerate(pgns):
+        headers = chess.pgn.read_headers(io.StringIO(pgn))
+        if headers is None:
+            continue
+        perf = perf_type_from_headers(headers)
+        for color in ("white", "black"):
+            if headers.get(color.capitalize(), "").lower() in names:
+                units.append((i, color))
+                strata.append((perf, color))
+    return units, strata
+
+
+async def sample_games_async(analyzer, pgns, plan, usernames, on_result=None, on_progress=None, user=None):
+    """
+    Approximate mode of analyze_games_async: analyses games drawn by a
+    sampling.SamplingPlan until its target precision is reached, keeping
+    every engine of the pool busy. Returns the analysed games' results (same
+    schema as a full run); the estimates are in `plan`.
+    """
+    from baselines import result_sample
+
+    units, strata = sampling_units(pgns, usernames)
+    plan.set_population(units, strata)
+    games = {}                  # game index -> task (a game with two cohort members is analysed once)
+    results = []
+
+    async def analysed(i):
+        result = await analyzer.analyze_game_async(pgns[i], user=user)
+        results.append(result)
+        if on_result is not None:
+            on_result(result)
+        return result
+
+    async def worker():
+        while True:
+            unit = plan.next_unit()
+            if unit is None:
+                return
+            i, color = unit
+            if i not in games:
+                games[i] = asyncio.ensure_future(analysed(i))
+            plan.add(unit, result_sample(await games[i], color))
+            if on_progress is not None:
+                on_progress(plan)
+
+    await asyncio.gather(*(worker() for _ in range(analyzer.engine.pool.size)))
+    return results
 
 
 # ============================================================
 #   FETCH + ANALYZE USER GAMES
 # ============================================================
-def analyze_latest_games(username="bielbart77", max_games=5, perf_type="rapid"):
+def analyze_latest_games(username="bielbart77", max_games=5, perf_type="rapid", on_result=None,
+                         engines=1, stockfish_path="stockfish.exe", sampling=None, screen=False):
+    """
+    on_result(result) is called as soon as each game is analysed (e.g. ResultsWriter.write).
+    engines > 1 analyses that many games at once, one Stockfish process each.
+    sampling: a sampling.SamplingPlan — the max_games fetched games are the
+    population, and only a stratified random sample of them is analysed.
+    screen: quiet plies skip the engine (GameAnalyzer screen=True).
+    """
+    client = LichessClient()
+    analyzer = GameAnalyzer(stockfish_path, engine=EngineClient(
+        stockfish_path, size=engines, options=GameAnalyzer.ENGINE_OPTIONS), priority="bulk", screen=screen)
+
+    async def pipeline():
+        # the download runs in a thread so the engine loop stays responsive
+        games = await asyncio.to_thread(
+            client.get_user_games, username=username, max_games=max_games, perf_type=perf_type
+        )
+        pgns = [g.pgn for g in games]
+        if sampling is not None:
+            return await sample_games_async(analyzer, pgns, sampling, [username], on_result,
+                                            _print_sampling_progress, user=username)
+        return await analyze_games_async(analyzer, pgns, on_result, user=username)
+
+    try:
+        return analyzer.engine.run(pipeline())
+    finally:
+        analyzer.engine.close()
+
+
+def analyze_cohort_games(usernames, plan, max_games=500, perf_type=None, since=None, on_result=None,
+                         engines=1, stockfish_path="stockfish.exe", screen=False):
+    """
+    Sampled analysis over the games of several players (a club, a team):
+    up to max_games per player (created at/after `since`, ms) form the
+    population, games between two members count for both of them.
+    Returns the analysed results; the estimates are in `plan`.
+    """
     client = LichessClient()
-    analyzer = GameAnalyzer()
+    analyzer = GameAnalyzer(stockfish_path, engine=EngineClient(
+        stockfish_path, size=engines, options=GameAnalyzer.ENGINE_OPTIONS), priority="bulk", screen=screen)
 
-    games = client.get_user_games(
-        username=username,
-        max_games=max_games,
-        perf_type=perf_type
-    )
+    def fetch_all():
+        games = {}
+        for name in usernames:
+            for g in client.get_user_games(username=name, max_games=max_games, perf_type=perf_type, since=since):
+                games.setdefault(g.game_id, g)
+        return [g.pgn for g in games.values()]
 
-    results = []
-    for g in games:
-        result = analyzer.analyze_game(g.pgn)
-        results.append(result)
+    async def pipeline():
+        pgns = await asyncio.to_thread(fetch_all)
+        print(f"[INFO] {len(pgns)} games of {len(usernames)} player(s) — sampling to ± {plan.precision} {plan.metric}")
+        return await sample_games_async(analyzer, pgns, plan, usernames, on_result, _print_sampling_progress)
 
-    return results
+    try:
+        return analyzer.engine.run(pipeline())
+    finally:
+        analyzer.engine.close()
+
+
+def _print_sampling_progress(plan):
+    if plan.analysed() % 10 == 0:
+        print(f"[INFO] {plan.analysed()}/{plan.population} sampled — {plan.estimate(plan.metric)}")
+
+
+def apply_batch_metrics(results):
+    """Recomputes the metrics of many results in one vectorized pass."""
+    batch = batch_metrics([r.cpl_list for r in results])
+    for i, r in enumerate(results):
+        r.apply_metrics(batch, i)
+    return batch
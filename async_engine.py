@@ -0,0 +1,282 @@
+# async_engine.py
+"""
+asyncio engine layer on python-chess (chess.engine.popen_uci).
+
+EnginePool — N Stockfish processes driven by one event loop:
+
+    async with EnginePool("stockfish", size=4, depth=15) as pool:
+        result = await pool.evaluate(board, game="abc123", timeout=10)
+        async for partial in pool.stream(board, game="abc123"):
+            print(partial.depth, partial.cp)          # progressive info lines
+
+  - `game=` key: python-chess sends `ucinewgame` only when the key changes
+    and feeds `position startpos moves ...` from board.move_stack, so the
+    hash stays warm across the plies of a game (bench_engine_hash.py); the
+    pool prefers the engine that last searched the same game
+  - `lease(game)` keeps one engine for a whole game
+  - timeouts / cancellation stop the search (`stop`), a crashed engine is
+    restarted on the next acquire
+  - `priority=` / `user=`: engines are handed out by scheduler.SlotScheduler
+    (interactive > watch > bulk, fair between users); watch / bulk games
+    yield their engine at ply boundaries (`checkpoint()`) to more urgent
+    jobs and pause while another process runs an interactive job
+
+EngineClient — blocking facade for synchronous code (GameAnalyzer,
+LLMChessAnalyzer, worker threads): the pool lives on a background event
+loop thread, calls are thread-safe.
+"""
+import asyncio
+import concurrent.futures
+import itertools
+import threading
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import chess
+import chess.engine
+
+from scheduler import SlotScheduler, interactive_elsewhere, wait_for_interactive
+
+
+MATE_SCORE = 10000           # mate in X -> ±10000 cp, as everywhere in the analyzers
+DEFAULT_DEPTH = 15
+
+
+@dataclass
+class EngineResult:
+    cp: int                          # white's perspective, mates as ±MATE_SCORE
+    mate: Optional[int] = None       # mate in N from white's perspective (None = no mate)
+    depth: int = 0
+    pv: List[str] = field(default_factory=list)    # UCI
+    nodes: int = 0
+
+    @property
+    def best_move(self) -> str:
+        return self.pv[0] if self.pv else ""
+
+    @property
+    def raw(self) -> dict:
+        """Same shape as stockfish.Stockfish.get_evaluation() (a finished mate is ±MATE_SCORE cp)."""
+        if self.mate:
+            return {"type": "mate", "value": self.mate}
+        return {"type": "cp", "value": self.cp}
+
+
+def result_from_info(info: dict) -> EngineResult:
+    score = info.get("score")
+    cp, mate = 0, None
+    if score is not None:
+        white = score.white()
+        mate = white.mate()
+        if mate is None:
+            cp = white.score()
+        else:
+            cp = MATE_SCORE if mate > 0 else -MATE_SCORE
+    return EngineResult(
+        cp=cp,
+        mate=mate,
+        depth=info.get("depth", 0),
+        pv=[m.uci() for m in info.get("pv", [])],
+        nodes=info.get("nodes", 0),
+    )
+
+
+def terminal_result(board: chess.Board) -> Optional[EngineResult]:
+    """Game over positions are scored without asking the engine."""
+    if board.is_checkmate():
+        return EngineResult(cp=-MATE_SCORE if board.turn == chess.WHITE else MATE_SCORE, mate=0)
+    if board.is_game_over(claim_draw=False):
+        return EngineResult(cp=0)
+    return None
+
+
+# ============================================================
+#   ASYNC POOL
+# ============================================================
+class EnginePool:
+    def __init__(self, path: str = "stockfish.exe", size: int = 1, depth: int = DEFAULT_DEPTH,
+                 options: Optional[dict] = None):
+        self.path = path
+        self.size = size
+        self.limit = chess.engine.Limit(depth=depth)
+        self.options = options or {}
+        self._idle = []
+        self._last_game = {}              # id(engine) -> last game key
+        self._slots = None
+        self._fresh = itertools.count()
+
+    # ---------- LIFECYCLE ----------
+    async def start(self):
+        self._slots = SlotScheduler(self.size)
+        engines = await asyncio.gather(*(self._spawn() for _ in range(self.size)))
+        self._idle.extend(engines)
+        return self
+
+    async def _spawn(self):
+        _, engine = await chess.engine.popen_uci(self.path)
+        # options unknown to this engine build (e.g. "Minimum Thinking Time") are skipped
+        await engine.configure({k: v for k, v in self.options.items() if k in engine.options})
+        return engine
+
+    async def close(self):
+        engines, self._idle = self._idle, []
+        await asyncio.gather(*(e.quit() for e in engines), return_exceptions=True)
+
+    async def __aenter__(self):
+        return await self.start()
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    # ---------- ENGINE CHECKOUT ----------
+    async def _acquire(self, game, priority, user):
+        await wait_for_interactive(priority)
+        await self._slots.acquire(priority, user)
+        # a granted slot means an idle engine — prefer the one that searched this game last
+        for i, engine in enumerate(self._idle):
+            if game is not None and self._last_game.get(id(engine)) == game:
+                return self._idle.pop(i)
+        return self._idle.pop(0)
+
+    async def _release(self, engine, game, user, broken=False):
+        try:
+            if broken:
+                try:
+                    await engine.quit()
+                except Exception:
+                    pass
+                engine = await self._spawn()
+            self._last_game[id(engine)] = game
+            self._idle.append(engine)
+        finally:
+            self._slots.release(user)
+
+    @asynccontextmanager
+    async def lease(self, game=None, priority: str = "interactive", user=None):
+        """One engine for a block of searches (e.g. a whole game)."""
+        lease = _Lease(self, await self._acquire(game, priority, user), game, priority, user)
+        broken = False
+        try:
+            yield lease
+        except chess.engine.EngineTerminatedError:
+            broken = True
+            raise
+        finally:
+            if lease.engine is not None:      # None: cancelled while re-queued in checkpoint()
+                await self._release(lease.engine, game, user, broken)
+
+    # ---------- SEARCH ----------
+    async def evaluate(self, board: chess.Board, limit: Optional[chess.engine.Limit] = None,
+                       game=None, timeout: Optional[float] = None,
+                       priority: str = "interactive", user=None) -> EngineResult:
+        async with self.lease(game, priority, user) as engine:
+            return await engine.evaluate(board, limit, timeout)
+
+    async def candidates(self, board: chess.Board, n: int = 2, limit: Optional[chess.engine.Limit] = None,
+                         game=None, priority: str = "interactive", user=None) -> List[EngineResult]:
+        async with self.lease(game, priority, user) as engine:
+            return await engine.candidates(board, n, limit)
+
+    async def stream(self, board: chess.Board, limit: Optional[chess.engine.Limit] = None, game=None,
+                     priority: str = "interactive", user=None):
+        """Yields an EngineResult for every info line with a score (deeper and deeper)."""
+        async with self.lease(game, priority, user) as engine:
+            async for result in engine.stream(board, limit):
+                yield result
+
+    def new_game_key(self):
+        """Key that differs from every previous one -> forces `ucinewgame`."""
+        return ("fresh", next(self._fresh))
+
+
+class _Lease:
+    def __init__(self, pool, engine, game, priority, user):
+        self.pool = pool
+        self.engine = engine
+        self.game = game
+        self.priority = priority
+        self.user = user
+
+    async def checkpoint(self):
+        """
+        Ply boundary of a watch / bulk game: if a more urgent job waits (here
+        or in another process), hand the engine over and queue again.
+        """
+        if self.priority == "interactive":
+            return
+        pool = self.pool
+        if pool._slots.waiting_above(self.priority) or interactive_elsewhere():
+            # the lease owns no engine until the new one is granted, so a cancel while
+            # queued must not release the handed-over engine a second time
+            engine, self.engine = self.engine, None
+            await pool._release(engine, self.game, self.user)
+            self.engine = await pool._acquire(self.game, self.priority, self.user)
+
+    async def evaluate(self, board, limit=None, timeout=None) -> EngineResult:
+        done = terminal_result(board)
+        if done is not None:
+            return done
+        search = self.engine.analyse(board, limit or self.pool.limit, game=self.game)
+        # on timeout / cancellation python-chess sends `stop` and waits for bestmove
+        info = await asyncio.wait_for(search, timeout) if timeout else await search
+        return result_from_info(info)
+
+    async def candidates(self, board, n=2, limit=None) -> List[EngineResult]:
+        """Best `n` moves (multipv), best first; [] in a finished game."""
+        if terminal_result(board) is not None:
+            return []
+        infos = await self.engine.analyse(board, limit or self.pool.limit, multipv=n, game=self.game)
+        return [result_from_info(info) for info in infos if "score" in info]
+
+    async def stream(self, board, limit=None):
+        done = terminal_result(board)
+        if done is not None:
+            yield done
+            return
+        with await self.engine.analysis(board, limit or self.pool.limit, game=self.game) as analysis:
+            async for info in analysis:
+                if "score" in info:
+                    yield result_from_info(info)
+
+
+# ============================================================
+#   BLOCKING FACADE
+# ============================================================
+class EngineClient:
+    """EnginePool on a background event loop, callable from any thread."""
+
+    def __init__(self, path: str = "stockfish.exe", size: int = 1, depth: int = DEFAULT_DEPTH,
+                 options: Optional[dict] = None):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="engine-loop", daemon=True)
+        self._thread.start()
+        self.pool = EnginePool(path, size, depth, options)
+        self.run(self.pool.start())
+
+    def run(self, coro, timeout: Optional[float] = None):
+        """
+        Runs a coroutine on the engine loop and waits for its result. On
+        timeout the coroutine is cancelled (running searches get `stop`) and
+        TimeoutError is raised.
+        """
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise TimeoutError(f"engine call did not finish within {timeout}s")
+
+    def evaluate(self, board: chess.Board, game=None, depth: Optional[int] = None,
+                 timeout: Optional[float] = None, priority: str = "interactive", user=None) -> EngineResult:
+        limit = chess.engine.Limit(depth=depth) if depth else None
+        # the loop thread reads the board while we wait — pass a copy anyway
+        return self.run(self.pool.evaluate(board.copy(), limit, game, timeout, priority, user))
+
+    def new_game_key(self):
+        return self.pool.new_game_key()
+
+    def close(self):
+        self.run(self.pool.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
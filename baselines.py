@@ -0,0 +1,572 @@
+# baselines.py
+"""
+Rating-band baselines: how do accuracy, CPL and mistake rates spread among
+players of a given rating in a given time control?
+
+The builder goes through local PGN corpora (Lichess database dumps
+.pgn / .pgn.gz / .pgn.zst, or any collection of PGNs) and records one
+sample per side of every sampled game:
+
+    accuracy, cpl, inaccuracies_per_100, mistakes_per_100, blunders_per_100
+
+(same definitions as GameAnalysisResult / aggregates.summary). Samples go
+into fixed-bin histograms
+
+    hist[metric][band, perf, bin]      bands: BAND_EDGES, perfs: PERFS
+
+which makes the table small (a few hundred KB for any corpus size) and
+mergeable, so later runs on more files add to it. Percentiles are read off
+the cumulative histogram, which takes microseconds. State lives in
+data/baselines.npz.
+
+Cost control for large corpora:
+  - sampling: a game is kept if crc32(Site) falls under `sample_rate`, so
+    the same games are picked on every run. Each rating band / perf cell
+    stops at `max_per_cell` samples. Rejected games are skipped after their
+    headers, so their moves are never parsed.
+  - games with [%eval] on every ply (Lichess dumps, analysed games) need
+    no engine at all
+  - the others are searched on an async_engine pool (bulk priority, one
+    game per engine, `engines` games at a time) while the file is parsed
+    further. Every position goes through eval_cache.EvalCache first, so
+    opening positions shared by thousands of games are searched only once.
+  - without engines, PGN parsing is the whole cost: `processes` workers
+    sample files in parallel (plain .pgn files are also cut into byte
+    ranges at game boundaries) into tables of their own, which are merged.
+"""
+import asyncio
+import concurrent.futures
+import gzip
+import io
+import os
+import zlib
+from collections import deque
+from typing import Optional
+
+import numpy as np
+
+from explanation_cache import normalize_fen
+from metrics import INITIAL_EVAL, batch_metrics, classify_deltas, mover_deltas
+
+
+BASELINES_PATH = "data/baselines.npz"
+
+# band i = ratings in [BAND_EDGES[i-1], BAND_EDGES[i]); first / last band open-ended
+BAND_EDGES = np.arange(800, 2800, 200)
+PERFS = ("ultrabullet", "bullet", "blitz", "rapid", "classical", "correspondence", "unknown")
+
+# metric -> (bin edges, lower is better). Rates start half a bin below 0 so the
+# many games without a blunder sit in the middle of a bin (ties count half)
+_RATE_EDGES = np.arange(-0.25, 60, 0.5)
+METRICS = {
+    "accuracy": (np.linspace(0, 100, 201), False),
+    "cpl": (np.linspace(0, 400, 401), True),
+    "inaccuracies_per_100": (_RATE_EDGES, True),
+    "mistakes_per_100": (_RATE_EDGES, True),
+    "blunders_per_100": (_RATE_EDGES, True),
+}
+
+MIN_PLIES = 20                # shorter games (aborted / early resignations) are not sampled
+MIN_RANGE_BYTES = 64 << 20    # plain .pgn files are split across processes in ranges at least this big
+MIN_SAMPLES = 200             # fewer samples in a cell -> fall back to the whole band
+METRICS_BATCH = 2000          # games per vectorized metrics pass
+
+
+def band_of(rating) -> int:
+    return int(np.searchsorted(BAND_EDGES, rating, side="right"))
+
+
+def band_label(band: int) -> str:
+    if band == 0:
+        return f"<{BAND_EDGES[0]}"
+    if band == len(BAND_EDGES):
+        return f"{BAND_EDGES[-1]}+"
+    return f"{BAND_EDGES[band - 1]}-{BAND_EDGES[band] - 1}"
+
+
+def _perf_index(perf) -> int:
+    return PERFS.index(perf) if perf in PERFS else PERFS.index("unknown")
+
+
+def _bin_index(metric, values):
+    edges = METRICS[metric][0]
+    return np.clip(np.searchsorted(edges, values, side="right") - 1, 0, len(edges) - 2)
+
+
+def result_sample(result, color) -> dict:
+    """Baseline metrics of one side of a GameAnalysisResult."""
+    moves = max(1, (len(result.cpl_list) + (color == "white")) // 2)
+    counts = result.mistake_counts(color)
+    return {
+        "accuracy": result.white_accuracy if color == "white" else result.black_accuracy,
+        "cpl": result.white_cpl if color == "white" else result.black_cpl,
+        "inaccuracies_per_100": 100.0 * counts["Inaccuracy"] / moves,
+        "mistakes_per_100": 100.0 * counts["Mistake"] / moves,
+        "blunders_per_100": 100.0 * counts["Blunder"] / moves,
+    }
+
+
+# ============================================================
+#   BASELINE TABLE
+# ============================================================
+class Baselines:
+    def __init__(self, path: str = BASELINES_PATH):
+        self.path = path
+        shape = (len(BAND_EDGES) + 1, len(PERFS))
+        self.hist = {m: np.zeros(shape + (len(edges) - 1,), dtype=np.uint32) for m, (edges, _) in METRICS.items()}
+        self.seen = set()         # crc32 of the Site tag of every sampled game
+
+    # ---------- PERSISTENCE ----------
+    @classmethod
+    def load(cls, path: str = BASELINES_PATH):
+        table = cls(path)
+        if os.path.exists(path):
+            with np.load(path) as state:
+                for metric in METRICS:
+                    if f"hist_{metric}" in state:
+                        table.hist[metric] = state[f"hist_{metric}"]
+                table.seen = set(state["seen"].tolist())
+        return table
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp = self.path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            seen=np.array(sorted(self.seen), dtype=np.uint32),
+            **{f"hist_{m}": h for m, h in self.hist.items()},
+        )
+        os.replace(tmp, self.path)
+
+    # ---------- UPDATE ----------
+    def add_samples(self, bands, perfs, values: dict):
+        """bands / perfs: per-sample indices; values: metric -> per-sample array."""
+        for metric, hist in self.hist.items():
+            v = np.asarray(values[metric], dtype=np.float64)
+            ok = ~np.isnan(v)
+            np.add.at(hist, (bands[ok], perfs[ok], _bin_index(metric, v[ok])), 1)
+
+    def merge(self, other: "Baselines"):
+        """Adds the samples of another table (histograms are plain counts)."""
+        for metric, hist in self.hist.items():
+            hist += other.hist[metric]
+        self.seen |= other.seen
+
+    def cell_count(self, band: int, perf: Optional[str] = None) -> int:
+        h = self.hist["accuracy"][band]
+        return int(h.sum() if perf is None else h[_perf_index(perf)].sum())
+
+    def __len__(self):
+        return int(self.hist["accuracy"].sum())
+
+    # ---------- QUERIES ----------
+    def _cdf(self, metric, rating, perf):
+        """(bin edges, cumulative share at each edge) of the cell; None if too thin."""
+        band = band_of(rating)
+        h = self.hist[metric][band]
+        if perf is not None and h[_perf_index(perf)].sum() >= MIN_SAMPLES:
+            h = h[_perf_index(perf)]
+        else:
+            h = h.sum(axis=0)       # not enough games of this perf type: whole band
+        total = h.sum()
+        if total < MIN_SAMPLES:
+            return None
+        cdf = np.concatenate(([0.0], np.cumsum(h, dtype=np.float64))) / total
+        return METRICS[metric][0], cdf
+
+    def percentile(self, metric: str, value: float, rating: int, perf: Optional[str] = None) -> Optional[float]:
+        """Share (0..100) of sampled sides of this band / perf with a lower value; None without data."""
+        cell = self._cdf(metric, rating, perf)
+        if cell is None or value is None or value != value:
+            return None
+        edges, cdf = cell
+        return 100.0 * float(np.interp(value, edges, cdf))
+
+    def better_than(self, metric: str, value: float, rating: int, perf: Optional[str] = None) -> Optional[float]:
+        """Share of the band this value beats (lower CPL / mistake rates are better)."""
+        pct = self.percentile(metric, value, rating, perf)
+        if pct is None or not METRICS[metric][1]:
+            return pct
+        return 100.0 - pct
+
+    def quantiles(self, metric: str, rating: int, perf: Optional[str] = None, qs=(25, 50, 75)):
+        """Values at the given percentiles of the cell; None without data."""
+        cell = self._cdf(metric, rating, perf)
+        if cell is None:
+            return None
+        edges, cdf = cell
+        return [float(np.interp(q / 100.0, cdf, edges)) for q in qs]
+
+
+# ============================================================
+#   PGN INPUT
+# ============================================================
+def open_pgn(path: str):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding="utf-8", errors="replace")
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise RuntimeError("Reading .zst dumps needs the zstandard package (pip install zstandard)")
+        raw = zstandard.ZstdDecompressor().stream_reader(open(path, "rb"), closefd=True)
+        return io.TextIOWrapper(raw, encoding="utf-8", errors="replace")
+    return open(path, encoding="utf-8", errors="replace")
+
+
+class _RangeReader(io.RawIOBase):
+    """Raw reader over bytes [start, end) of a file."""
+
+    def __init__(self, path, start, end):
+        self._f = open(path, "rb")
+        self._f.seek(start)
+        self._left = end - start
+
+    def readable(self):
+        return True
+
+    def readinto(self, b):
+        data = self._f.read(min(len(b), self._left))
+        b[:len(data)] = data
+        self._left -= len(data)
+        return len(data)
+
+    def close(self):
+        self._f.close()
+        super().close()
+
+
+def _game_start_at(path, offset) -> int:
+    """Offset of the first `[Event ` line at or after `offset` (file size if none)."""
+    with open(path, "rb") as f:
+        if offset == 0:
+            return 0
+        f.seek(offset - 1)
+        f.readline()                            # rest of the line `offset` falls into
+        while True:
+            pos = f.tell()
+            line = f.readline()
+            if not line or line.startswith(b"[Event "):
+                return pos
+
+
+def open_pgn_range(path: str, start: int, end: int):
+    """Text stream over the games of a plain .pgn file that start in [start, end)."""
+    start, end = _game_start_at(path, start), _game_start_at(path, end)
+    return io.TextIOWrapper(io.BufferedReader(_RangeReader(path, start, end)), encoding="utf-8", errors="replace")
+
+
+def _split_files(paths, processes):
+    """(path, byte range or None) jobs: plain .pgn files in ranges, compressed files whole."""
+    jobs = []
+    for path in paths:
+        if path.endswith((".gz", ".zst")):
+            jobs.append((path, None))           # no random access into the compressed stream
+            continue
+        size = os.path.getsize(path)
+        step = max(MIN_RANGE_BYTES, -(-size // processes))
+        jobs.extend((path, (start, min(start + step, size))) for start in range(0, size, step))
+    return jobs
+
+
+def _site_hash(headers) -> int:
+    key = headers.get("Site") or "|".join(headers.get(k, "") for k in ("White", "Black", "Date", "UTCTime", "Round"))
+    return zlib.crc32(key.encode("utf-8"))
+
+
+_SKIPPED = object()
+
+
+def _sampled_builder(accept):
+    import chess.pgn
+
+    class SampledGameBuilder(chess.pgn.GameBuilder):
+        """GameBuilder that stops after the headers of games `accept` rejects."""
+
+        def begin_game(self):
+            super().begin_game()
+            self.skipped = False
+
+        def end_headers(self):
+            if not accept(self.game.headers):
+                self.skipped = True
+                return chess.pgn.SKIP
+            return None
+
+        def result(self):
+            return _SKIPPED if self.skipped else self.game
+
+    return SampledGameBuilder
+
+
+def _embedded_evals(game):
+    """Per-ply evals from [%eval] comments (white's perspective); None if any ply lacks one."""
+    from async_engine import result_from_info, terminal_result
+
+    evals = []
+    for node in game.mainline():
+        score = node.eval()
+        if score is None:
+            if node.is_end() and terminal_result(node.board()) is not None:
+                evals.append(terminal_result(node.board()).cp)   # mate / stalemate: no comment in dumps
+                continue
+            return None
+        evals.append(result_from_info({"score": score}).cp)
+    return evals
+
+
+# ============================================================
+#   BUILDER
+# ============================================================
+async def _search_missing(pool, moves, missing, priority):
+    """Engine evals after the plies in `missing` (indices), one engine for the whole game."""
+    import chess
+
+    board = chess.Board()
+    found = {}
+    async with pool.lease(pool.new_game_key(), priority) as engine:
+        for i, move in enumerate(moves):
+            board.push(move)
+            if i in missing:
+                found[i] = (await engine.evaluate(board)).cp    # game over positions skip the engine
+                await engine.checkpoint()
+    return found
+
+
+class BaselineBuilder:
+    """Feeds sampled games of PGN files into a Baselines table."""
+
+    def __init__(self, table: Baselines, sample_rate: float = 0.1, max_per_cell: int = 20000,
+                 client=None, cache=None, depth: int = 12, priority: str = "bulk"):
+        from analyzerChart import perf_type_from_headers
+
+        self.table = table
+        self.sample_rate = sample_rate
+        self.max_per_cell = max_per_cell
+        self.client = client          # async_engine.EngineClient, None = embedded evals only
+        self.cache = cache            # eval_cache.EvalCache
+        self.depth = depth
+        self.priority = priority
+        self._perf_of = perf_type_from_headers
+        self._cell_counts = table.hist["accuracy"].sum(axis=2).astype(np.int64)
+        self._pending_games = []      # (evals, white band, black band, perf) waiting for a metrics pass
+        self.added = 0
+        self.skipped_no_evals = 0
+
+    # ---------- SAMPLING ----------
+    def _accept(self, headers) -> bool:
+        h = _site_hash(headers)
+        if h / 2 ** 32 >= self.sample_rate or h in self.table.seen:
+            return False
+        if headers.get("Variant", "Standard") != "Standard" or "FEN" in headers:
+            return False
+        if "rated" not in headers.get("Event", "rated").lower():
+            return False
+        try:
+            elos = int(headers["WhiteElo"]), int(headers["BlackElo"])
+        except (KeyError, ValueError):
+            return False
+        perf = _perf_index(self._perf_of(headers))
+        return any(self._cell_counts[band_of(e), perf] < self.max_per_cell for e in elos)
+
+    def _queue(self, game, evals):
+        headers = game.headers
+        if len(evals) < MIN_PLIES:
+            return
+        self.table.seen.add(_site_hash(headers))
+        perf = _perf_index(self._perf_of(headers))
+        bands = band_of(int(headers["WhiteElo"])), band_of(int(headers["BlackElo"]))
+        for band in bands:
+            self._cell_counts[band, perf] += 1
+        self._pending_games.append((evals, bands, perf))
+        if len(self._pending_games) >= METRICS_BATCH:
+            self.flush()
+
+    # ---------- METRICS ----------
+    def flush(self):
+        """One vectorized metrics pass over the queued games."""
+        if not self._pending_games:
+            return
+        games, self._pending_games = self._pending_games, []
+        batch = batch_metrics([g[0] for g in games])
+        n = len(games)
+
+        # mistake classes need the unclipped evals (as in the analyzers' mistake lists)
+        flat = np.concatenate([np.asarray(g[0], dtype=np.float64) for g in games])
+        before = np.concatenate(([INITIAL_EVAL], flat[:-1]))
+        before[batch.ply_index == 0] = INITIAL_EVAL
+        classes = classify_deltas(mover_deltas(flat, batch.white_moved, before))
+        side = batch.game_index * 2 + (~batch.white_moved)
+        moves = np.maximum(1, np.bincount(side, minlength=2 * n))
+
+        def per_100(cls):
+            return 100.0 * np.bincount(side[classes == cls], minlength=2 * n) / moves
+
+        values = {
+            "accuracy": np.column_stack([batch.white_accuracy, batch.black_accuracy]).ravel(),
+            "cpl": np.column_stack([batch.white_cpl, batch.black_cpl]).ravel(),
+            "inaccuracies_per_100": per_100(1),
+            "mistakes_per_100": per_100(2),
+            "blunders_per_100": per_100(3),
+        }
+        bands = np.array([g[1] for g in games], dtype=np.int64).ravel()
+        perfs = np.repeat([g[2] for g in games], 2)
+        self.table.add_samples(bands, perfs, values)
+        self.added += n
+
+    # ---------- ENGINE PATH ----------
+    def _submit(self, game):
+        """Schedules engine evals for a game without [%eval]; returns a future of (game, evals)."""
+        moves = list(game.mainline_moves())
+        fens = []
+        board = game.board()
+        for move in moves:
+            board.push(move)
+            fens.append(board.fen())
+        known = self.cache.get_many(fens, self.depth) if self.cache is not None else {}
+        keys = [normalize_fen(f) for f in fens]
+        missing = {i for i, k in enumerate(keys) if k not in known}
+        coro = _search_missing(self.client.pool, moves, missing, self.priority)
+        future = asyncio.run_coroutine_threadsafe(coro, self.client.loop)
+        return game, keys, known, missing, future
+
+    def _collect(self, job):
+        game, keys, known, missing, future = job
+        found = future.result()
+        if self.cache is not None:
+            self.cache.put_many((keys[i], self.depth, found[i]) for i in missing if i in found)
+        evals = [found[i] if i in found else known.get(k) for i, k in enumerate(keys)]
+        if any(e is None for e in evals):
+            return
+        self._queue(game, evals)
+
+    # ---------- DRIVER ----------
+    def add_file(self, path: str, on_progress=None, byte_range=None) -> int:
+        """
+        Samples one PGN file into the table. Returns the games added.
+        byte_range=(start, end): only the games starting in it (plain .pgn only).
+        """
+        import chess.pgn
+
+        added_before = self.added + len(self._pending_games)
+        builder = _sampled_builder(self._accept)
+        in_flight = deque()
+        max_in_flight = 2 * self.client.pool.size if self.client else 0
+        read = 0
+        with open_pgn(path) if byte_range is None else open_pgn_range(path, *byte_range) as f:
+            while True:
+                game = chess.pgn.read_game(f, Visitor=builder)
+                if game is None:
+                    break
+                read += 1
+                if on_progress is not None and read % 10000 == 0:
+                    on_progress(read, self.added + len(self._pending_games) - added_before)
+                if game is _SKIPPED or game.errors:
+                    continue
+
+                evals = _embedded_evals(game)
+                if evals is not None:
+                    self._queue(game, evals)
+                elif self.client is None:
+                    self.skipped_no_evals += 1
+                elif len(list(game.mainline_moves())) >= MIN_PLIES:
+                    in_flight.append(self._submit(game))
+                    # keep the engines busy, but never more than a few games ahead of them
+                    while len(in_flight) > max_in_flight or (in_flight and in_flight[0][-1].done()):
+                        self._collect(in_flight.popleft())
+
+        while in_flight:
+            self._collect(in_flight.popleft())
+        self.flush()
+        return self.added - added_before
+
+
+def _sample_job(path, byte_range, sample_rate, max_per_cell, seen, cell_counts):
+    """Process pool worker: samples one file / byte range into a table of its own."""
+    part = Baselines(path=None)
+    part.seen = set(seen)
+    builder = BaselineBuilder(part, sample_rate, max_per_cell)
+    builder._cell_counts = cell_counts
+    added = builder.add_file(path, byte_range=byte_range)
+    part.seen -= seen                           # only the new games travel back
+    return part, added, builder.skipped_no_evals
+
+
+def _build_in_processes(table, paths, sample_rate, max_per_cell, processes):
+    """
+    engines=0 path of build_baselines: jobs from _split_files run in a
+    process pool, each part table is merged into `table` when it is done.
+    Every worker checks `seen` and the per-cell cap against the table as it
+    was at the start, so a game present in two files is counted twice and
+    a cell can end up with up to `processes` times its remaining room.
+    Returns the games without [%eval] that were skipped.
+    """
+    jobs = _split_files(paths, processes)
+    cell_counts = table.hist["accuracy"].sum(axis=2).astype(np.int64)
+    print(f"[INFO] Sampling {len(jobs)} part(s) of {len(paths)} file(s) in {processes} processes "
+          f"(rate {sample_rate}, max {max_per_cell} per cell)...")
+
+    skipped = 0
+    with concurrent.futures.ProcessPoolExecutor(processes) as pool:
+        futures = {
+            pool.submit(_sample_job, pgn_path, byte_range, sample_rate, max_per_cell, table.seen, cell_counts):
+                (pgn_path, byte_range)
+            for pgn_path, byte_range in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            part, added, skipped_no_evals = future.result()
+            table.merge(part)
+            table.save()
+            skipped += skipped_no_evals
+            pgn_path, byte_range = futures[future]
+            where = f" bytes {byte_range[0]}-{byte_range[1]}" if byte_range else ""
+            print(f"[INFO] {added} game(s) added from {pgn_path}{where}")
+    return skipped
+
+
+def build_baselines(paths, sample_rate: float = 0.1, max_per_cell: int = 20000, engines: int = 0,
+                    stockfish_path: str = "stockfish.exe", depth: int = 12,
+                    path: str = BASELINES_PATH, processes: int = 1) -> Baselines:
+    """
+    Adds sampled games of every PGN file to the baselines table at `path`.
+    engines=0 only uses games with embedded [%eval] comments; those runs
+    are parsing-bound and use `processes` worker processes
+    (_build_in_processes). With engines, the engine pool is the parallelism.
+    """
+    table = Baselines.load(path)
+    if not engines and processes > 1:
+        skipped = _build_in_processes(table, paths, sample_rate, max_per_cell, processes)
+        if skipped:
+            print(f"[WARN] {skipped} sampled game(s) had no [%eval] comments — pass engines to analyse them")
+        return table
+
+    client = cache = None
+    if engines:
+        from async_engine import EngineClient
+        from eval_cache import EvalCache
+        client = EngineClient(stockfish_path, size=engines, depth=depth, options={"Threads": 1})
+        cache = EvalCache()
+
+    builder = BaselineBuilder(table, sample_rate, max_per_cell, client, cache, depth)
+
+    def progress(read, added):
+        print(f"[INFO] {read} games read, {added} sampled")
+
+    try:
+        for pgn_path in paths:
+            print(f"[INFO] Sampling {pgn_path} (rate {sample_rate}, max {max_per_cell} per cell)...")
+            added = builder.add_file(pgn_path, progress)
+            print(f"[INFO] {added} game(s) added from {pgn_path}")
+            table.save()
+    finally:
+        if client is not None:
+            client.close()
+        if cache is not None:
+            print(f"[INFO] Eval cache: {cache.hits} hits, {cache.misses} searched")
+            cache.close()
+    if builder.skipped_no_evals:
+        print(f"[WARN] {builder.skipped_no_evals} sampled game(s) had no [%eval] comments — "
+              f"pass engines to analyse them")
+    return table
@@ -0,0 +1,110 @@
+# bench_engine_hash.py
+"""
+Time to depth per ply: cold hash (old behaviour) vs game-scoped lease.
+
+    python bench_engine_hash.py --stockfish ./stockfish --depth 18 --games 5
+    python bench_engine_hash.py --stockfish ./stockfish --pgn my_games.pgn
+
+cold  : every ply evaluated under `pool.new_game_key()`, so python-chess
+        sends `ucinewgame` (hash cleared) before each one
+warm  : `pool.lease(game)` for the whole game, the path GameAnalyzer and
+        watch take — `ucinewgame` once, plies fed as
+        `position startpos moves ...`
+
+Both modes run on the same one-engine async_engine.EnginePool. Without
+--pgn, random legal games are used (less tree sharing between plies than
+real games, so the measured gain is a lower bound).
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+import chess
+import chess.pgn
+
+from async_engine import EnginePool
+
+
+def load_games(args):
+    if args.pgn:
+        games = []
+        with open(args.pgn, encoding="utf-8") as f:
+            while len(games) < args.games:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                games.append(list(game.mainline_moves()))
+        return games
+
+    rng = random.Random(args.seed)
+    games = []
+    for _ in range(args.games):
+        board = chess.Board()
+        while not board.is_game_over() and board.ply() < args.max_plies:
+            board.push(rng.choice(list(board.legal_moves)))
+        games.append(list(board.move_stack))
+    return games
+
+
+async def run_cold(pool, moves):
+    timings = []
+    board = chess.Board()
+    for move in moves:
+        board.push(move)
+        t0 = time.perf_counter()
+        await pool.evaluate(board, game=pool.new_game_key())
+        timings.append(time.perf_counter() - t0)
+    return timings
+
+
+async def run_warm(pool, moves):
+    timings = []
+    board = chess.Board()
+    async with pool.lease(pool.new_game_key()) as engine:
+        for move in moves:
+            board.push(move)
+            t0 = time.perf_counter()
+            await engine.evaluate(board)
+            timings.append(time.perf_counter() - t0)
+    return timings
+
+
+async def run_all(args, games):
+    cold, warm = [], []
+    options = {"Threads": args.threads, "Hash": args.hash}
+    async with EnginePool(args.stockfish, size=1, depth=args.depth, options=options) as pool:
+        for moves in games:
+            cold += await run_cold(pool, moves)
+            warm += await run_warm(pool, moves)
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stockfish", default="stockfish.exe")
+    parser.add_argument("--depth", type=int, default=18)
+    parser.add_argument("--threads", type=int, default=1, help="1 keeps the timings reproducible")
+    parser.add_argument("--hash", type=int, default=64, help="MB")
+    parser.add_argument("--games", type=int, default=5)
+    parser.add_argument("--max-plies", type=int, default=80)
+    parser.add_argument("--pgn", default=None, help="take games from a PGN file instead of random games")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    games = load_games(args)
+    print(f"[INFO] {len(games)} games, {sum(map(len, games))} plies, depth {args.depth}")
+
+    cold, warm = asyncio.run(run_all(args, games))
+
+    print(f"{'mode':6} {'ms/ply mean':>12} {'median':>8} {'p90':>8} {'total s':>9}")
+    for name, t in (("cold", cold), ("warm", warm)):
+        ms = sorted(x * 1000 for x in t)
+        print(f"{name:6} {statistics.mean(ms):12.1f} {statistics.median(ms):8.1f} "
+              f"{ms[int(0.9 * (len(ms) - 1))]:8.1f} {sum(t):9.1f}")
+    print(f"speedup: {sum(cold) / max(sum(warm), 1e-9):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
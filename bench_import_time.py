@@ -0,0 +1,90 @@
+# bench_import_time.py
+"""
+Import time budget for the CLI code paths, measured with `python -X importtime`.
+
+    python bench_import_time.py            # report + exit code 1 if over budget
+
+Each path imports exactly the modules its command imports before doing any
+network / engine / model work. Heavy modules must never appear on these paths.
+"""
+import subprocess
+import sys
+
+
+# command -> (modules imported on that path, budget in ms)
+IMPORT_PATHS = {
+    "cli":     (["cli"], 50),
+    "moves":   (["cli", "run_llm_game_by_id"], 400),
+    "worst":   (["cli", "run_llm_game_by_id", "LLMChessAnalyzer"], 500),
+    "chart":   (["cli", "run_analysis_chart"], 500),
+    "analyze": (["cli", "runAnalysis"], 500),
+    "live":    (["cli", "live_analysis"], 500),
+    "watch":   (["cli", "watch"], 500),
+    "openings": (["cli", "opening_tree"], 300),
+    "patterns": (["cli", "pattern_index"], 300),
+    "rag-index": (["cli", "explanation_cache", "pattern_index", "retrieval_index"], 300),
+    "puzzles": (["cli", "async_engine", "pattern_index", "puzzles"], 400),
+    "heatmaps": (["cli", "heatmap_cube"], 300),
+    "baselines": (["cli", "baselines"], 300),
+    "cohort":  (["cli", "analyzerChart", "sampling"], 500),
+}
+
+FORBIDDEN = ("torch", "transformers", "matplotlib", "sentence_transformers")
+
+
+# ============================================================
+#   MEASUREMENT
+# ============================================================
+
+def _importtime(code):
+    """Returns {top_level_module: cumulative_us} for `python -X importtime -c code`."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1])
+
+    timings = {}
+    all_modules = set()
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        all_modules.add(name.strip())
+        # nested imports are indented, top-level ones are not
+        if not name.startswith("  "):
+            timings[name.strip()] = int(cumulative)
+    return timings, all_modules
+
+
+def measure(modules):
+    baseline, _ = _importtime("pass")
+    timings, all_modules = _importtime("import " + ", ".join(modules))
+    total_us = sum(us for name, us in timings.items() if name not in baseline)
+    heavy = sorted(m for m in all_modules if m.split(".")[0] in FORBIDDEN)
+    return total_us / 1000.0, heavy
+
+
+# ============================================================
+#   MAIN
+# ============================================================
+
+def main():
+    failed = False
+    print(f"{'path':10} {'import ms':>10} {'budget':>8}  status")
+    for name, (modules, budget_ms) in IMPORT_PATHS.items():
+        total_ms, heavy = measure(modules)
+        ok = total_ms <= budget_ms and not heavy
+        failed |= not ok
+        status = "OK" if ok else "OVER BUDGET"
+        if heavy:
+            status = f"HEAVY IMPORTS: {', '.join(heavy[:5])}"
+        print(f"{name:10} {total_ms:10.1f} {budget_ms:8}  {status}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
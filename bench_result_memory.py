@@ -0,0 +1,93 @@
+# bench_result_memory.py
+"""
+Memory of a batch of GameAnalysisResult objects: retained chess.pgn.Game
+trees (old layout) vs packed 16-bit move codes (current layout).
+
+    python bench_result_memory.py --games 10000
+
+Games are random legal games with synthetic evals — no engine needed.
+Build times are inflated by tracemalloc; only the MB column matters.
+"""
+import argparse
+import gc
+import io
+import random
+import time
+import tracemalloc
+
+import chess
+import chess.pgn
+
+from analyzerChart import GameAnalysisResult
+
+
+def random_pgn(rng, max_plies=80):
+    board = chess.Board()
+    game = chess.pgn.Game()
+    game.headers["White"] = "white_player"
+    game.headers["Black"] = "black_player"
+    node = game
+    while not board.is_game_over() and board.ply() < max_plies:
+        move = rng.choice(list(board.legal_moves))
+        board.push(move)
+        node = node.add_variation(move)
+        node.set_clock(rng.uniform(0, 600))
+    game.headers["Result"] = board.result(claim_draw=True)
+    return str(game), board.ply()
+
+
+def synthetic_evals(rng, n):
+    ev, out = 0, []
+    for _ in range(n):
+        ev += rng.randint(-80, 80)
+        out.append(ev)
+    return out
+
+
+def build(pgns, evals, keep_game):
+    results = []
+    for gid, (pgn, ev) in enumerate(zip(pgns, evals)):
+        game = chess.pgn.read_game(io.StringIO(pgn))
+        r = GameAnalysisResult(str(gid), "white_player", "black_player", "*", [], ev, game)
+        if keep_game:
+            r._retained_game = game    # what the old layout kept alive
+        results.append(r)
+    return results
+
+
+def measure(pgns, evals, keep_game):
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    results = build(pgns, evals, keep_game)
+    elapsed = time.perf_counter() - t0
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del results
+    return current / 2**20, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    print(f"[INFO] Generating {args.games} random games...")
+    games = [random_pgn(rng) for _ in range(args.games)]
+    pgns = [pgn for pgn, _ in games]
+    evals = [synthetic_evals(rng, plies) for _, plies in games]
+
+    old_mb, old_s = measure(pgns, evals, keep_game=True)
+    new_mb, new_s = measure(pgns, evals, keep_game=False)
+
+    print(f"{'layout':28} {'MB':>10} {'build s':>9}")
+    print(f"{'retained chess.pgn.Game':28} {old_mb:10.1f} {old_s:9.1f}")
+    print(f"{'packed uint16 move codes':28} {new_mb:10.1f} {new_s:9.1f}")
+    print(f"reduction: {old_mb / max(new_mb, 1e-9):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
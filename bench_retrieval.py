@@ -0,0 +1,110 @@
+# bench_retrieval.py
+"""
+Lookup latency of the retrieval index (retrieval_index.py) at scale.
+
+    python bench_retrieval.py --entries 1000000
+
+Synthetic clustered unit vectors are added in batches through the same
+code path as real entries (flat -> IVF + SQ8 conversion), with a metadata
+row each. The index is written, re-opened memory-mapped and queried the
+way the LLM prompt does it: similar_cases() on mistakes from random
+positions, which covers describe_mistake + embedding the query + search +
+metadata lookup. The embedding share is reported on its own. Needs
+faiss-cpu and sentence-transformers.
+"""
+import argparse
+import random
+import shutil
+import tempfile
+import time
+
+import chess
+import numpy as np
+
+from retrieval_index import DEFAULT_EMBEDDER, RetrievalIndex, describe_mistake
+
+
+def clustered_vectors(rng, n, d, centers):
+    x = centers[rng.integers(0, len(centers), n)] + 0.35 * rng.standard_normal((n, d)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+
+def random_mistakes(rng, n):
+    """(fen, uci, refutation) of a random move in a random legal game, with a random reply."""
+    out = []
+    while len(out) < n:
+        board = chess.Board()
+        for _ in range(rng.randrange(4, 60)):
+            if board.is_game_over():
+                break
+            board.push(rng.choice(list(board.legal_moves)))
+        if board.is_game_over():
+            continue
+        move = rng.choice(list(board.legal_moves))
+        after = board.copy(stack=False)
+        after.push(move)
+        replies = list(after.legal_moves)
+        refutation = rng.choice(replies).uci() if replies else ""
+        out.append((board.fen(), move.uci(), refutation))
+    return out
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--entries", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--embedder", default=DEFAULT_EMBEDDER)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    mistakes = random_mistakes(random.Random(args.seed), args.queries)
+    folder = tempfile.mkdtemp(prefix="retrieval_bench_")
+
+    try:
+        index = RetrievalIndex(folder, model_name=args.embedder)
+        dim = index.embed([describe_mistake(*mistakes[0])]).shape[1]     # loads the model, outside the timings
+        centers = rng.standard_normal((2000, dim)).astype(np.float32)
+
+        t0 = time.perf_counter()
+        for start in range(0, args.entries, 50_000):
+            n = min(50_000, args.entries - start)
+            index._db.executemany(
+                "INSERT INTO entries (id, fen, move, source, description, text) VALUES (?, ?, ?, ?, ?, ?)",
+                ((i, f"synthetic {i}", "0000", "explanation", "", "") for i in range(start + 1, start + n + 1)),
+            )
+            index._add_vectors(clustered_vectors(rng, n, dim, centers), np.arange(start + 1, start + n + 1))
+        index._db.commit()
+        build_s = time.perf_counter() - t0
+        index.save()
+        index.close()
+
+        t0 = time.perf_counter()
+        index = RetrievalIndex(folder, read_only=True, model_name=args.embedder)
+        load_ms = (time.perf_counter() - t0) * 1000
+        index.embed(["warm-up"])
+
+        embed_ms, lookup_ms = [], []
+        for fen, uci, refutation in mistakes:
+            t0 = time.perf_counter()
+            index.embed([describe_mistake(fen, uci, refutation)])
+            embed_ms.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            index.similar_cases(fen, uci, refutation, k=args.k)
+            lookup_ms.append((time.perf_counter() - t0) * 1000)
+        index.close()
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    embed_ms, lookup_ms = np.array(embed_ms), np.array(lookup_ms)
+    print(f"entries: {args.entries}  build: {build_s:.1f} s  mmap load: {load_ms:.1f} ms")
+    print(f"lookup ms (describe + embed + search)  p50 {np.percentile(lookup_ms, 50):.2f}  "
+          f"p99 {np.percentile(lookup_ms, 99):.2f}  max {lookup_ms.max():.2f}")
+    print(f"  of which describe + embed            p50 {np.percentile(embed_ms, 50):.2f}  "
+          f"p99 {np.percentile(embed_ms, 99):.2f}")
+
+
+if __name__ == "__main__":
+    main()
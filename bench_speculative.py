@@ -0,0 +1,120 @@
+# bench_speculative.py
+"""
+Tokens/sec of plain greedy decoding vs speculative (assisted) decoding.
+
+    python bench_speculative.py --model mistralai/Mistral-7B-Instruct-v0.3 --draft prompt_lookup
+    python bench_speculative.py --model Qwen/Qwen2.5-7B-Instruct --draft Qwen/Qwen2.5-0.5B-Instruct
+    python bench_speculative.py --model mistral-7b-instruct.Q4_K_M.gguf --draft prompt_lookup
+
+Runs on CPU by default, without Stockfish: the prompts are built by
+build_prompt from a few fixed blunders with their tactical facts lines,
+like ask_llm does. Each prompt is generated once without and once with the
+draft (after one warm-up run of each), in the same process and model.
+
+Reported: new tokens per second of both modes, the speedup, and whether
+every assisted output is identical to the greedy one — assisted decoding
+only keeps draft tokens the main model would have chosen itself, so any
+mismatch (a [WARN]) points at numerics (e.g. bf16 batched verification),
+not at the draft.
+"""
+import argparse
+import time
+
+import chess
+
+from LLMChessAnalyzer import LLMChessAnalyzer, PROMPT_LOOKUP, WorstMove
+from position_features import tactical_facts
+
+# (moves before the blunder, blunder, refutation, eval change)
+BLUNDERS = [
+    (["e4", "e5", "Qh5", "Nc6", "Bc4"], "Nf6", "Qxf7#", -9990),
+    (["e4", "e5", "Nf3", "d6", "Bc4", "Bg4", "Nc3"], "g6", "Nxe5", -420),
+    (["d4", "d5", "c4", "e5", "dxe5", "d4"], "e3", "Bb4+", -350),
+    (["e4", "e5", "Nf3", "Nc6", "Bc4", "Nd4"], "Nxe5", "Qg5", -310),
+]
+
+
+def worst_move(before, san, refutation_san, loss):
+    board = chess.Board()
+    for s in before:
+        board.push_san(s)
+    move = board.parse_san(san)
+    after = board.copy(stack=False)
+    after.push(move)
+    refutation = after.parse_san(refutation_san).uci()
+    return WorstMove(
+        move_number=board.fullmove_number, san=san, loss=loss, fen=board.fen(), uci=move.uci(),
+        refutation=refutation, facts=tactical_facts(board, move, refutation),
+    )
+
+
+def prompts_for(analyzer, n):
+    """n prompts of one or two blunders each."""
+    moves = [worst_move(*b) for b in BLUNDERS]
+    sets = [[m] for m in moves] + [[moves[i], moves[j]] for i in range(len(moves)) for j in range(i + 1, len(moves))]
+    return [(analyzer.build_prompt(bad), bad) for bad in sets[:n]]
+
+
+def count_tokens(analyzer, text):
+    if analyzer.backend == "llama_cpp":
+        return len(analyzer.model.tokenize(text.encode("utf-8"), add_bos=False))
+    return len(analyzer.tokenizer(text, add_special_tokens=False).input_ids)
+
+
+def set_assisted(analyzer, draft, on):
+    analyzer.assistant = draft[0] if on else None
+    if analyzer.backend == "llama_cpp":
+        analyzer.model.draft_model = draft[1] if on else None
+
+
+def run(analyzer, prompts, max_new_tokens):
+    """(outputs, new tokens, seconds)"""
+    outputs, tokens, seconds = [], 0, 0.0
+    for prompt, bad in prompts:
+        t0 = time.perf_counter()
+        text = analyzer._generate(prompt, max_new_tokens=max_new_tokens, bad_moves=bad)
+        seconds += time.perf_counter() - t0
+        outputs.append(text)
+        tokens += count_tokens(analyzer, text)
+    return outputs, tokens, seconds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--model", required=True, help="HF id / snapshot dir or .gguf file")
+    parser.add_argument("--draft", default=PROMPT_LOOKUP, help=f"draft model (HF id / path) or {PROMPT_LOOKUP!r}")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--quantize", choices=["int8", "int4"], default=None)
+    parser.add_argument("--prompts", type=int, default=6)
+    parser.add_argument("--max-new-tokens", type=int, default=200)
+    args = parser.parse_args()
+
+    analyzer = LLMChessAnalyzer(
+        args.model, stockfish_path=None, device=args.device, quantization=args.quantize,
+        num_threads=args.threads, cache_path=None, assistant_model=args.draft,
+    )
+    draft = (analyzer.assistant, getattr(analyzer.model, "draft_model", None))
+    prompts = prompts_for(analyzer, args.prompts)
+    print(f"[INFO] {analyzer.backend}, {len(prompts)} prompts, up to {args.max_new_tokens} new tokens each")
+
+    results = {}
+    for mode in ("greedy", "assisted"):
+        set_assisted(analyzer, draft, mode == "assisted")
+        run(analyzer, prompts[:1], args.max_new_tokens)           # warm-up
+        results[mode] = run(analyzer, prompts, args.max_new_tokens)
+
+    print(f"\n--- {args.model} on {args.device} (draft: {args.draft}) ---")
+    for mode, (_, tokens, seconds) in results.items():
+        print(f"{mode:9} {tokens:6} tokens  {seconds:8.1f} s  {tokens / seconds:7.2f} tokens/s")
+    (plain, plain_tokens, plain_s), (assisted, assisted_tokens, assisted_s) = results["greedy"], results["assisted"]
+    print(f"speedup   {(assisted_tokens / assisted_s) / (plain_tokens / plain_s):.2f}x")
+
+    same = sum(a == b for a, b in zip(plain, assisted))
+    print(f"identical {same}/{len(prompts)} outputs")
+    if same < len(prompts):
+        print("[WARN] assisted output differs from greedy decoding")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+# bench_static_eval.py
+"""
+Agreement of the static pre-screen (static_eval.py) with Stockfish.
+
+    python bench_static_eval.py --pgn fixtures.pgn                  # evals from [%eval] comments
+    python bench_static_eval.py --pgn my_games.pgn --stockfish ./stockfish --depth 14
+    python bench_static_eval.py --stockfish ./stockfish --games 20  # random legal games
+
+Reference evals are the PGN's [%eval] comments when every ply has one (the
+Lichess server analysis is Stockfish); otherwise each ply is searched.
+
+Reported:
+  eval agreement   Spearman rank correlation static vs Stockfish (clipped to
+                   ±1000), and same side better where |Stockfish| >= 100 cp
+  screening        share of plies still sent to the engine; recall of the
+                   plies Stockfish classifies (per class, as in the mistake
+                   list) that the screened flow classifies the same way
+  filled-in evals  mean |error| of the evals of skipped plies
+  speed            static µs per position vs engine ms per position
+"""
+import argparse
+import random
+import time
+
+import chess
+import chess.pgn
+import numpy as np
+
+from async_engine import result_from_info, terminal_result
+from metrics import CLASS_NAMES, CPL_CAP, classify_deltas, mover_deltas
+from static_eval import ANCHOR_EVERY, QUIET_SWING, screen_game
+
+
+def load_games(args):
+    """[(moves, reference evals or None)]"""
+    games = []
+    if args.pgn:
+        with open(args.pgn, encoding="utf-8") as f:
+            while len(games) < args.games:
+                game = chess.pgn.read_game(f)
+                if game is None:
+                    break
+                if "FEN" in game.headers:
+                    continue
+                evals = []
+                for node in game.mainline():
+                    score = node.eval()
+                    if score is None and node.is_end() and terminal_result(node.board()) is not None:
+                        evals.append(terminal_result(node.board()).cp)   # dumps leave the final mate bare
+                    elif score is None:
+                        evals = None
+                        break
+                    else:
+                        evals.append(result_from_info({"score": score}).cp)
+                games.append((list(game.mainline_moves()), evals))
+        return games
+
+    rng = random.Random(args.seed)
+    for _ in range(args.games):
+        board = chess.Board()
+        while not board.is_game_over() and board.ply() < args.max_plies:
+            board.push(rng.choice(list(board.legal_moves)))
+        games.append((list(board.move_stack), None))
+    return games
+
+
+def engine_evals(client, moves, depth):
+    board = chess.Board()
+    game = client.new_game_key()
+    evals = []
+    for move in moves:
+        board.push(move)
+        evals.append(client.evaluate(board, game=game, depth=depth).cp)
+    return evals
+
+
+def screened_evals(search, static, evals):
+    """The evals GameAnalyzer(screen=True) ends up with, given the engine's evals."""
+    out = np.empty(len(evals))
+    anchor_cp, anchor_static = 0.0, static[0]
+    for i, cp in enumerate(evals):
+        if search[i]:
+            out[i] = cp
+            anchor_cp, anchor_static = cp, static[i + 1]
+        else:
+            out[i] = anchor_cp + static[i + 1] - anchor_static
+    return out
+
+
+def _ranks(x):
+    r = np.empty(len(x))
+    r[np.argsort(x, kind="stable")] = np.arange(len(x))
+    return r
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pgn", default=None, help="fixture corpus (random legal games without it)")
+    parser.add_argument("--stockfish", default=None, help="needed for games without [%%eval] comments")
+    parser.add_argument("--depth", type=int, default=14)
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--max-plies", type=int, default=80)
+    parser.add_argument("--quiet-swing", type=float, default=QUIET_SWING)
+    parser.add_argument("--anchor-every", type=int, default=ANCHOR_EVERY)
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    games = load_games(args)
+    client = None
+    if any(evals is None for _, evals in games):
+        if not args.stockfish:
+            games = [g for g in games if g[1] is not None]
+            print("[WARN] games without [%eval] skipped (pass --stockfish to search them)")
+        else:
+            from async_engine import EngineClient
+            client = EngineClient(args.stockfish, size=1, depth=args.depth, options={"Threads": 1})
+
+    ref, stat = [], []
+    full_classes, screened_classes, searched = [], [], []
+    skipped_err = []
+    static_s = engine_s = 0.0
+    engine_positions = 0
+    try:
+        for moves, evals in games:
+            if not moves:
+                continue
+            if evals is None:
+                t0 = time.perf_counter()
+                evals = engine_evals(client, moves, args.depth)
+                engine_s += time.perf_counter() - t0
+                engine_positions += len(moves)
+            evals = np.asarray(evals, dtype=np.float64)
+
+            t0 = time.perf_counter()
+            search, static = screen_game(moves, quiet_swing=args.quiet_swing, anchor_every=args.anchor_every)
+            static_s += time.perf_counter() - t0
+
+            white_moved = np.arange(len(moves)) % 2 == 0
+            approx = screened_evals(search, static, evals)
+            ref.append(evals)
+            stat.append(static[1:])
+            searched.append(search)
+            full_classes.append(classify_deltas(mover_deltas(evals, white_moved)))
+            screened_classes.append(np.where(search, classify_deltas(mover_deltas(approx, white_moved)), 0))
+            skipped_err.append(np.abs(approx - evals)[~search])
+    finally:
+        if client is not None:
+            client.close()
+
+    if not ref:
+        print("[WARN] no games with reference evals")
+        return
+    ref, stat = np.clip(np.concatenate(ref), -CPL_CAP, CPL_CAP), np.clip(np.concatenate(stat), -CPL_CAP, CPL_CAP)
+    full, screened = np.concatenate(full_classes), np.concatenate(screened_classes)
+    searched = np.concatenate(searched)
+    skipped_err = np.concatenate(skipped_err)
+
+    print(f"[INFO] {len(games)} games, {len(ref)} plies")
+    print("\n--- eval agreement (static vs Stockfish) ---")
+    print(f"Spearman rho            {np.corrcoef(_ranks(ref), _ranks(stat))[0, 1]:6.3f}")
+    decisive = np.abs(ref) >= 100
+    if decisive.any():
+        agree = np.sign(ref[decisive]) == np.sign(stat[decisive])
+        print(f"same side better        {100 * agree.mean():5.1f}%  ({decisive.sum()} plies with |eval| >= 100)")
+
+    print(f"\n--- screening (swing > {args.quiet_swing:g} cp, anchor every {args.anchor_every} plies) ---")
+    print(f"plies sent to engine    {100 * searched.mean():5.1f}%")
+    for c in (1, 2, 3):
+        flagged = full >= c
+        if flagged.any():
+            same = (screened[flagged] == full[flagged]).mean()
+            kept = searched[flagged].mean()
+            print(f"{CLASS_NAMES[c] + ' or worse':22}  searched {100 * kept:5.1f}%  same class {100 * same:5.1f}%  "
+                  f"({flagged.sum()} plies)")
+    false_flags = (screened > 0) & (full == 0)
+    print(f"flagged, Stockfish fine {false_flags.sum()}")
+    if skipped_err.size:
+        print(f"filled-in eval error    mean {skipped_err.mean():.0f} cp, p90 {np.percentile(skipped_err, 90):.0f} cp")
+
+    print("\n--- speed ---")
+    print(f"static                  {1e6 * static_s / len(ref):8.1f} µs/position (replay + eval + screen)")
+    if engine_positions:
+        print(f"engine (depth {args.depth:2})       {1e3 * engine_s / engine_positions:8.1f} ms/position")
+
+
+if __name__ == "__main__":
+    main()
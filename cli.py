@@ -0,0 +1,414 @@
+# cli.py
+"""
+Single entry point for all LiLLeM.chess tools:
+
+    python cli.py moves last bielbart77       # fetch & print moves only
+    python cli.py worst last bielbart77       # + Stockfish worst moves
+    python cli.py llm   last bielbart77       # + Mistral explanation
+    python cli.py llm   last bielbart77 --cpu --quantize int8 --threads 8
+    python cli.py llm   last bielbart77 --games 5   # last 5 games, one batched generation
+    python cli.py chart --user bielbart77     # CPL / accuracy plots + heatmaps
+    python cli.py cohort user1 user2 --perf blitz --since 2026.01.01 --precision 1.0
+    python cli.py analyze --user bielbart77   # plain text mistakes report
+    python cli.py live GAME_ID                # follow a game in progress
+    python cli.py watch user1 user2           # analyse new games as they finish
+    python cli.py openings bielbart77         # worst branches of the opening tree
+    python cli.py patterns bielbart77         # recurring mistake motifs
+    python cli.py rag-index                   # update the retrieval index for llm
+    python cli.py baselines dump.pgn.zst      # rating-band percentiles from a PGN corpus
+
+Every heavy dependency (transformers/torch, matplotlib, stockfish) is
+imported inside the command that needs it, never at module level.
+Import time budget is checked by bench_import_time.py.
+"""
+import argparse
+import sys
+
+
+DEFAULT_USER = "bielbart77"
+METRIC_CHOICES = ["accuracy", "cpl", "inaccuracies_per_100", "mistakes_per_100", "blunders_per_100"]
+PERF_CHOICES = ["ultrabullet", "bullet", "blitz", "rapid", "classical", "correspondence", "unknown"]   # heatmap_cube.PERFS
+
+
+def _date_arg(text):
+    """argparse type for YYYY.MM.DD dates (kept as the string the modules expect)."""
+    import datetime
+    try:
+        datetime.datetime.strptime(text, "%Y.%m.%d")
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid date {text!r} (use YYYY.MM.DD)")
+    return text
+
+
+# ============================================================
+#   COMMANDS
+# ============================================================
+
+def cmd_moves(args):
+    from run_llm_game_by_id import fetch_game, print_moves_from_pgn
+
+    game = fetch_game(args.game, args.user)
+    print_moves_from_pgn(game["pgn"])
+    return game["pgn"]
+
+
+def cmd_worst(args):
+    from run_llm_game_by_id import run_worst_moves
+
+    pgn_text = cmd_moves(args)
+    run_worst_moves(pgn_text, stockfish_path=args.stockfish, n_worst=args.n_worst)
+
+
+def cmd_llm(args):
+    from run_llm_game_by_id import run_llm_analysis
+
+    llm_options = {
+        "device": "cpu" if args.cpu else "auto",
+        "quantization": args.quantize,
+        "num_threads": args.threads,
+        "assistant_model": args.draft,
+    }
+    if args.games > 1 and args.game == "last":
+        _llm_last_games(args, llm_options)
+        return
+    if args.games > 1:
+        print("[WARN] --games only applies to 'last'; explaining the one game given")
+
+    pgn_text = cmd_moves(args)
+    run_llm_analysis(pgn_text, stockfish_path=args.stockfish, n_worst=args.n_worst,
+                     llm_options=llm_options, stream=args.stream)
+
+
+def _llm_last_games(args, llm_options):
+    from run_llm_game_by_id import fetch_last_games, print_moves_from_pgn, run_llm_batch_analysis
+
+    if args.stream:
+        print("[WARN] --stream is ignored with --games (all games are generated in one batch)")
+
+    games = fetch_last_games(args.user, args.games)
+    for game in games:
+        print_moves_from_pgn(game["pgn"])
+    run_llm_batch_analysis(games, stockfish_path=args.stockfish, n_worst=args.n_worst, llm_options=llm_options)
+
+
+def cmd_chart(args):
+    from run_analysis_chart import main as chart_main
+
+    chart_main(username=args.user, max_games=args.max_games, perf_type=args.perf,
+               export_dir=args.export, export_format=args.export_format, engines=args.engines,
+               precision=args.precision, metric=args.metric, screen=args.screen)
+
+
+def cmd_cohort(args):
+    import datetime
+    from analyzerChart import analyze_cohort_games
+    from sampling import SamplingPlan
+
+    since = None
+    if args.since:
+        start = datetime.datetime.strptime(args.since, "%Y.%m.%d").replace(tzinfo=datetime.timezone.utc)
+        since = int(start.timestamp() * 1000)
+    plan = SamplingPlan(precision=args.precision, metric=args.metric, seed=args.seed)
+    analyze_cohort_games(args.users, plan, max_games=args.max_games, perf_type=args.perf, since=since,
+                         engines=args.engines, stockfish_path=args.stockfish, screen=args.screen)
+    print(plan.report())
+
+
+def cmd_analyze(args):
+    from runAnalysis import main as analysis_main
+
+    analysis_main(username=args.user, max_games=args.max_games)
+
+
+def cmd_live(args):
+    from live_analysis import follow_game
+
+    follow_game(args.game_id)
+
+
+def cmd_watch(args):
+    from watch import GameWatcher
+
+    GameWatcher(
+        usernames=args.users,
+        perf_type=args.perf,
+        interval=args.interval,
+        workers=args.workers,
+        backfill=args.backfill,
+        stockfish_path=args.stockfish,
+    ).run()
+
+
+def cmd_openings(args):
+    from opening_tree import OpeningTree
+
+    tree = OpeningTree.load(args.user)
+    if len(tree.seen) == 0:
+        print(f"[WARN] No opening tree for {args.user} yet — run chart or watch first.")
+        return
+
+    print(f"Opening tree of {args.user}: {len(tree.seen)} games, {len(tree)} positions\n")
+    for row in tree.worst_branches(min_games=args.min_games, top_n=args.top, color=args.color):
+        print(
+            f"{row['color']:5} | {' '.join(row['line']):40} | games {row['games']:3} | "
+            f"mistakes {100 * row['mistake_rate']:5.1f}% | eval {row['avg_eval']:+6.0f} | "
+            f"score {row['score_pct']:5.1f}%"
+        )
+
+
+def cmd_heatmaps(args):
+    import matplotlib
+    matplotlib.use("Agg")
+    from heatmap_cube import HeatmapCube
+    from heatmap_generator import generate_heatmaps_from_cube, render_range_comparison
+
+    cube = HeatmapCube.load(args.user)
+    if not len(cube):
+        print(f"[WARN] No heatmap cube for {args.user} yet — run chart or watch first.")
+        return
+
+    if args.compare:
+        if not any(cube.last_days(d, args.perf, args.color)["moves"].any() for d in args.compare):
+            print(f"[WARN] No games of {args.user} in the last {max(args.compare)} days for this selection.")
+            return
+        ranges = [(f"last {d} days", d) for d in args.compare]
+        render_range_comparison(cube, ranges, perf=args.perf, color=args.color, out_dir=args.out)
+        print(f"Comparison saved in {args.out}/heatmap_comparison.png")
+    else:
+        if not cube.query(args.start, args.end, args.perf, args.color)["moves"].any():
+            print(f"[WARN] No games of {args.user} in the selected range / perf / colour.")
+            return
+        generate_heatmaps_from_cube(cube, args.start, args.end, args.perf, args.color, out_dir=args.out)
+        print(f"Heatmaps saved in {args.out}/cube_*.png")
+
+
+def cmd_patterns(args):
+    from pattern_index import PatternIndex
+
+    index = PatternIndex.load()
+    rows = index.filter(tags=args.tag, player=args.user, min_class=args.min_class)
+    print(f"{len(rows)} flagged plies of {args.user} ({args.min_class} or worse)"
+          + (f" with {', '.join(args.tag)}" if args.tag else "") + "\n")
+
+    counts = index.tag_counts(args.tag, player=args.user, min_class=args.min_class)
+    for name, count in sorted(counts.items(), key=lambda kv: -kv[1]):
+        if count:
+            print(f"{name:18} {count:5}")
+
+    print("\nRecurring mistake types:")
+    for names, count, idx in index.motif_groups(args.tag, player=args.user,
+                                               min_class=args.min_class, top_n=args.top):
+        example = index.row(int(idx[0]))
+        print(f"{count:5} × {', '.join(names) or 'no tactic':40} e.g. {example['game_id']} ply {example['ply']} {example['san']}")
+
+
+def cmd_puzzles(args):
+    from async_engine import EngineClient
+    from pattern_index import PatternIndex
+    from puzzles import generate_puzzles
+
+    index = PatternIndex.load()
+    client = EngineClient(args.stockfish, size=args.engines, options={"Threads": 1})
+    try:
+        added = generate_puzzles(index, client, path=args.out, player=args.user,
+                                 min_class=args.min_class, nodes=args.nodes)
+    finally:
+        client.close()
+    print(f"{added} new puzzle(s) appended to {args.out}")
+
+
+def cmd_baselines(args):
+    from baselines import BAND_EDGES, PERFS, Baselines, band_label, build_baselines
+
+    if args.pgn:
+        table = build_baselines(args.pgn, sample_rate=args.sample, max_per_cell=args.max_per_cell,
+                                engines=args.engines, stockfish_path=args.stockfish, depth=args.depth,
+                                path=args.out, processes=args.processes)
+    else:
+        table = Baselines.load(args.out)
+    if not len(table):
+        print(f"[WARN] No baselines in {args.out} yet — pass PGN files to build them.")
+        return
+
+    print(f"{len(table)} sampled sides in {table.path} — median {args.metric} per rating band\n")
+    perfs = [p for p in PERFS if table.hist["accuracy"][:, PERFS.index(p)].sum()]
+    print(f"{'band':10}" + "".join(f"{p:>14}" for p in perfs))
+    for band in range(len(BAND_EDGES) + 1):
+        rating = BAND_EDGES[0] - 1 if band == 0 else BAND_EDGES[band - 1]
+        cells = []
+        for perf in perfs:
+            q = table.quantiles(args.metric, rating, perf) if table.cell_count(band, perf) else None
+            cells.append(f"{q[1]:7.1f} ({table.cell_count(band, perf):4})" if q else f"{'-':>13}")
+        print(f"{band_label(band):10}" + "".join(f"{c:>14}" for c in cells))
+
+
+def cmd_rag_index(args):
+    from explanation_cache import ExplanationCache
+    from pattern_index import PatternIndex
+    from retrieval_index import RetrievalIndex
+
+    index = RetrievalIndex(args.folder)
+    added = index.add_explanations(ExplanationCache(args.cache))
+    if not args.no_patterns:
+        added += index.add_patterns(PatternIndex.load())
+    index.save()
+    print(f"{added} new entries embedded, {len(index)} in {index.index_path}")
+
+
+# ============================================================
+#   PARSER
+# ============================================================
+
+def _add_game_args(p):
+    p.add_argument("game", help="'last' or a Lichess game id")
+    p.add_argument("user", nargs="?", default=DEFAULT_USER, help="Lichess username")
+
+
+def _add_engine_args(p):
+    p.add_argument("--stockfish", default="stockfish.exe", help="path to Stockfish binary")
+    p.add_argument("--n-worst", type=int, default=2, help="number of worst moves to report")
+
+
+def _add_llm_args(p):
+    p.add_argument("--cpu", action="store_true", help="force CPU inference (bf16 weights)")
+    p.add_argument("--quantize", choices=["int8", "int4"], default=None,
+                   help="weight-only quantization for transformers models (.gguf files are pre-quantized)")
+    p.add_argument("--threads", type=int, default=None, help="inference threads")
+    p.add_argument("--stream", action="store_true", help="print the explanation while it is generated")
+    p.add_argument("--draft", default=None, metavar="MODEL",
+                   help="speculative decoding: small draft model (HF id / path) or 'prompt_lookup'; "
+                        "same text as without it, see bench_speculative.py")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="cli.py", description="LiLLeM.chess — chess game analysis")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("moves", help="fetch a game and print its moves")
+    _add_game_args(p)
+    p.set_defaults(func=cmd_moves)
+
+    p = sub.add_parser("worst", help="print moves + Stockfish worst moves (no LLM)")
+    _add_game_args(p)
+    _add_engine_args(p)
+    p.set_defaults(func=cmd_worst)
+
+    p = sub.add_parser("llm", help="print moves + LLM explanation of worst moves")
+    _add_game_args(p)
+    _add_engine_args(p)
+    _add_llm_args(p)
+    p.add_argument("--games", type=int, default=1, metavar="N",
+                   help="with 'last': explain the user's last N games in one batched generation")
+    p.set_defaults(func=cmd_llm)
+
+    p = sub.add_parser("chart", help="analyse latest games and generate plots")
+    p.add_argument("--user", default=DEFAULT_USER)
+    p.add_argument("--max-games", type=int, default=10)
+    p.add_argument("--perf", default="rapid", help="rapid / blitz / bullet")
+    p.add_argument("--export", metavar="DIR", default=None,
+                   help="also write games/plies tables (Arrow IPC / Parquet) to DIR")
+    p.add_argument("--export-format", choices=["arrow", "parquet"], default="arrow")
+    p.add_argument("--engines", type=int, default=1,
+                   help="Stockfish processes — games are analysed this many at a time")
+    p.add_argument("--precision", type=float, default=None,
+                   help="approximate mode: analyse a stratified sample until the 95%% CI of --metric is this narrow")
+    p.add_argument("--metric", default="accuracy", choices=METRIC_CHOICES)
+    p.add_argument("--screen", action="store_true",
+                   help="static pre-screen: quiet plies skip the engine (see bench_static_eval.py)")
+    p.set_defaults(func=cmd_chart)
+
+    p = sub.add_parser("cohort", help="sampled estimates with confidence intervals over several players' games")
+    p.add_argument("users", nargs="+", help="Lichess usernames (e.g. a club)")
+    p.add_argument("--perf", default=None, help="rapid / blitz / bullet (default: all)")
+    p.add_argument("--since", default=None, help="YYYY.MM.DD — only games from this day on")
+    p.add_argument("--max-games", type=int, default=500, help="population cap per player")
+    p.add_argument("--precision", type=float, default=1.0, help="target 95%% CI half-width of --metric")
+    p.add_argument("--metric", default="accuracy", choices=METRIC_CHOICES)
+    p.add_argument("--seed", type=int, default=None)
+    p.add_argument("--screen", action="store_true", help="static pre-screen: quiet plies skip the engine")
+    p.add_argument("--engines", type=int, default=2)
+    p.add_argument("--stockfish", default="stockfish.exe", help="path to Stockfish binary")
+    p.set_defaults(func=cmd_cohort)
+
+    p = sub.add_parser("analyze", help="analyse latest games (text report only)")
+    p.add_argument("--user", default=DEFAULT_USER)
+    p.add_argument("--max-games", type=int, default=5)
+    p.set_defaults(func=cmd_analyze)
+
+    p = sub.add_parser("live", help="follow a game in progress and classify every ply")
+    p.add_argument("game_id", help="Lichess game id")
+    p.set_defaults(func=cmd_live)
+
+    p = sub.add_parser("watch", help="poll users for new games and analyse them on arrival")
+    p.add_argument("users", nargs="+", help="Lichess usernames")
+    p.add_argument("--perf", default=None, help="rapid / blitz / bullet (default: all)")
+    p.add_argument("--interval", type=float, default=300, help="seconds between polls of the same user")
+    p.add_argument("--workers", type=int, default=2, help="engines analysing in parallel")
+    p.add_argument("--backfill", type=int, default=0, help="analyse the last N games on first poll")
+    p.add_argument("--stockfish", default="stockfish.exe", help="path to Stockfish binary")
+    p.set_defaults(func=cmd_watch)
+
+    p = sub.add_parser("openings", help="worst branches of a player's opening tree")
+    p.add_argument("user", nargs="?", default=DEFAULT_USER)
+    p.add_argument("--color", choices=["white", "black"], default=None)
+    p.add_argument("--min-games", type=int, default=3)
+    p.add_argument("--top", type=int, default=10)
+    p.set_defaults(func=cmd_openings)
+
+    p = sub.add_parser("heatmaps", help="per-square heatmaps of any date range from the heatmap cube")
+    p.add_argument("user", nargs="?", default=DEFAULT_USER)
+    p.add_argument("--from", dest="start", type=_date_arg, default=None, help="YYYY.MM.DD")
+    p.add_argument("--to", dest="end", type=_date_arg, default=None, help="YYYY.MM.DD")
+    p.add_argument("--perf", choices=PERF_CHOICES, default=None)
+    p.add_argument("--color", choices=["white", "black"], default=None)
+    p.add_argument("--compare", type=int, nargs="+", metavar="DAYS", default=None,
+                   help="side by side ranges ending today, e.g. --compare 30 365")
+    p.add_argument("--out", default="plots/heatmaps")
+    p.set_defaults(func=cmd_heatmaps)
+
+    p = sub.add_parser("patterns", help="recurring mistake motifs across analysed games")
+    p.add_argument("user", nargs="?", default=DEFAULT_USER)
+    p.add_argument("--tag", action="append", default=[], help="only plies with this motif (repeatable), e.g. knight_fork")
+    p.add_argument("--min-class", choices=["Inaccuracy", "Mistake", "Blunder"], default="Mistake")
+    p.add_argument("--top", type=int, default=10)
+    p.set_defaults(func=cmd_patterns)
+
+    p = sub.add_parser("puzzles", help="turn flagged plies into puzzles (stored engine lines + uniqueness check)")
+    p.add_argument("user", nargs="?", default=None, help="only this player's mistakes (default: all)")
+    p.add_argument("--min-class", choices=["Mistake", "Blunder"], default="Blunder")
+    p.add_argument("--nodes", type=int, default=300_000, help="node budget per uniqueness search")
+    p.add_argument("--engines", type=int, default=2)
+    p.add_argument("--stockfish", default="stockfish.exe", help="path to Stockfish binary")
+    p.add_argument("--out", default="data/puzzles.csv.gz")
+    p.set_defaults(func=cmd_puzzles)
+
+    p = sub.add_parser("baselines", help="rating-band distributions of accuracy / CPL / mistake rates from PGN corpora")
+    p.add_argument("pgn", nargs="*", help=".pgn / .pgn.gz / .pgn.zst files to sample (none: just show the table)")
+    p.add_argument("--sample", type=float, default=0.1, help="share of games kept (same games on every run)")
+    p.add_argument("--max-per-cell", type=int, default=20000, help="samples per rating band / perf type")
+    p.add_argument("--engines", type=int, default=0,
+                   help="Stockfish processes for games without [%%eval] comments (0: skip those games)")
+    p.add_argument("--processes", type=int, default=1,
+                   help="with --engines 0: PGN parsing processes (files / ranges of .pgn files in parallel)")
+    p.add_argument("--depth", type=int, default=12)
+    p.add_argument("--stockfish", default="stockfish.exe", help="path to Stockfish binary")
+    p.add_argument("--metric", default="accuracy", choices=METRIC_CHOICES)
+    p.add_argument("--out", default="data/baselines.npz")
+    p.set_defaults(func=cmd_baselines)
+
+    p = sub.add_parser("rag-index", help="embed new explanations / flagged plies into the retrieval index")
+    p.add_argument("--folder", default="cache/retrieval")
+    p.add_argument("--cache", default="cache/explanations.sqlite", help="explanation cache to ingest")
+    p.add_argument("--no-patterns", action="store_true", help="skip the pattern index (data/patterns.npz)")
+    p.set_defaults(func=cmd_rag_index)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
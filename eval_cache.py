@@ -0,0 +1,83 @@
+# eval_cache.py
+"""
+Persistent cache of engine evaluations, one entry per position.
+
+Key = normalized FEN (move counters dropped). Opening positions repeat
+across thousands of games of a corpus, so bulk jobs (baselines.py) search
+each of them once. An entry searched at least as deep as requested is a
+hit. Values are centipawns from white's perspective, with mates as the
+analyzers' ±10000 sentinel.
+"""
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Optional, Tuple
+
+from explanation_cache import normalize_fen
+
+
+class EvalCache:
+    def __init__(self, path: str = "cache/evals.sqlite"):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS evals ("
+            " fen TEXT PRIMARY KEY,"
+            " depth INTEGER NOT NULL,"
+            " cp INTEGER NOT NULL)"
+        )
+        self._db.commit()
+        self.hits = 0
+        self.misses = 0
+
+    # ---------- LOOKUP ----------
+    def get(self, fen: str, depth: int) -> Optional[int]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT cp FROM evals WHERE fen = ? AND depth >= ?", (normalize_fen(fen), depth)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def get_many(self, fens: Iterable[str], depth: int) -> Dict[str, int]:
+        """{normalized fen: cp} for the cached ones (one query per 500 positions)."""
+        keys = list({normalize_fen(f) for f in fens})
+        found = {}
+        with self._lock:
+            for i in range(0, len(keys), 500):
+                chunk = keys[i:i + 500]
+                rows = self._db.execute(
+                    f"SELECT fen, cp FROM evals WHERE depth >= ? AND fen IN ({','.join('?' * len(chunk))})",
+                    [depth] + chunk,
+                ).fetchall()
+                found.update(rows)
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    # ---------- STORE ----------
+    def put_many(self, entries: Iterable[Tuple[str, int, int]]):
+        """entries: (fen, depth, cp); deeper entries replace shallower ones."""
+        with self._lock:
+            self._db.executemany(
+                "INSERT INTO evals (fen, depth, cp) VALUES (?, ?, ?)"
+                " ON CONFLICT(fen) DO UPDATE SET depth = excluded.depth, cp = excluded.cp"
+                " WHERE excluded.depth > evals.depth",
+                [(normalize_fen(fen), depth, cp) for fen, depth, cp in entries],
+            )
+            self._db.commit()
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM evals").fetchone()[0]
+
+    def close(self):
+        self._db.close()
@@ -0,0 +1,108 @@
+# explanation_cache.py
+"""
+Persistent cache of LLM explanations, one entry per (position, move).
+
+Key = (normalized FEN, move UCI, model id, prompt version), so the same
+blunder in the same position is explained once across all games and players.
+Stored in a single sqlite file, size-bounded with least-recently-used eviction.
+The engine refutation is stored next to each explanation, so the retrieval
+index (retrieval_index.py) describes cached entries exactly like queries.
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+
+def normalize_fen(fen: str) -> str:
+    """Drop the move counters: the same position reached at another move number is the same key."""
+    return " ".join(fen.split()[:4])
+
+
+class ExplanationCache:
+    def __init__(self, path: str = "cache/explanations.sqlite", max_entries: int = 50000):
+        folder = os.path.dirname(path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS explanations ("
+            " fen TEXT NOT NULL,"
+            " move TEXT NOT NULL,"
+            " model TEXT NOT NULL,"
+            " prompt_version INTEGER NOT NULL,"
+            " text TEXT NOT NULL,"
+            " last_used REAL NOT NULL,"
+            " refutation TEXT NOT NULL DEFAULT '',"
+            " PRIMARY KEY (fen, move, model, prompt_version))"
+        )
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(explanations)")]
+        if "refutation" not in columns:
+            # caches written before the column existed: their entries keep an empty refutation
+            self._db.execute("ALTER TABLE explanations ADD COLUMN refutation TEXT NOT NULL DEFAULT ''")
+        self._db.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON explanations(last_used)")
+        self._db.commit()
+
+    # ---------- LOOKUP ----------
+    def get(self, fen: str, move: str, model: str, prompt_version: int) -> Optional[str]:
+        key = (normalize_fen(fen), move, model, prompt_version)
+        with self._lock:
+            row = self._db.execute(
+                "SELECT text FROM explanations"
+                " WHERE fen = ? AND move = ? AND model = ? AND prompt_version = ?",
+                key,
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute(
+                "UPDATE explanations SET last_used = ?"
+                " WHERE fen = ? AND move = ? AND model = ? AND prompt_version = ?",
+                (time.time(),) + key,
+            )
+            self._db.commit()
+        return row[0]
+
+    # ---------- STORE ----------
+    def put(self, fen: str, move: str, model: str, prompt_version: int, text: str, refutation: str = ""):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO explanations"
+                " (fen, move, model, prompt_version, text, last_used, refutation)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (normalize_fen(fen), move, model, prompt_version, text, time.time(), refutation or ""),
+            )
+            self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Drops the least recently used 10% once the cache is over max_entries."""
+        count = self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+        if count <= self.max_entries:
+            return
+        drop = count - self.max_entries + self.max_entries // 10
+        self._db.execute(
+            "DELETE FROM explanations WHERE rowid IN"
+            " (SELECT rowid FROM explanations ORDER BY last_used LIMIT ?)",
+            (drop,),
+        )
+
+    def items(self):
+        """All (fen, move, refutation, text) entries, latest prompt version first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT fen, move, refutation, text FROM explanations"
+                " ORDER BY prompt_version DESC, last_used DESC"
+            ).fetchall()
+        return rows
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM explanations").fetchone()[0]
+
+    def close(self):
+        self._db.close()
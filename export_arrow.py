@@ -0,0 +1,237 @@
+# export_arrow.py
+"""
+Columnar export of analysis results (Arrow IPC or Parquet).
+
+Two tables, written in record batches while results are produced:
+
+  games.arrow  — one row per game: ids, players, ratings, perf, opening,
+                 accuracy / CPL per side, mistake counts
+  plies.arrow  — one row per ply: game id, ply, move code, destination
+                 square, eval, mover delta, CPL, accuracy, classification,
+                 clock, time spent
+
+Arrow IPC files are read back memory-mapped (zero copy), so plots, heatmaps
+and notebook queries over millions of plies are a column scan.
+
+    with ResultsWriter("data/export") as writer:
+        analyze_latest_games(..., on_result=writer.write)
+
+pyarrow is an optional dependency: pip install pyarrow
+"""
+import os
+from typing import Optional
+
+import numpy as np
+
+from metrics import CLASS_NAMES, classify_deltas, mover_deltas
+from move_codes import to_squares
+
+
+EXPORT_DIR = "data/export"
+
+
+def _pa():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise RuntimeError("Columnar export needs pyarrow: pip install pyarrow")
+    return pa
+
+
+def games_schema():
+    pa = _pa()
+    return pa.schema([
+        ("game_id", pa.string()),
+        ("white", pa.string()),
+        ("black", pa.string()),
+        ("white_elo", pa.int16()),
+        ("black_elo", pa.int16()),
+        ("result", pa.string()),
+        ("perf_type", pa.string()),
+        ("date", pa.string()),
+        ("eco", pa.string()),
+        ("opening", pa.string()),
+        ("n_plies", pa.int16()),
+        ("accuracy", pa.float32()),
+        ("white_accuracy", pa.float32()),
+        ("black_accuracy", pa.float32()),
+        ("avg_cpl", pa.float32()),
+        ("white_cpl", pa.float32()),
+        ("black_cpl", pa.float32()),
+        ("inaccuracies", pa.int16()),
+        ("mistakes", pa.int16()),
+        ("blunders", pa.int16()),
+    ])
+
+
+def plies_schema():
+    pa = _pa()
+    return pa.schema([
+        ("game_id", pa.string()),
+        ("ply", pa.int16()),                 # 0-based
+        ("white_moved", pa.bool_()),
+        ("move_code", pa.uint16()),          # move_codes.py
+        ("to_square", pa.uint8()),
+        ("eval", pa.int32()),                # after the ply, white's perspective
+        ("delta", pa.int32()),               # mover's eval change
+        ("cpl", pa.float32()),
+        ("accuracy", pa.float32()),
+        ("classification", pa.int8()),       # index into metrics.CLASS_NAMES
+        ("clock", pa.float32()),             # seconds left after the ply (null if unknown)
+        ("time_spent", pa.float32()),        # seconds spent on the ply (null if unknown)
+    ])
+
+
+# ============================================================
+#   WRITER
+# ============================================================
+class ResultsWriter:
+    """
+    Streams GameAnalysisResult objects into games/plies files.
+    Rows are buffered and flushed as one record batch every `batch_games` games.
+    """
+
+    def __init__(self, folder: str = EXPORT_DIR, fmt: str = "arrow", batch_games: int = 256):
+        if fmt not in ("arrow", "parquet"):
+            raise ValueError("fmt must be 'arrow' or 'parquet'")
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+
+        self.folder = folder
+        self.fmt = fmt
+        self.batch_games = batch_games
+        self._games = []
+        self._plies = []
+        self._writers = {
+            "games": self._open("games", games_schema()),
+            "plies": self._open("plies", plies_schema()),
+        }
+
+    def _open(self, name, schema):
+        pa = _pa()
+        path = os.path.join(self.folder, f"{name}.{self.fmt}")
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+            return pq.ParquetWriter(path, schema, compression="zstd")
+        return pa.ipc.new_file(path, schema)
+
+    # ---------- ROWS ----------
+    def write(self, result):
+        pa = _pa()
+        n = len(result.cpl_list)
+        counts = (result.count_inacc, result.count_mist, result.count_blunder)
+        self._games.append({
+            "game_id": result.game_id,
+            "white": result.white,
+            "black": result.black,
+            "white_elo": getattr(result, "white_elo", None),
+            "black_elo": getattr(result, "black_elo", None),
+            "result": result.result,
+            "perf_type": getattr(result, "perf_type", None),
+            "date": getattr(result, "date", None),
+            "eco": getattr(result, "eco", None),
+            "opening": getattr(result, "opening", None),
+            "n_plies": n,
+            "accuracy": result.accuracy,
+            "white_accuracy": result.white_accuracy,
+            "black_accuracy": result.black_accuracy,
+            "avg_cpl": result.avg_cpl,
+            "white_cpl": result.white_cpl,
+            "black_cpl": result.black_cpl,
+            "inaccuracies": counts[0],
+            "mistakes": counts[1],
+            "blunders": counts[2],
+        })
+
+        ply = np.arange(n, dtype=np.int16)
+        white_moved = ply % 2 == 0
+        deltas = mover_deltas(result.cpl_list, white_moved)
+        codes = np.zeros(n, dtype=np.uint16)
+        known = np.asarray(result.move_codes, dtype=np.uint16)[:n]
+        codes[:len(known)] = known
+        clocks = getattr(result, "clocks", None)
+
+        columns = {
+            "game_id": pa.array([result.game_id] * n, pa.string()),
+            "ply": ply,
+            "white_moved": white_moved,
+            "move_code": codes,
+            "to_square": to_squares(codes).astype(np.uint8),
+            "eval": np.asarray(result.cpl_list, dtype=np.int32),
+            "delta": deltas.astype(np.int32),
+            "cpl": np.asarray(result.move_cpl, dtype=np.float32),
+            "accuracy": np.asarray(result.move_accuracy, dtype=np.float32),
+            "classification": classify_deltas(deltas),
+            "clock": self._clock_column(clocks, n),
+            "time_spent": self._clock_column(getattr(result, "time_spent", None), n),
+        }
+        self._plies.append(pa.RecordBatch.from_pydict(columns, schema=plies_schema()))
+
+        if len(self._games) >= self.batch_games:
+            self.flush()
+
+    @staticmethod
+    def _clock_column(clocks, n):
+        pa = _pa()
+        if clocks is None:
+            return pa.nulls(n, pa.float32())
+        values = np.full(n, np.nan, dtype=np.float32)
+        k = min(n, len(clocks))
+        values[:k] = clocks[:k]
+        return pa.array(values, mask=np.isnan(values) | (values < 0))
+
+    def flush(self):
+        pa = _pa()
+        if self._games:
+            batch = pa.RecordBatch.from_pylist(self._games, schema=games_schema())
+            self._writers["games"].write_batch(batch)
+            self._games = []
+        if self._plies:
+            table = pa.Table.from_batches(self._plies).combine_chunks()
+            for batch in table.to_batches():
+                self._writers["plies"].write_batch(batch)
+            self._plies = []
+
+    def close(self):
+        self.flush()
+        for writer in self._writers.values():
+            writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# ============================================================
+#   MEMORY-MAPPED READS
+# ============================================================
+def load_table(name: str, folder: str = EXPORT_DIR, columns: Optional[list] = None):
+    """games / plies table — Arrow IPC is memory-mapped, Parquet read with memory_map."""
+    pa = _pa()
+    arrow_path = os.path.join(folder, f"{name}.arrow")
+    if os.path.exists(arrow_path):
+        table = pa.ipc.open_file(pa.memory_map(arrow_path, "r")).read_all()
+        return table.select(columns) if columns else table
+
+    import pyarrow.parquet as pq
+    return pq.read_table(os.path.join(folder, f"{name}.parquet"), columns=columns, memory_map=True)
+
+
+def column(table, name):
+    """Column as a NumPy array (zero copy when there are no nulls)."""
+    return table.column(name).to_numpy()
+
+
+def top_blunders(folder: str = EXPORT_DIR, top_n: int = 10):
+    """Biggest blunders as (game_id, ply, delta) — the columnar TOP_BLUNDERS.txt."""
+    plies = load_table("plies", folder, ["game_id", "ply", "delta", "classification"])
+    cls = column(plies, "classification")
+    idx = np.flatnonzero(cls == CLASS_NAMES.index("Blunder"))
+    deltas = column(plies, "delta")[idx]
+    idx = idx[np.argsort(deltas, kind="stable")[:top_n]]
+    game_ids = plies.column("game_id").take(idx).to_pylist()
+    plies_at = column(plies, "ply")[idx]
+    deltas = column(plies, "delta")[idx]
+    return [(g, int(p), int(d)) for g, p, d in zip(game_ids, plies_at, deltas)]
@@ -0,0 +1,188 @@
+# heatmap_cube.py
+"""
+Persisted per-square heatmap cube of one player, sliced by day.
+
+For every (perf type, colour, day) the player's own moves are summed per
+destination square:
+
+    moves     — moves to the square
+    blunders  — blunders landing on the square
+    cpl_sum   — summed true CPL (metrics.py) of those moves
+
+stored as one dense float32 array
+
+    counts[perf, colour, day, metric, square]     (metric order: METRICS)
+
+with days counted from the player's first game. Prefix sums along the day
+axis are built once after loading or updating. A heatmap for any date
+range, perf type or colour is then prefix[end] - prefix[start - 1],
+summed over the selected perf / colour slices. That is a few 64-wide
+array operations, and no game is replayed.
+
+State lives in data/heatmaps/<username>.npz.
+"""
+import datetime
+import os
+from typing import Optional
+
+import numpy as np
+
+from metrics import classify_deltas, mover_deltas
+from move_codes import to_squares
+
+
+HEATMAPS_DIR = "data/heatmaps"
+PERFS = ("ultrabullet", "bullet", "blitz", "rapid", "classical", "correspondence", "unknown")
+COLORS = ("white", "black")
+METRICS = ("moves", "blunders", "cpl_sum")
+DAY_CHUNK = 64                # the day axis grows in chunks of this many days
+
+
+def day_number(date) -> Optional[int]:
+    """'2024.05.17' / datetime.date -> proleptic ordinal; None if unknown."""
+    if isinstance(date, datetime.date):
+        return date.toordinal()
+    try:
+        return datetime.datetime.strptime(str(date), "%Y.%m.%d").date().toordinal()
+    except ValueError:
+        return None
+
+
+class HeatmapCube:
+    def __init__(self, username: str, folder: str = HEATMAPS_DIR):
+        self.username = username
+        self.path = os.path.join(folder, f"{username.lower()}.npz")
+        self.seen = set()
+        self.day0 = None          # ordinal of day index 0
+        self.n_days = 0           # days in use (the array may be longer)
+        self.counts = np.zeros((len(PERFS), len(COLORS), 0, len(METRICS), 64), dtype=np.float32)
+        self._prefix = None
+
+    # ---------- PERSISTENCE ----------
+    @classmethod
+    def load(cls, username: str, folder: str = HEATMAPS_DIR):
+        cube = cls(username, folder)
+        if os.path.exists(cube.path):
+            with np.load(cube.path) as state:
+                cube.counts = state["counts"]
+                cube.n_days = cube.counts.shape[2]
+                cube.day0 = int(state["day0"]) if cube.n_days else None
+                cube.seen = set(state["seen"].tolist())
+        return cube
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp = self.path + ".tmp.npz"
+        np.savez_compressed(
+            tmp,
+            counts=self.counts[:, :, :self.n_days],
+            day0=np.int64(self.day0 or 0),
+            seen=np.array(sorted(self.seen), dtype=str),
+        )
+        os.replace(tmp, self.path)
+
+    # ---------- INCREMENTAL UPDATE ----------
+    def _zeros(self, days):
+        return np.zeros(self.counts.shape[:2] + (days,) + self.counts.shape[3:], dtype=np.float32)
+
+    def _day_index(self, day: int) -> int:
+        """Index of `day` on the day axis, growing the axis on either side when needed."""
+        if self.day0 is None:
+            self.day0 = day
+        if day < self.day0:
+            pad = -(-(self.day0 - day) // DAY_CHUNK) * DAY_CHUNK
+            self.counts = np.concatenate([self._zeros(pad), self.counts], axis=2)
+            self.day0 -= pad
+            self.n_days += pad
+        i = day - self.day0
+        if i >= self.counts.shape[2]:
+            grow = -(-(i + 1 - self.counts.shape[2]) // DAY_CHUNK) * DAY_CHUNK
+            self.counts = np.concatenate([self.counts, self._zeros(grow)], axis=2)
+        self.n_days = max(self.n_days, i + 1)
+        return i
+
+    def update(self, result) -> bool:
+        """
+        Adds the player's moves of one GameAnalysisResult. False if the game
+        was already counted, the player did not play in it, or it has no date.
+        """
+        color = result.color_of(self.username)
+        day = day_number(getattr(result, "date", None))
+        if color is None or day is None or result.game_id in self.seen:
+            return False
+        self.seen.add(result.game_id)
+
+        n = len(result.cpl_list)
+        squares = to_squares(np.asarray(result.move_codes)[:n]).astype(np.int64)
+        n = len(squares)
+        white_moved = np.arange(n) % 2 == 0
+        own = white_moved if color == "white" else ~white_moved
+        blunders = classify_deltas(mover_deltas(result.cpl_list[:n], white_moved)) == 3
+        cpl = np.asarray(result.move_cpl[:n], dtype=np.float64)
+
+        perf = getattr(result, "perf_type", "unknown")
+        p = PERFS.index(perf) if perf in PERFS else PERFS.index("unknown")
+        d = self._day_index(day)          # may reallocate self.counts
+        cell = self.counts[p, COLORS.index(color), d]
+        sq = squares[own]
+        cell[0] += np.bincount(sq, minlength=64)
+        cell[1] += np.bincount(squares[own & blunders], minlength=64)
+        cell[2] += np.bincount(sq, weights=cpl[own], minlength=64)
+        self._prefix = None
+        return True
+
+    def update_many(self, results) -> int:
+        return sum(self.update(r) for r in results)
+
+    # ---------- QUERIES ----------
+    def _prefix_sums(self):
+        if self._prefix is None:
+            # leading zero day, so prefix[i] = sum of days < i
+            used = self.counts[:, :, :self.n_days].astype(np.float64)
+            self._prefix = np.concatenate(
+                [np.zeros(used.shape[:2] + (1,) + used.shape[3:]), np.cumsum(used, axis=2)], axis=2
+            )
+        return self._prefix
+
+    def query(self, start=None, end=None, perf: Optional[str] = None, color: Optional[str] = None) -> dict:
+        """
+        Per-square arrays (64, a1..h8) for games played on start..end
+        (inclusive; dates, 'YYYY.MM.DD' strings or None for open ends):
+        moves, blunders, cpl_sum, avg_cpl.
+        """
+        prefix = self._prefix_sums()
+        empty = {name: np.zeros(64) for name in METRICS + ("avg_cpl",)}
+        if self.day0 is None:
+            return empty
+
+        for name, value in (("start", start), ("end", end)):
+            if value is not None and day_number(value) is None:
+                raise ValueError(f"invalid {name} date {value!r} (use YYYY.MM.DD)")
+        if perf is not None and perf not in PERFS:
+            raise ValueError(f"unknown perf type {perf!r} (one of {', '.join(PERFS)})")
+
+        lo = 0 if start is None else day_number(start) - self.day0
+        hi = self.n_days if end is None else day_number(end) - self.day0 + 1
+        lo, hi = max(lo, 0), min(hi, self.n_days)
+        if lo >= hi:
+            return empty
+
+        perfs = slice(None) if perf is None else PERFS.index(perf)
+        colors = slice(None) if color is None else COLORS.index(color)
+        window = prefix[perfs, colors, hi] - prefix[perfs, colors, lo]
+        totals = window.reshape(-1, len(METRICS), 64).sum(axis=0)
+
+        out = dict(zip(METRICS, totals))
+        out["avg_cpl"] = np.divide(out["cpl_sum"], out["moves"], out=np.zeros(64), where=out["moves"] > 0)
+        return out
+
+    def last_days(self, days: int, perf: Optional[str] = None, color: Optional[str] = None,
+                  today=None) -> dict:
+        today = day_number(today) if today is not None else datetime.date.today().toordinal()
+        start = datetime.date.fromordinal(today - days + 1)
+        return self.query(start, datetime.date.fromordinal(today), perf, color)
+
+    def __len__(self):
+        return len(self.seen)
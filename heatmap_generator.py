@@ -1,34 +1,53 @@
 #heatmap_generator.py
 import numpy as np
-import matplotlib.pyplot as plt
 import os
 import chess
+from move_codes import to_squares
 
 # ============================================================
 #   HEATMAP HELPER — ensure plots/heatmaps folder exists
 # ============================================================
-def ensure_dir():
-    if not os.path.exists("plots/heatmaps"):
-        os.makedirs("plots/heatmaps")
+def ensure_dir(out_dir="plots/heatmaps"):
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
+
+
+def square_grid(values):
+    """64 per-square values (a1..h8) -> 8x8 board grid, rank 8 on top."""
+    return np.asarray(values).reshape(8, 8)[::-1]
+
+
+def render_heatmap(grid, title, label, filename, out_dir="plots/heatmaps"):
+    import matplotlib.pyplot as plt
+
+    ensure_dir(out_dir)
+
+    plt.figure(figsize=(6, 6))
+    plt.imshow(grid, cmap="hot", interpolation="nearest")
+    plt.title(title)
+    plt.colorbar(label=label)
+    plt.xticks(range(8), list("abcdefgh"))
+    plt.yticks(range(8), list("87654321"))
+    plt.savefig(os.path.join(out_dir, filename))
+    plt.close()
 
 
 # ============================================================
 #   1) HEATMAP OF MOVE FREQUENCY PER SQUARE
 # ============================================================
-def heatmap_move_frequency(results):
-    ensure_dir()
+def heatmap_move_frequency(results, out_dir="plots/heatmaps"):
+    import matplotlib.pyplot as plt
+
+    ensure_dir(out_dir)
 
     freq = np.zeros((8, 8), dtype=int)
 
     for r in results:
-        game = r.pgn_game
-        board = game.board()
-        for move in game.mainline_moves():
-            square = move.to_square
+        # packed move codes — no Game tree needs to be rebuilt
+        for square in to_squares(r.move_codes):
             r_idx = 7 - chess.square_rank(square)
             c_idx = chess.square_file(square)
             freq[r_idx, c_idx] += 1
-            board.push(move)
 
     plt.figure(figsize=(6, 6))
     plt.imshow(freq, cmap="hot", interpolation="nearest")
@@ -36,7 +55,7 @@ def heatmap_move_frequency(results):
     plt.colorbar(label="Moves to Square")
     plt.xticks(range(8), list("abcdefgh"))
     plt.yticks(range(8), list("87654321"))
-    plt.savefig("plots/heatmaps/move_frequency.png")
+    plt.savefig(os.path.join(out_dir, "move_frequency.png"))
     plt.close()
 
 
@@ -58,8 +77,10 @@ def extract_square_from_mistake(msg):
         return None
 
 
-def heatmap_blunders(results):
-    ensure_dir()
+def heatmap_blunders(results, out_dir="plots/heatmaps"):
+    import matplotlib.pyplot as plt
+
+    ensure_dir(out_dir)
 
     freq = np.zeros((8, 8), dtype=int)
 
@@ -90,31 +111,33 @@ def heatmap_blunders(results):
     plt.colorbar(label="Blunders on Square")
     plt.xticks(range(8), list("abcdefgh"))
     plt.yticks(range(8), list("87654321"))
-    plt.savefig("plots/heatmaps/blunders.png")
+    plt.savefig(os.path.join(out_dir, "blunders.png"))
     plt.close()
 
 
 # ============================================================
 #   3) HEATMAP OF CENTIPAWN LOSS DISTRIBUTION
 # ============================================================
-def heatmap_cpl(results):
-    ensure_dir()
+def heatmap_cpl(results, out_dir="plots/heatmaps"):
+    import matplotlib.pyplot as plt
+
+    ensure_dir(out_dir)
 
     freq = np.zeros((8, 8), dtype=float)
     count = np.zeros((8, 8), dtype=int)
 
     for r in results:
-        game = r.pgn_game
-        board = game.board()
+        # true per-move CPL of the mover when available (metrics.py)
+        losses = getattr(r, "move_cpl", None)
+        if losses is None:
+            losses = r.cpl_list
 
-        for cp, move in zip(r.cpl_list, game.mainline_moves()):
-            square = move.to_square
+        for cp, square in zip(losses, to_squares(r.move_codes)):
             r_idx = 7 - chess.square_rank(square)
             c_idx = chess.square_file(square)
 
             freq[r_idx, c_idx] += abs(cp)
             count[r_idx, c_idx] += 1
-            board.push(move)
 
     avg_cpl = np.divide(freq, count, out=np.zeros_like(freq), where=(count != 0))
 
@@ -124,14 +147,91 @@ def heatmap_cpl(results):
     plt.colorbar(label="CPL")
     plt.xticks(range(8), list("abcdefgh"))
     plt.yticks(range(8), list("87654321"))
-    plt.savefig("plots/heatmaps/cpl_heatmap.png")
+    plt.savefig(os.path.join(out_dir, "cpl_heatmap.png"))
     plt.close()
 
 
+# ============================================================
+#   HEATMAPS FROM THE COLUMNAR EXPORT (export_arrow.py)
+# ============================================================
+def generate_heatmaps_from_table(plies, out_dir="plots/heatmaps"):
+    """
+    Same three heatmaps from a plies table (memory-mapped Arrow / Parquet):
+    one bincount over the to_square column each, no per-game loop.
+    """
+    squares = plies.column("to_square").to_numpy().astype(np.int64)
+    cpl = plies.column("cpl").to_numpy()
+    blunders = plies.column("classification").to_numpy() == 3
+
+    freq = np.bincount(squares, minlength=64)
+    render_heatmap(square_grid(freq), "Move Frequency Heatmap", "Moves to Square",
+                   "move_frequency.png", out_dir)
+
+    blunder_freq = np.bincount(squares[blunders], minlength=64)
+    render_heatmap(square_grid(blunder_freq), "Blunders Heatmap", "Blunders on Square",
+                   "blunders.png", out_dir)
+
+    cpl_sum = np.bincount(squares, weights=cpl, minlength=64)
+    avg_cpl = np.divide(cpl_sum, freq, out=np.zeros(64), where=(freq != 0))
+    render_heatmap(square_grid(avg_cpl), "Average CPL per Square", "CPL",
+                   "cpl_heatmap.png", out_dir)
+
+
+# ============================================================
+#   HEATMAPS FROM THE PERSISTED CUBE (heatmap_cube.py)
+# ============================================================
+def generate_heatmaps_from_cube(cube, start=None, end=None, perf=None, color=None,
+                                out_dir="plots/heatmaps"):
+    """The three heatmaps for one date range / perf / colour slice of a HeatmapCube."""
+    view = cube.query(start, end, perf, color)
+    scope = " ".join(str(x) for x in (perf, color, start and f"from {start}", end and f"to {end}") if x)
+    suffix = f" — {scope}" if scope else ""
+    render_heatmap(square_grid(view["moves"]), "Move Frequency" + suffix, "Moves to Square",
+                   "cube_move_frequency.png", out_dir)
+    render_heatmap(square_grid(view["blunders"]), "Blunders" + suffix, "Blunders on Square",
+                   "cube_blunders.png", out_dir)
+    render_heatmap(square_grid(view["avg_cpl"]), "Average CPL" + suffix, "CPL",
+                   "cube_cpl.png", out_dir)
+
+
+def render_range_comparison(cube, ranges=(("last 30 days", 30), ("last 365 days", 365)),
+                            perf=None, color=None, out_dir="plots/heatmaps",
+                            filename="heatmap_comparison.png"):
+    """
+    One row per (label, days) range: move share (%), blunders per 100 moves
+    and average CPL per square — normalized so ranges of different length compare.
+    """
+    import matplotlib.pyplot as plt
+
+    ensure_dir(out_dir)
+
+    fig, axes = plt.subplots(len(ranges), 3, figsize=(12, 4 * len(ranges)), squeeze=False)
+    for row, (label, days) in enumerate(ranges):
+        view = cube.last_days(days, perf, color)
+        total = view["moves"].sum()
+        panels = (
+            ("move share %", 100 * view["moves"] / max(total, 1)),
+            ("blunders / 100 moves", 100 * np.divide(view["blunders"], view["moves"],
+                                                     out=np.zeros(64), where=view["moves"] > 0)),
+            ("average CPL", view["avg_cpl"]),
+        )
+        for col, (name, values) in enumerate(panels):
+            ax = axes[row, col]
+            im = ax.imshow(square_grid(values), cmap="hot", interpolation="nearest")
+            ax.set_title(f"{label}: {name} ({int(total)} moves)", fontsize=9)
+            ax.set_xticks(range(8), list("abcdefgh"))
+            ax.set_yticks(range(8), list("87654321"))
+            fig.colorbar(im, ax=ax, fraction=0.046)
+    fig.suptitle(f"{cube.username}" + "".join(f" — {x}" for x in (perf, color) if x))
+    fig.subplots_adjust(wspace=0.35, hspace=0.3)     # tight_layout alone costs more than the rest
+    fig.savefig(os.path.join(out_dir, filename))
+    plt.close(fig)
+
+
 # ============================================================
 #   MASTER GENERATOR
 # ============================================================
-def generate_all_heatmaps(results):
-    heatmap_move_frequency(results)
-    heatmap_blunders(results)
-    heatmap_cpl(results)
+def generate_all_heatmaps(results, out_dir="plots/heatmaps"):
+    heatmap_move_frequency(results, out_dir)
+    heatmap_blunders(results, out_dir)
+    heatmap_cpl(results, out_dir)
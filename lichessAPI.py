@@ -2,19 +2,24 @@
 import requests
 from dataclasses import dataclass
 import json
-from typing import List, Optional
+from typing import Iterator, List, Optional
 
 
 @dataclass
 class LichessGame:
     game_id: str
     pgn: str
+    created_at: Optional[int] = None   # ms since epoch (Lichess createdAt)
+    last_move_at: Optional[int] = None  # ms since epoch (Lichess lastMoveAt) — when the game ended
 
 
+class RateLimitedError(RuntimeError):
+    """HTTP 429 — Lichess asks to wait a full minute before the next request."""
+
 
 class LichessClient:
-    def __init__(self, token: Optional[str] = None, timeout: int = 30):
-        self.base_url = "https://lichess.org/api"
+    def __init__(self, token: Optional[str] = None, timeout: int = 30, base_url: str = "https://lichess.org/api"):
+        self.base_url = base_url   # can point to a local stand-in server
         self.session = requests.Session()
         self.session.headers.update({"Accept": "application/x-ndjson"})  # <-- KLUCZOWE
         self.timeout = timeout
@@ -27,12 +32,14 @@ class LichessClient:
         max_games: int = 20,
         perf_type: Optional[str] = None,
         rated: Optional[bool] = None,
+        since: Optional[int] = None,
     ) -> List[LichessGame]:
         """
         Pobiera partie użytkownika z Lichess jako NDJSON stream.
         Zwraca listę obiektów LichessGame.
         Implementacja używa buforowego parsowania: łączy przychodzące chunki,
         dzieli po '\n' i parsuje tylko kompletne linie JSON.
+        since: only games created at/after this timestamp (ms).
         """
 
         url = f"{self.base_url}/games/user/{username}"
@@ -48,15 +55,49 @@ class LichessClient:
         if rated is not None:
             params["rated"] = "true" if rated else "false"
 
+        if since is not None:
+            params["since"] = since
+
         resp = self.session.get(url, params=params, stream=True, timeout=self.timeout)
 
+        if resp.status_code == 429:
+            raise RateLimitedError("Lichess API rate limit hit (HTTP 429).")
         if resp.status_code != 200:
             raise RuntimeError(f"Lichess API returned status {resp.status_code}: {resp.text[:300]}")
 
         games: List[LichessGame] = []
-        buffer = ""  
+        for obj in self._iter_ndjson(resp):
+            game_id = obj.get("id", "unknown")
+            pgn = obj.get("pgn", "")
+            games.append(LichessGame(game_id=game_id, pgn=pgn, created_at=obj.get("createdAt"),
+                                     last_move_at=obj.get("lastMoveAt")))
+
+        return games
+
+    def stream_game(self, game_id: str) -> Iterator[dict]:
+        """
+        Follows a game in progress (/api/stream/game/{id}).
+        First object = full game state (fen, players, status, ...),
+        next ones = one per ply: {"fen", "lm", "wc", "bc"}.
+        The connection stays open until the game ends, so there is no read timeout.
+        """
+        url = f"{self.base_url}/stream/game/{game_id}"
+        resp = self.session.get(url, stream=True, timeout=(self.timeout, None))
 
-        for chunk in resp.iter_content(chunk_size=8192):
+        if resp.status_code != 200:
+            raise RuntimeError(f"Lichess API returned status {resp.status_code}: {resp.text[:300]}")
+
+        # chunk_size=None -> every ply is handed over as soon as it arrives
+        yield from self._iter_ndjson(resp, chunk_size=None)
+
+    def _iter_ndjson(self, resp, chunk_size: Optional[int] = 8192) -> Iterator[dict]:
+        """
+        Buforowe parsowanie NDJSON: łączy przychodzące chunki,
+        dzieli po '\n' i zwraca tylko kompletne obiekty JSON.
+        """
+        buffer = ""
+
+        for chunk in resp.iter_content(chunk_size=chunk_size):
             if not chunk:
                 continue
             if isinstance(chunk, bytes):
@@ -72,25 +113,16 @@ class LichessClient:
                 if not text.startswith("{"):
                     continue
                 try:
-                    obj = json.loads(text)
+                    yield json.loads(text)
                 except json.JSONDecodeError:
 
                     continue
 
-                game_id = obj.get("id", "unknown")
-                pgn = obj.get("pgn", "")
-                games.append(LichessGame(game_id=game_id, pgn=pgn))
-
 
         tail = buffer.strip()
         if tail and tail.startswith("{"):
             try:
-                obj = json.loads(tail)
-                game_id = obj.get("id", "unknown")
-                pgn = obj.get("pgn", "")
-                games.append(LichessGame(game_id=game_id, pgn=pgn))
+                yield json.loads(tail)
             except json.JSONDecodeError:
 
                 pass
-
-        return games
\ No newline at end of file
@@ -0,0 +1,138 @@
+# live_analysis.py
+"""
+Live analysis of a game in progress.
+
+Follows the Lichess game stream (NDJSON, one object per ply), keeps one
+persistent board, evaluates every new position on a warm engine (the hash
+of the previous ply's search is kept) and emits one PlyEvent per ply,
+classified with the same thresholds as GameAnalyzer.classify_mistake.
+
+    python cli.py live GAME_ID
+"""
+import time
+from dataclasses import dataclass
+from typing import Iterable, Iterator, Optional
+
+import chess
+
+from analyzerChart import GameAnalyzer
+from lichessAPI import LichessClient
+from scheduler import interactive
+
+
+FINISHED_STATUSES = {
+    "mate", "resign", "stalemate", "timeout", "draw", "outoftime",
+    "cheat", "noStart", "aborted", "unknownFinish", "variantEnd",
+}
+
+
+@dataclass
+class PlyEvent:
+    ply: int                        # 1-based ply number of the game
+    san: str
+    uci: str
+    fen: str                        # position after the move
+    eval: int                       # centipawns, white's perspective
+    delta: int                      # eval change from the mover's perspective
+    classification: Optional[str]   # Inaccuracy / Mistake / Blunder / None
+    white_clock: Optional[int]      # seconds left, if the stream sends clocks
+    black_clock: Optional[int]
+    latency_ms: float               # stream arrival -> event emitted
+
+    def __str__(self):
+        move_no = (self.ply + 1) // 2
+        dots = "." if self.ply % 2 == 1 else "..."
+        tag = f" — {self.classification}" if self.classification else ""
+        return f"{move_no}{dots} {self.san:7} eval {self.eval:+6} (Δ = {self.delta:+5}){tag}  [{self.latency_ms:.0f} ms]"
+
+
+class LiveGameAnalyzer:
+    def __init__(self, analyzer: Optional[GameAnalyzer] = None, client: Optional[LichessClient] = None):
+        self.analyzer = analyzer or GameAnalyzer()
+        self.client = client or LichessClient()
+
+    # ---------- FOLLOW A LICHESS GAME ----------
+    def follow(self, game_id: str) -> Iterator[PlyEvent]:
+        return self.process(self.client.stream_game(game_id))
+
+    # ---------- PROCESS ANY EVENT STREAM ----------
+    def process(self, events: Iterable[dict]) -> Iterator[PlyEvent]:
+        """
+        events: the decoded NDJSON objects — first one is the game state,
+        then {"fen", "lm", "wc", "bc"} per ply. Any iterable works
+        (a local stand-in stream, a recorded file, ...).
+        """
+        board = None
+        ply = 0
+        prev_eval = 0
+
+        for obj in events:
+            received = time.perf_counter()
+
+            if board is None:
+                # first object: full game state — we may join mid-game
+                board = chess.Board(obj.get("fen") or chess.STARTING_FEN)
+                ply = obj.get("turns", 0)
+                prev_eval = self.analyzer.eval_position(board)   # new game -> ucinewgame
+                continue
+
+            if "lm" not in obj:
+                status = obj.get("status", {})
+                if isinstance(status, dict) and status.get("name") in FINISHED_STATUSES:
+                    return
+                continue
+
+            move = board.parse_uci(obj["lm"])
+            san = self.analyzer.safe_san(board, move)
+            board.push(move)
+            ply += 1
+            self._resync(board, obj.get("fen"))
+
+            cp = self.analyzer.eval_position(board, keep_hash=True)
+
+            # classify_mistake thresholds are for the mover: flip for black
+            if board.turn == chess.BLACK:
+                classification = self.analyzer.classify_mistake(prev_eval, cp)
+                delta = cp - prev_eval
+            else:
+                classification = self.analyzer.classify_mistake(-prev_eval, -cp)
+                delta = prev_eval - cp
+
+            yield PlyEvent(
+                ply=ply,
+                san=san,
+                uci=move.uci(),
+                fen=board.fen(),
+                eval=cp,
+                delta=delta,
+                classification=classification,
+                white_clock=obj.get("wc"),
+                black_clock=obj.get("bc"),
+                latency_ms=(time.perf_counter() - received) * 1000,
+            )
+            prev_eval = cp
+
+    def _resync(self, board, fen):
+        """The stream sends the board after each ply — if ours diverged, trust the stream."""
+        if not fen:
+            return
+        placement = fen.split()[0]
+        if placement == board.board_fen():
+            return
+        print(f"[WARN] Live board out of sync, resetting to stream FEN: {fen}")
+        if len(fen.split()) >= 4:
+            board.set_fen(fen)
+        else:
+            turn = board.turn
+            board.set_board_fen(placement)
+            board.turn = turn
+
+
+@interactive()
+def follow_game(game_id: str):
+    """Prints live classification events until the game ends."""
+    live = LiveGameAnalyzer()
+    print(f"[INFO] Following game {game_id} ...")
+    for event in live.follow(game_id):
+        print(event)
+    print("[INFO] Game finished.")
@@ -0,0 +1,248 @@
+# metrics.py
+"""
+Vectorized game metrics over per-ply evaluation arrays.
+
+Input: for every game, the engine eval AFTER each ply, in centipawns from
+white's perspective (mates as the analyzers' ±10000 sentinel) — exactly
+what GameAnalysisResult.cpl_list holds. A whole batch of games is
+flattened into one array and processed with NumPy at once:
+
+  - win probability (Lichess formula)
+  - true per-move centipawn loss from the mover's perspective
+  - Lichess-style move accuracy
+  - per-game / per-colour / per-phase averages via bincount
+  - clock metrics from the [%clk] values read in the same PGN pass:
+    time spent per ply, time-trouble and fast-move error counts
+"""
+from dataclasses import dataclass
+
+import numpy as np
+
+
+CPL_CAP = 1000          # evals are clipped like on Lichess (mate = ±1000 for CPL)
+INITIAL_EVAL = 0        # eval before the first move (same as the analyzers' prev_eval)
+
+# phase boundaries in plies: opening < 20 <= middlegame < 60 <= endgame
+PHASES = ("opening", "middlegame", "endgame")
+PHASE_PLY_BOUNDS = (20, 60)
+
+# same thresholds as GameAnalyzer.classify_mistake (mover's eval change)
+CLASS_NAMES = (None, "Inaccuracy", "Mistake", "Blunder")
+CLASS_DELTA_BOUNDS = (-300, -150, -50)
+
+# clock thresholds are shares of the base time, so bullet and rapid compare
+TIME_TROUBLE_SHARE = 0.10       # own clock before the move below 10% of the base
+FAST_MOVE_SHARE = 0.01          # under 1% of the base spent on the move ...
+FAST_MOVE_MIN_SECONDS = 1.0     # ... but at least this (premoves in bullet)
+
+
+# ============================================================
+#   ELEMENTWISE FORMULAS
+# ============================================================
+
+def win_probability(cp):
+    """Winning chances 0..100 for the side the eval is relative to."""
+    cp = np.clip(np.asarray(cp, dtype=np.float64), -CPL_CAP, CPL_CAP)
+    return 50 + 50 * (2 / (1 + np.exp(-0.00368208 * cp)) - 1)
+
+
+def move_accuracy(wp_before, wp_after):
+    """Lichess move accuracy from the mover's win% before/after the move."""
+    drop = np.maximum(0.0, np.asarray(wp_before) - np.asarray(wp_after))
+    return np.clip(103.1668 * np.exp(-0.04354 * drop) - 3.1669, 0, 100)
+
+
+def mover_deltas(evals, white_moved, before=None):
+    """Unclipped eval change of every ply from the mover's perspective (as in the mistake list)."""
+    evals = np.asarray(evals, dtype=np.float64)
+    if before is None:
+        before = np.concatenate(([INITIAL_EVAL], evals[:-1])) if evals.size else evals
+    return np.where(white_moved, 1.0, -1.0) * (evals - before)
+
+
+def classify_deltas(deltas):
+    """0 = fine, 1 = Inaccuracy, 2 = Mistake, 3 = Blunder (index into CLASS_NAMES)."""
+    # delta <= -300 -> 3, <= -150 -> 2, <= -50 -> 1
+    return (3 - np.searchsorted(CLASS_DELTA_BOUNDS, deltas, side="left")).clip(0, 3).astype(np.int8)
+
+
+def phase_of_ply(ply_index):
+    """0 = opening, 1 = middlegame, 2 = endgame (ply_index is 0-based)."""
+    return np.searchsorted(PHASE_PLY_BOUNDS, ply_index, side="right")
+
+
+# ============================================================
+#   BATCH METRICS
+# ============================================================
+
+@dataclass
+class BatchMetrics:
+    # per ply (flat over all games)
+    game_index: np.ndarray      # which game each ply belongs to
+    ply_index: np.ndarray       # 0-based ply inside its game
+    white_moved: np.ndarray     # bool
+    cpl: np.ndarray             # centipawn loss of the mover (>= 0)
+    win_prob: np.ndarray        # white's win% after the ply
+    accuracy: np.ndarray        # mover's move accuracy 0..100
+
+    # per game
+    n_plies: np.ndarray
+    ply_starts: np.ndarray          # offset of each game's first ply in the flat arrays
+    avg_cpl: np.ndarray             # both sides
+    accuracy_game: np.ndarray       # both sides
+    white_cpl: np.ndarray
+    black_cpl: np.ndarray
+    white_accuracy: np.ndarray
+    black_accuracy: np.ndarray
+    phase_cpl: np.ndarray           # shape (games, 3)
+    phase_accuracy: np.ndarray      # shape (games, 3), NaN where the phase was not reached
+
+    def game_slice(self, i):
+        """Per-ply arrays of game i."""
+        start = int(self.ply_starts[i])
+        return slice(start, start + int(self.n_plies[i]))
+
+
+def _grouped_mean(values, groups, n_groups, mask=None):
+    if mask is not None:
+        values, groups = values[mask], groups[mask]
+    sums = np.bincount(groups, weights=values, minlength=n_groups)
+    counts = np.bincount(groups, minlength=n_groups)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(counts > 0, sums / np.maximum(counts, 1), np.nan)
+
+
+def batch_metrics(eval_lists) -> BatchMetrics:
+    """eval_lists: sequence of per-game eval sequences (white's perspective, after each ply)."""
+    n_plies = np.fromiter((len(e) for e in eval_lists), dtype=np.int64, count=len(eval_lists))
+    n_games = len(n_plies)
+    total = int(n_plies.sum())
+
+    evals = np.zeros(total, dtype=np.float64)
+    if total:
+        evals = np.concatenate([np.asarray(e, dtype=np.float64) for e in eval_lists if len(e)])
+    evals = np.clip(evals, -CPL_CAP, CPL_CAP)
+
+    game_index = np.repeat(np.arange(n_games), n_plies)
+    starts = np.cumsum(n_plies) - n_plies
+    ply_index = np.arange(total) - np.repeat(starts, n_plies)
+    white_moved = ply_index % 2 == 0
+
+    before = np.empty_like(evals)
+    if total:
+        before[1:] = evals[:-1]
+        before[ply_index == 0] = INITIAL_EVAL
+
+    sign = np.where(white_moved, 1.0, -1.0)
+    cpl = np.maximum(0.0, sign * (before - evals))
+    accuracy = move_accuracy(win_probability(sign * before), win_probability(sign * evals))
+
+    phase = phase_of_ply(ply_index)
+    phase_groups = game_index * len(PHASES) + phase
+
+    return BatchMetrics(
+        game_index=game_index,
+        ply_index=ply_index,
+        white_moved=white_moved,
+        cpl=cpl,
+        win_prob=win_probability(evals),
+        accuracy=accuracy,
+        n_plies=n_plies,
+        ply_starts=starts,
+        avg_cpl=_grouped_mean(cpl, game_index, n_games),
+        accuracy_game=_grouped_mean(accuracy, game_index, n_games),
+        white_cpl=_grouped_mean(cpl, game_index, n_games, white_moved),
+        black_cpl=_grouped_mean(cpl, game_index, n_games, ~white_moved),
+        white_accuracy=_grouped_mean(accuracy, game_index, n_games, white_moved),
+        black_accuracy=_grouped_mean(accuracy, game_index, n_games, ~white_moved),
+        phase_cpl=_grouped_mean(cpl, phase_groups, n_games * len(PHASES)).reshape(n_games, len(PHASES)),
+        phase_accuracy=_grouped_mean(accuracy, phase_groups, n_games * len(PHASES)).reshape(n_games, len(PHASES)),
+    )
+
+
+def game_metrics(evals) -> BatchMetrics:
+    """batch_metrics for a single game."""
+    return batch_metrics([evals])
+
+
+# ============================================================
+#   CLOCK METRICS
+# ============================================================
+
+def time_spent(clocks, base, increment=0):
+    """
+    clocks: mover's clock after each ply in seconds (<0 = unknown), as in
+    GameAnalysisResult.clocks. Returns (own clock before each ply, seconds
+    spent on it), NaN where a clock is missing.
+    """
+    after = np.asarray(clocks, dtype=np.float64)
+    after = np.where(after < 0, np.nan, after)
+    before = np.empty_like(after)
+    before[:2] = base
+    before[2:] = after[:-2]
+    # the [%clk] after a move already includes the increment
+    return before, np.maximum(0.0, before - after + increment)
+
+
+@dataclass
+class ClockMetrics:
+    time_spent: np.ndarray      # per ply, seconds (NaN = unknown)
+    time_trouble: np.ndarray    # per ply, bool
+    fast: np.ndarray            # per ply, bool
+    per_color: dict             # "white" / "black" -> counters (sums, so they aggregate)
+
+
+def clock_metrics(clocks, evals, base, increment=0) -> ClockMetrics:
+    """
+    Time-trouble and fast-move stats of one game. Errors are plies classified
+    Mistake or Blunder (same thresholds as the mistake list).
+    """
+    n = min(len(clocks), len(evals))
+    ply_index = np.arange(n)
+    white_moved = ply_index % 2 == 0
+    before, spent = time_spent(np.asarray(clocks)[:n], base, increment)
+    known = ~np.isnan(spent)
+
+    with np.errstate(invalid="ignore"):
+        trouble = known & (before < TIME_TROUBLE_SHARE * base)
+        fast = known & (spent < max(FAST_MOVE_MIN_SECONDS, FAST_MOVE_SHARE * base))
+    classes = classify_deltas(mover_deltas(np.asarray(evals)[:n], white_moved))
+    error = classes >= 2
+    phase = phase_of_ply(ply_index)
+
+    per_color = {}
+    for color, side in (("white", white_moved), ("black", ~white_moved)):
+        m = side & known
+        per_color[color] = {
+            "clocked_moves": int(m.sum()),
+            "errors": int((m & error).sum()),
+            "time_trouble_moves": int((m & trouble).sum()),
+            "time_trouble_errors": int((m & trouble & error).sum()),
+            "fast_moves": int((m & fast).sum()),
+            "fast_blunders": int((m & fast & (classes == 3)).sum()),
+            "phase_seconds": np.bincount(phase[m], weights=spent[m], minlength=len(PHASES)).tolist(),
+            "phase_moves": np.bincount(phase[m], minlength=len(PHASES)).tolist(),
+        }
+    return ClockMetrics(spent, trouble, fast, per_color)
+
+
+def clock_summary(stats) -> dict:
+    """Rates from clock_metrics counters (one game or summed over many)."""
+    moves = stats["clocked_moves"]
+    tt_moves = stats["time_trouble_moves"]
+    calm_moves = moves - tt_moves
+
+    def pct(a, b):
+        return 100.0 * a / b if b else None
+
+    return {
+        "clocked_moves": moves,
+        "time_trouble_share": pct(tt_moves, moves),
+        "time_trouble_error_pct": pct(stats["time_trouble_errors"], tt_moves),
+        "calm_error_pct": pct(stats["errors"] - stats["time_trouble_errors"], calm_moves),
+        "fast_blunder_pct": pct(stats["fast_blunders"], stats["fast_moves"]),
+        "phase_seconds_per_move": {
+            phase: (t / k if k else None)
+            for phase, t, k in zip(PHASES, stats["phase_seconds"], stats["phase_moves"])
+        },
+    }
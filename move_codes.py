@@ -0,0 +1,33 @@
+# move_codes.py
+"""
+16-bit move codes: from_square | to_square << 6 | promotion << 12.
+
+A game is stored as a numpy uint16 array instead of a tree of
+chess.pgn node objects (2 bytes per ply instead of ~1 KB).
+"""
+import numpy as np
+import chess
+
+
+def encode_move(move: chess.Move) -> int:
+    return move.from_square | (move.to_square << 6) | ((move.promotion or 0) << 12)
+
+
+def decode_move(code: int) -> chess.Move:
+    code = int(code)
+    promotion = (code >> 12) & 0x7
+    return chess.Move(code & 0x3F, (code >> 6) & 0x3F, promotion or None)
+
+
+def encode_moves(moves) -> np.ndarray:
+    return np.fromiter((encode_move(m) for m in moves), dtype=np.uint16)
+
+
+def decode_moves(codes):
+    for code in codes:
+        yield decode_move(code)
+
+
+def to_squares(codes) -> np.ndarray:
+    """Destination square of every move, vectorized."""
+    return (np.asarray(codes, dtype=np.uint16) >> 6) & 0x3F
@@ -0,0 +1,221 @@
+# opening_tree.py
+"""
+Opening tree of one player, built from already analysed games.
+
+A trie over 16-bit move codes (move_codes.py), one root per colour the
+player had. Every node is the position after a move sequence and keeps:
+
+  - games        how many of the player's games went through it
+  - score        the player's points from those games
+  - eval_sum     sum of the eval after the move (player's perspective, capped)
+  - mover_moves  how many times the player made the move into this node
+  - mistakes     ... of which were an Inaccuracy / Mistake / Blunder
+  - cpl_sum      player's centipawn loss on that move
+
+Nodes live in flat NumPy columns, so adding a game is O(plies) and
+"worst branches" is one vectorized pass over all nodes. Only the evals the
+analyzers already stored (GameAnalysisResult.cpl_list) are used — no
+engine calls.
+
+State lives in data/openings/<username>.npz.
+"""
+import os
+from typing import List, Optional
+
+import chess
+import numpy as np
+
+from aggregates import _player_score
+from metrics import CPL_CAP, classify_deltas, mover_deltas
+from move_codes import decode_move, encode_move
+
+
+OPENINGS_DIR = "data/openings"
+DEFAULT_DEPTH = 24           # plies kept per game
+COLORS = ("white", "black")  # node 0 = white root, node 1 = black root
+
+_STAT_COLUMNS = ("games", "score", "eval_sum", "mover_moves", "mistakes", "cpl_sum")
+
+
+class OpeningTree:
+    def __init__(self, username: str, max_depth: int = DEFAULT_DEPTH, folder: str = OPENINGS_DIR):
+        self.username = username
+        self.max_depth = max_depth
+        self.path = os.path.join(folder, f"{username.lower()}.npz")
+        self.seen = set()
+
+        self.size = len(COLORS)
+        capacity = 1024
+        self.parent = np.full(capacity, -1, dtype=np.int32)
+        self.code = np.zeros(capacity, dtype=np.uint16)
+        self.depth = np.zeros(capacity, dtype=np.uint8)
+        self.root = np.arange(capacity, dtype=np.uint8) % len(COLORS)
+        self.stats = {name: np.zeros(capacity, dtype=np.float64) for name in _STAT_COLUMNS}
+        self._children = {}     # parent * 65536 + code -> node
+
+    # ---------- STORAGE ----------
+    def _grow(self):
+        capacity = 2 * len(self.parent)
+        self.parent = np.resize(self.parent, capacity)
+        self.code = np.resize(self.code, capacity)
+        self.depth = np.resize(self.depth, capacity)
+        self.root = np.resize(self.root, capacity)
+        for name, column in self.stats.items():
+            grown = np.zeros(capacity, dtype=column.dtype)
+            grown[:self.size] = column[:self.size]
+            self.stats[name] = grown
+
+    def _child(self, node: int, code: int) -> int:
+        key = node * 65536 + code
+        child = self._children.get(key)
+        if child is None:
+            if self.size == len(self.parent):
+                self._grow()
+            child = self.size
+            self.size += 1
+            self.parent[child] = node
+            self.code[child] = code
+            self.depth[child] = self.depth[node] + 1
+            self.root[child] = self.root[node]
+            for column in self.stats.values():
+                column[child] = 0.0
+            self._children[key] = child
+        return child
+
+    @classmethod
+    def load(cls, username: str, max_depth: int = DEFAULT_DEPTH, folder: str = OPENINGS_DIR):
+        tree = cls(username, max_depth, folder)
+        if os.path.exists(tree.path):
+            with np.load(tree.path) as state:
+                tree.size = int(state["parent"].size)
+                tree.parent = state["parent"].copy()
+                tree.code = state["code"].copy()
+                tree.depth = state["depth"].copy()
+                tree.root = state["root"].copy()
+                tree.stats = {name: state[name].copy() for name in _STAT_COLUMNS}
+                tree.seen = set(state["seen"].tolist())
+            tree._children = {
+                int(p) * 65536 + int(c): i
+                for i, (p, c) in enumerate(zip(tree.parent[:tree.size], tree.code[:tree.size]))
+                if p >= 0
+            }
+        return tree
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        n = self.size
+        tmp = self.path + ".tmp.npz"
+        np.savez(
+            tmp,
+            parent=self.parent[:n], code=self.code[:n], depth=self.depth[:n], root=self.root[:n],
+            seen=np.array(sorted(self.seen), dtype=str),
+            **{name: column[:n] for name, column in self.stats.items()},
+        )
+        os.replace(tmp, self.path)
+
+    # ---------- INCREMENTAL UPDATE ----------
+    def update(self, result) -> bool:
+        """Adds one GameAnalysisResult. False if already counted or not the player's game."""
+        color = result.color_of(self.username)
+        if color is None or result.game_id in self.seen or "FEN" in result.headers:
+            return False
+        self.seen.add(result.game_id)
+
+        n = min(self.max_depth, len(result.move_codes), len(result.cpl_list))
+        evals = result.cpl_list[:n]
+        white_moved = np.arange(n) % 2 == 0
+        classes = classify_deltas(mover_deltas(evals, white_moved))
+        cpl = np.asarray(getattr(result, "move_cpl", np.zeros(n)))[:n]
+
+        sign = 1 if color == "white" else -1
+        player_moved = white_moved if color == "white" else ~white_moved
+        score = _player_score(result.result, color)
+
+        stats = self.stats
+        node = COLORS.index(color)
+        stats["games"][node] += 1
+        stats["score"][node] += score
+        for ply in range(n):
+            node = self._child(node, int(result.move_codes[ply]))
+            stats["games"][node] += 1
+            stats["score"][node] += score
+            stats["eval_sum"][node] += sign * max(-CPL_CAP, min(CPL_CAP, int(evals[ply])))
+            if player_moved[ply]:
+                stats["mover_moves"][node] += 1
+                stats["mistakes"][node] += classes[ply] > 0
+                stats["cpl_sum"][node] += cpl[ply]
+        return True
+
+    def update_many(self, results) -> int:
+        return sum(self.update(r) for r in results)
+
+    # ---------- QUERIES ----------
+    def find(self, moves, color: str = "white") -> Optional[int]:
+        """Node of a move sequence (SAN strings or chess.Move) from the given root."""
+        board = chess.Board()
+        node = COLORS.index(color)
+        for move in moves:
+            if isinstance(move, str):
+                move = board.parse_san(move)
+            node = self._children.get(node * 65536 + encode_move(move))
+            if node is None:
+                return None
+            board.push(move)
+        return node
+
+    def line(self, node: int) -> List[str]:
+        """SAN moves from the root to `node`."""
+        codes = []
+        while self.parent[node] >= 0:
+            codes.append(int(self.code[node]))
+            node = int(self.parent[node])
+        board = chess.Board()
+        sans = []
+        for code in reversed(codes):
+            move = decode_move(code)
+            sans.append(board.san(move))
+            board.push(move)
+        return sans
+
+    def node_stats(self, node: int) -> dict:
+        s = {name: float(column[node]) for name, column in self.stats.items()}
+        games = max(1.0, s["games"])
+        moves = max(1.0, s["mover_moves"])
+        return {
+            "line": self.line(node),
+            "color": COLORS[self.root[node]],
+            "games": int(s["games"]),
+            "score_pct": 100.0 * s["score"] / games,
+            "avg_eval": s["eval_sum"] / games,
+            "mistake_rate": s["mistakes"] / moves if s["mover_moves"] else 0.0,
+            "avg_cpl": s["cpl_sum"] / moves if s["mover_moves"] else 0.0,
+        }
+
+    def children(self, node: int) -> List[dict]:
+        """Stats of every continuation from `node`, most played first."""
+        kids = np.flatnonzero(self.parent[:self.size] == node)
+        kids = kids[np.argsort(-self.stats["games"][kids], kind="stable")]
+        return [self.node_stats(int(k)) for k in kids]
+
+    def worst_branches(self, min_games: int = 3, top_n: int = 10, color: Optional[str] = None):
+        """
+        Moves of the player that most often were a mistake (then lowest eval),
+        among nodes reached in at least `min_games` games.
+        """
+        n = self.size
+        games = self.stats["games"][:n]
+        moves = self.stats["mover_moves"][:n]
+        mask = (games >= min_games) & (moves > 0)
+        if color is not None:
+            mask &= self.root[:n] == COLORS.index(color)
+
+        idx = np.flatnonzero(mask)
+        rate = self.stats["mistakes"][idx] / moves[idx]
+        avg_eval = self.stats["eval_sum"][idx] / games[idx]
+        order = np.lexsort((avg_eval, -rate))[:top_n]
+        return [self.node_stats(int(i)) for i in idx[order]]
+
+    def __len__(self):
+        return self.size
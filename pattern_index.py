@@ -0,0 +1,230 @@
+# pattern_index.py
+"""
+Cross-game index of flagged plies (position_features.py).
+
+One row per Inaccuracy / Mistake / Blunder: the feature vector goes into a
+float32 matrix, tags into a uint32 column, the rest (game, player, ply,
+SAN, FEN, refutation + engine line, delta) into parallel columns. Queries are NumPy
+passes over those columns:
+
+  - filter(...)        rows with given tags / player / minimum severity
+  - tag_counts(...)    "how often do I drop a piece to a knight fork?"
+  - motif_groups(...)  recurring mistake types = identical tag signatures
+  - nearest(...)       k most similar rows (standardized L2 distance)
+
+State lives in data/patterns.npz; rows are appended incrementally.
+"""
+import os
+from typing import List, Optional
+
+import chess
+import numpy as np
+
+from position_features import FEATURE_NAMES, TAGS, tag_names
+
+
+PATTERNS_PATH = "data/patterns.npz"
+
+CLASS_LEVEL = {"Inaccuracy": 1, "Mistake": 2, "Blunder": 3}
+
+_META_COLUMNS = ("game_id", "player", "san", "fen", "uci", "refutation", "classification", "pv")
+
+
+def _tag_mask(tags):
+    """TAGS names (or an int bit set) -> bit set."""
+    if isinstance(tags, int):
+        return tags
+    mask = 0
+    for name in tags:
+        if name not in TAGS:
+            raise ValueError(f"Unknown tag: {name} (known: {', '.join(TAGS)})")
+        mask |= TAGS[name]
+    return mask
+
+
+class PatternIndex:
+    def __init__(self, path: str = PATTERNS_PATH):
+        self.path = path
+        self.seen = set()
+        self.vectors = np.zeros((0, len(FEATURE_NAMES)), dtype=np.float32)
+        self.tags = np.zeros(0, dtype=np.uint32)
+        self.level = np.zeros(0, dtype=np.int8)
+        self.delta = np.zeros(0, dtype=np.int32)
+        self.ply = np.zeros(0, dtype=np.int16)
+        self.meta = {name: np.zeros(0, dtype=str) for name in _META_COLUMNS}
+        self._pending = []
+        self._scale = None
+        self._points = None
+
+    # ---------- PERSISTENCE ----------
+    @classmethod
+    def load(cls, path: str = PATTERNS_PATH):
+        index = cls(path)
+        if os.path.exists(path):
+            with np.load(path) as state:
+                index.vectors = state["vectors"]
+                index.tags = state["tags"]
+                index.level = state["level"]
+                index.delta = state["delta"]
+                index.ply = state["ply"]
+                # files written before a column existed get it empty
+                index.meta = {
+                    name: state[name] if name in state.files else np.full(len(index.tags), "", dtype=str)
+                    for name in _META_COLUMNS
+                }
+                index.seen = set(state["seen"].tolist())
+        return index
+
+    def save(self):
+        self._consolidate()
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp = self.path + ".tmp.npz"
+        np.savez(
+            tmp,
+            vectors=self.vectors, tags=self.tags, level=self.level,
+            delta=self.delta, ply=self.ply,
+            seen=np.array(sorted(self.seen), dtype=str),
+            **self.meta,
+        )
+        os.replace(tmp, self.path)
+
+    # ---------- INCREMENTAL UPDATE ----------
+    def add_result(self, result, player: Optional[str] = None) -> int:
+        """
+        Adds the flagged plies of one GameAnalysisResult (result.patterns).
+        player: only that player's mistakes (None = both sides).
+        """
+        if result.game_id in self.seen:
+            return 0
+        self.seen.add(result.game_id)
+
+        color = result.color_of(player) if player else None
+        if player and color is None:
+            return 0
+
+        added = 0
+        for p in getattr(result, "patterns", []):
+            mover = "white" if p.ply % 2 == 1 else "black"
+            if color is not None and mover != color:
+                continue
+            name = result.white if mover == "white" else result.black
+            self._pending.append((p, result.game_id, name))
+            added += 1
+        return added
+
+    def update_many(self, results, player: Optional[str] = None) -> int:
+        return sum(self.add_result(r, player) for r in results)
+
+    def _consolidate(self):
+        if not self._pending:
+            return
+        rows = self._pending
+        self._pending = []
+
+        self.vectors = np.vstack([self.vectors, np.stack([p.vector for p, _, _ in rows])])
+        self.tags = np.concatenate([self.tags, np.array([p.tags for p, _, _ in rows], dtype=np.uint32)])
+        self.level = np.concatenate([
+            self.level, np.array([CLASS_LEVEL.get(p.classification, 0) for p, _, _ in rows], dtype=np.int8)
+        ])
+        self.delta = np.concatenate([self.delta, np.array([p.delta for p, _, _ in rows], dtype=np.int32)])
+        self.ply = np.concatenate([self.ply, np.array([p.ply for p, _, _ in rows], dtype=np.int16)])
+
+        new_meta = {
+            "game_id": [g for _, g, _ in rows],
+            "player": [name.lower() for _, _, name in rows],
+            "san": [p.san for p, _, _ in rows],
+            "fen": [p.fen for p, _, _ in rows],
+            "uci": [p.uci for p, _, _ in rows],
+            "refutation": [p.refutation for p, _, _ in rows],
+            "classification": [p.classification for p, _, _ in rows],
+            "pv": [p.pv for p, _, _ in rows],
+        }
+        for name, values in new_meta.items():
+            self.meta[name] = np.concatenate([self.meta[name], np.array(values, dtype=str)])
+        self._scale = None
+        self._points = None
+
+    def __len__(self):
+        return len(self.tags) + len(self._pending)
+
+    # ---------- QUERIES ----------
+    def filter(self, tags=(), player: Optional[str] = None, min_class: str = "Inaccuracy") -> np.ndarray:
+        """Row indices having all `tags`, by `player`, at least `min_class` severe."""
+        self._consolidate()
+        mask = self.level >= CLASS_LEVEL[min_class]
+        bits = _tag_mask(tags)
+        if bits:
+            mask &= (self.tags & bits) == bits
+        if player:
+            mask &= self.meta["player"] == player.lower()
+        return np.flatnonzero(mask)
+
+    def tag_counts(self, tags=(), player: Optional[str] = None, min_class: str = "Inaccuracy") -> dict:
+        """How many flagged plies carry each tag."""
+        idx = self.filter(tags, player, min_class)
+        tags = self.tags[idx]
+        return {name: int(np.count_nonzero(tags & bit)) for name, bit in TAGS.items()}
+
+    def motif_groups(self, tags=(), player: Optional[str] = None, min_class: str = "Mistake", top_n: int = 10):
+        """Most frequent tag signatures: [(tag names, count, row indices)]."""
+        idx = self.filter(tags, player, min_class)
+        signatures, inverse, counts = np.unique(self.tags[idx], return_inverse=True, return_counts=True)
+        order = np.argsort(-counts, kind="stable")[:top_n]
+        return [
+            (tag_names(int(signatures[g])), int(counts[g]), idx[inverse == g])
+            for g in order
+        ]
+
+    def _scaled(self):
+        """Feature matrix divided by the per-feature std (computed once per consolidation)."""
+        if self._points is None:
+            std = self.vectors.std(axis=0)
+            self._scale = np.where(std > 0, 1.0 / np.maximum(std, 1e-6), 1.0).astype(np.float32)
+            self._points = self.vectors * self._scale
+        return self._points
+
+    def nearest(self, vector, tags: int = 0, k: int = 5, player: Optional[str] = None,
+                exclude_fen: Optional[str] = None) -> np.ndarray:
+        """
+        k most similar rows to a feature vector. Sharing tags counts as closeness
+        (each differing tag adds 1 to the squared distance).
+        """
+        self._consolidate()
+        if not len(self.tags):
+            return np.zeros(0, dtype=np.int64)
+
+        points = self._scaled()
+        query = np.asarray(vector, dtype=np.float32) * self._scale
+        dist = ((points - query) ** 2).sum(axis=1)
+        differing = np.bitwise_xor(self.tags, np.uint32(tags))
+        dist += np.unpackbits(differing.view(np.uint8)).reshape(-1, 32).sum(axis=1)
+
+        if player:
+            dist[self.meta["player"] != player.lower()] = np.inf
+        if exclude_fen:
+            dist[self.meta["fen"] == exclude_fen] = np.inf
+
+        k = min(k, int(np.isfinite(dist).sum()))
+        if k == 0:
+            return np.zeros(0, dtype=np.int64)
+        idx = np.argpartition(dist, k - 1)[:k]
+        return idx[np.argsort(dist[idx], kind="stable")]
+
+    def row(self, i: int) -> dict:
+        row = {name: str(column[i]) for name, column in self.meta.items()}
+        row.update({
+            "ply": int(self.ply[i]),
+            "delta": int(self.delta[i]),
+            "tags": tag_names(int(self.tags[i])),
+            "refutation_san": "",
+        })
+        if row["refutation"]:
+            board = chess.Board(row["fen"])
+            board.push(chess.Move.from_uci(row["uci"]))
+            row["refutation_san"] = board.san(chess.Move.from_uci(row["refutation"]))
+        return row
+
+    def rows(self, indices) -> List[dict]:
+        return [self.row(int(i)) for i in indices]
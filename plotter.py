@@ -1,6 +1,8 @@
 import os
 import re
-import matplotlib.pyplot as plt
+
+# matplotlib is imported lazily inside the plotting functions —
+# it is by far the slowest import of the whole tool.
 
 
 
@@ -9,10 +11,10 @@ import matplotlib.pyplot as plt
 #   HELPERS
 # ============================================================
 
-def ensure_plots_dir():
-    """Creates the 'plots' directory if it does not already exist."""
-    if not os.path.exists("plots"):
-        os.makedirs("plots")
+def ensure_plots_dir(out_dir="plots"):
+    """Creates the 'plots' directory (or out_dir) if it does not already exist."""
+    if not os.path.exists(out_dir):
+        os.makedirs(out_dir)
 
 
 def safe_game_id(game_id):
@@ -37,9 +39,9 @@ def extract_delta(text):
 #   TOP BLUNDERS RANKING
 # ============================================================
 
-def generate_top_blunders(results, top_n=10):
+def generate_top_blunders(results, top_n=10, out_dir="plots"):
     """Creates a global TOP_BLUNDERS.txt ranking based on Δ values."""
-    ensure_plots_dir()
+    ensure_plots_dir(out_dir)
 
     all_blunders = []
 
@@ -52,7 +54,7 @@ def generate_top_blunders(results, top_n=10):
     # Sort by biggest Δ first
     all_blunders.sort(reverse=True, key=lambda x: x[0])
 
-    output_file = "plots/TOP_BLUNDERS.txt"
+    output_file = os.path.join(out_dir, "TOP_BLUNDERS.txt")
     with open(output_file, "w", encoding="utf-8") as f:
         f.write("=== TOP BLUNDERS (GLOBAL) ===\n\n")
         for delta, gid, msg in all_blunders[:top_n]:
@@ -64,12 +66,14 @@ def generate_top_blunders(results, top_n=10):
 #   ACCURACY PLOT
 # ============================================================
 
-def generate_accuracy_plot(results):
+def generate_accuracy_plot(results, out_dir="plots"):
     """
     Generates a single line plot showing accuracy trend over all games.
     Requires each game to have .accuracy field.
     """
-    ensure_plots_dir()
+    import matplotlib.pyplot as plt
+
+    ensure_plots_dir(out_dir)
 
     try:
         accuracies = [g.accuracy for g in results]
@@ -84,7 +88,26 @@ def generate_accuracy_plot(results):
     plt.ylabel("Accuracy (%)")
     plt.grid(True)
 
-    plt.savefig("plots/ACCURACY_TREND.png")
+    plt.savefig(os.path.join(out_dir, "ACCURACY_TREND.png"))
+    plt.close()
+
+
+def generate_accuracy_plot_from_table(games, out_dir="plots"):
+    """Accuracy trend from a games table (export_arrow.load_table("games"))."""
+    import matplotlib.pyplot as plt
+
+    ensure_plots_dir(out_dir)
+
+    accuracies = games.column("accuracy").to_numpy()
+
+    plt.figure(figsize=(10, 4))
+    plt.plot(accuracies)
+    plt.title("Accuracy Trend Across Games")
+    plt.xlabel("Game Index")
+    plt.ylabel("Accuracy (%)")
+    plt.grid(True)
+
+    plt.savefig(os.path.join(out_dir, "ACCURACY_TREND.png"))
     plt.close()
 
 
@@ -92,29 +115,162 @@ def generate_accuracy_plot(results):
 #   CPL PLOTS PER GAME
 # ============================================================
 
-def generate_cpl_plots(results):
+def generate_cpl_plots(results, out_dir="plots"):
     """Generates a CPL plot for each game."""
-    ensure_plots_dir()
+    import matplotlib.pyplot as plt
+
+    ensure_plots_dir(out_dir)
 
     for game in results:
-        if not hasattr(game, "cpl_list") or not game.cpl_list:
+        if not hasattr(game, "cpl_list") or len(game.cpl_list) == 0:
             print(f"[WARN] Game {game.game_id} has no cpl_list — skipping CPL plot.")
             continue
 
         safe_id = safe_game_id(game.game_id)
-        filename = f"plots/CPL_{safe_id}.png"
+        filename = os.path.join(out_dir, f"CPL_{safe_id}.png")
+
+        # true per-move loss of the mover (metrics.py), raw evals for older objects
+        cpl = getattr(game, "move_cpl", None)
+        if cpl is None:
+            cpl = game.cpl_list
 
         plt.figure(figsize=(10, 4))
-        plt.plot(game.cpl_list)
+        plt.plot(range(0, len(cpl), 2), cpl[0::2], label=game.white)
+        plt.plot(range(1, len(cpl), 2), cpl[1::2], label=game.black)
         plt.title(f"CPL – {game.white} vs {game.black}")
-        plt.xlabel("Move Number")
+        plt.xlabel("Ply")
         plt.ylabel("Centipawn Loss")
+        plt.legend()
         plt.grid(True)
         plt.savefig(filename)
         plt.close()
 
 
 
+# ============================================================
+#   CHARTS FROM PERSISTED AGGREGATES (aggregates.py)
+# ============================================================
+
+def generate_trend_from_aggregates(agg, out_dir="plots", span=10):
+    """Accuracy trend of the player's rolling window — no game is re-analysed."""
+    import matplotlib.pyplot as plt
+
+    ensure_plots_dir(out_dir)
+
+    values, rolling = agg.rolling_accuracy(span)
+    if not values:
+        print(f"[WARN] No aggregated games for {agg.username} — skipping trend plot.")
+        return
+
+    plt.figure(figsize=(10, 4))
+    plt.plot(values, alpha=0.5, label="game accuracy")
+    plt.plot(rolling, linewidth=2, label=f"rolling mean ({span} games)")
+    plt.title(f"Accuracy Trend — {agg.username} (last {len(values)} games)")
+    plt.xlabel("Game Index")
+    plt.ylabel("Accuracy (%)")
+    plt.legend()
+    plt.grid(True)
+
+    plt.savefig(os.path.join(out_dir, "ACCURACY_TREND.png"))
+    plt.close()
+
+
+def generate_breakdown_from_aggregates(agg, out_dir="plots"):
+    """Accuracy and blunder rate per perf type and per colour."""
+    import matplotlib.pyplot as plt
+
+    ensure_plots_dir(out_dir)
+
+    rows = [(perf, agg.summary(b)) for perf, b in sorted(agg.by_perf.items())]
+    rows += [(color, agg.summary(b)) for color, b in sorted(agg.by_color.items())]
+    rows = [(name, s) for name, s in rows if s]
+    if not rows:
+        return
+
+    names = [f"{name}\n({s['games']})" for name, s in rows]
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
+    ax1.bar(names, [s["accuracy"] for _, s in rows])
+    ax1.set_title("Accuracy (%)")
+    ax2.bar(names, [s["blunders_per_100"] for _, s in rows], color="tab:red")
+    ax2.set_title("Blunders per 100 moves")
+    _overlay_baselines(agg, rows, ((ax1, "accuracy"), (ax2, "blunders_per_100")))
+    fig.suptitle(f"{agg.username} — per perf type / colour")
+    fig.tight_layout()
+
+    fig.savefig(os.path.join(out_dir, "ACCURACY_BREAKDOWN.png"))
+    plt.close(fig)
+
+
+def _overlay_baselines(agg, rows, axes):
+    """Median and 25-75% range of the player's rating band (baselines.py) on the perf type bars."""
+    from baselines import Baselines, PERFS
+
+    table = Baselines.load()
+    if not len(table):
+        return
+    for ax, metric in axes:
+        drawn = False
+        for x, (name, _) in enumerate(rows):
+            rating = agg.recent_rating(name) if name in PERFS else None
+            q = None if rating is None else table.quantiles(metric, rating, name)
+            if q is None:
+                continue
+            ax.errorbar(x, q[1], yerr=[[q[1] - q[0]], [q[2] - q[1]]], fmt="o", color="black",
+                        capsize=4, label=None if drawn else "rating band median / 25-75%")
+            drawn = True
+        if drawn:
+            ax.legend(loc="lower right", fontsize=8)
+
+
+def generate_time_trouble_from_aggregates(agg, out_dir="plots"):
+    """Error rate in / out of time trouble, fast-move blunders and seconds per phase, per perf type."""
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from metrics import PHASES
+
+    ensure_plots_dir(out_dir)
+
+    rows = [(perf, agg.summary(b)) for perf, b in sorted(agg.by_perf.items())]
+    rows = [(name, s["clock"]) for name, s in rows if s and s["clock"]]
+    if not rows:
+        return
+
+    def val(x):
+        return 0.0 if x is None else x
+
+    names = [f"{name}\n({c['clocked_moves']} moves)" for name, c in rows]
+    x = np.arange(len(rows))
+    fig, (ax1, ax2) = plt.subplots(1, 2, figsize=(12, 4))
+
+    w = 0.27
+    ax1.bar(x - w, [val(c["calm_error_pct"]) for _, c in rows], w, label="mistakes+blunders, enough time")
+    ax1.bar(x, [val(c["time_trouble_error_pct"]) for _, c in rows], w, label="mistakes+blunders, time trouble",
+            color="tab:red")
+    ax1.bar(x + w, [val(c["fast_blunder_pct"]) for _, c in rows], w, label="blunders among fast moves",
+            color="tab:orange")
+    ax1.set_xticks(x, names)
+    ax1.set_title("% of moves")
+    ax1.legend(fontsize=8)
+
+    w = 0.8 / len(PHASES)
+    for k, phase in enumerate(PHASES):
+        ax2.bar(x + (k - 1) * w, [val(c["phase_seconds_per_move"][phase]) for _, c in rows], w, label=phase)
+    ax2.set_xticks(x, names)
+    ax2.set_title("Seconds per move")
+    ax2.legend(fontsize=8)
+
+    fig.suptitle(f"{agg.username} — clock usage per perf type")
+    fig.tight_layout()
+    fig.savefig(os.path.join(out_dir, "TIME_TROUBLE.png"))
+    plt.close(fig)
+
+
+def generate_aggregate_plots(agg, out_dir="plots"):
+    generate_trend_from_aggregates(agg, out_dir)
+    generate_breakdown_from_aggregates(agg, out_dir)
+    generate_time_trouble_from_aggregates(agg, out_dir)
+
+
 # ============================================================
 #   MAIN ENTRY POINT
 # ============================================================
@@ -129,28 +285,6 @@ def generate_plots(results):
     generate_cpl_plots(results)
     generate_accuracy_plot(results)
     generate_top_blunders(results)
-    if not os.path.exists("plots"):
-        os.makedirs("plots")
-
-    # CPL per game
-    for r in results:
-        safe_id = re.sub(r'[^A-Za-z0-9_-]', '_', r.game_id)
-        filename = f"plots/CPL_{safe_id}.png"
-
-        plt.figure(figsize=(10, 4))
-        plt.plot(r.cpl_list)
-        plt.title(f"CPL – {r.white} vs {r.black}")
-        plt.xlabel("Move Number")
-        plt.ylabel("Centipawn Eval")
-        plt.grid(True)
-        plt.savefig(filename)
-        plt.close()
-
-    # accuracy trend
-    generate_accuracy_plot(results)
-
-    # blunders ranking
-    generate_top_blunders(results)
 
     # NEW: heatmaps
     from heatmap_generator import generate_all_heatmaps
@@ -0,0 +1,265 @@
+# position_features.py
+"""
+Compact features of a flagged ply (Inaccuracy / Mistake / Blunder).
+
+Everything is computed from the position AFTER the bad move, from the
+mover's point of view, with python-chess bitboard masks (no engine):
+
+  hanging pieces, pieces attacked by a cheaper piece, king exposure
+  (attacked squares around the king, pawn shield, open files), material
+
+plus motif tags of the engine's refutation (the opponent's best reply),
+when it is known: check, capture of a hanging piece, fork / knight fork,
+pin, discovered check, mate, back-rank mate.
+
+`ply_features` returns a fixed-length float32 vector (FEATURE_NAMES) and a
+bit set of tags (TAGS) — rows of the pattern index (pattern_index.py).
+"""
+from typing import NamedTuple, Optional
+
+import chess
+import numpy as np
+
+
+PIECE_VALUES = {
+    chess.PAWN: 1, chess.KNIGHT: 3, chess.BISHOP: 3,
+    chess.ROOK: 5, chess.QUEEN: 9, chess.KING: 100,
+}
+
+FEATURE_NAMES = (
+    "hanging_count",
+    "hanging_value",            # most valuable hanging piece
+    "attacked_by_lower_count",
+    "attacked_by_lower_value",
+    "king_zone_attacked",       # squares around the king attacked by the opponent
+    "pawn_shield",
+    "open_files_near_king",
+    "material",                 # mover minus opponent, in pawns
+    "moved_piece_hanging",
+    "refutation_check",
+    "refutation_capture_value",
+    "refutation_fork_targets",
+    "refutation_piece",         # piece type of the refuting move (0 = unknown)
+    "pinned_after_refutation",
+)
+
+TAGS = {
+    "hanging": 1 << 0,
+    "attacked_by_lower": 1 << 1,
+    "king_exposed": 1 << 2,
+    "check": 1 << 3,
+    "capture": 1 << 4,
+    "wins_hanging": 1 << 5,
+    "fork": 1 << 6,
+    "knight_fork": 1 << 7,
+    "pin": 1 << 8,
+    "discovered": 1 << 9,
+    "mate": 1 << 10,
+    "back_rank": 1 << 11,
+}
+
+
+class MistakePattern(NamedTuple):
+    """Features of one flagged ply, kept on GameAnalysisResult.patterns."""
+    ply: int                  # 1-based, as in the mistake strings
+    san: str
+    fen: str                  # position BEFORE the move
+    uci: str
+    delta: int                # mover's eval change
+    classification: str
+    refutation: str           # opponent's best reply (UCI), "" if unknown
+    vector: np.ndarray
+    tags: int
+    pv: str = ""              # engine line after the move (UCI, space-separated), starts with refutation
+
+
+def tag_names(tags: int):
+    return [name for name, bit in TAGS.items() if tags & bit]
+
+
+# ============================================================
+#   BITBOARD HELPERS
+# ============================================================
+def _value(board, square):
+    piece = board.piece_at(square)
+    return PIECE_VALUES[piece.piece_type] if piece else 0
+
+
+def _threats(board, color):
+    """(hanging squares, squares attacked by a cheaper piece) of `color`'s non-king pieces."""
+    hanging = 0
+    by_lower = 0
+    for sq in chess.scan_forward(board.occupied_co[color] & ~board.kings):
+        attackers = board.attackers_mask(not color, sq)
+        if not attackers:
+            continue
+        if not board.attackers_mask(color, sq):
+            hanging |= chess.BB_SQUARES[sq]
+        cheapest = min(_value(board, a) for a in chess.scan_forward(attackers))
+        if cheapest < _value(board, sq):
+            by_lower |= chess.BB_SQUARES[sq]
+    return hanging, by_lower
+
+
+def _max_value(board, mask):
+    return max((_value(board, sq) for sq in chess.scan_forward(mask)), default=0)
+
+
+def _king_exposure(board, color):
+    king = board.king(color)
+    if king is None:
+        return 0, 0, 0
+    zone = chess.BB_KING_ATTACKS[king]
+    attacked = sum(1 for sq in chess.scan_forward(zone) if board.is_attacked_by(not color, sq))
+
+    file = chess.square_file(king)
+    rank = chess.square_rank(king)
+    step = 1 if color == chess.WHITE else -1
+    files = [f for f in (file - 1, file, file + 1) if 0 <= f < 8]
+    own_pawns = board.pawns & board.occupied_co[color]
+
+    # two ranks in front of the king, on the king's file and its neighbours
+    ahead_mask = 0
+    for r in (rank + step, rank + 2 * step):
+        if 0 <= r < 8:
+            ahead_mask |= chess.BB_RANKS[r]
+    file_mask = 0
+    for f in files:
+        file_mask |= chess.BB_FILES[f]
+
+    shield = chess.popcount(own_pawns & ahead_mask & file_mask)
+    open_files = sum(1 for f in files if not own_pawns & chess.BB_FILES[f])
+    return attacked, shield, open_files
+
+
+def _material(board, color):
+    total = 0
+    for piece_type in (chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN):
+        value = PIECE_VALUES[piece_type]
+        total += value * chess.popcount(board.pieces_mask(piece_type, color))
+        total -= value * chess.popcount(board.pieces_mask(piece_type, not color))
+    return total
+
+
+# ============================================================
+#   FEATURES OF ONE PLY
+# ============================================================
+def ply_features(board_before: chess.Board, move: chess.Move, refutation: Optional[str] = None):
+    """Returns (float32 vector in FEATURE_NAMES order, tag bits)."""
+    mover = board_before.turn
+    board = board_before.copy(stack=False)
+    board.push(move)
+
+    vec = np.zeros(len(FEATURE_NAMES), dtype=np.float32)
+    tags = 0
+
+    hanging, by_lower = _threats(board, mover)
+    vec[0] = chess.popcount(hanging)
+    vec[1] = _max_value(board, hanging)
+    vec[2] = chess.popcount(by_lower)
+    vec[3] = _max_value(board, by_lower)
+    vec[4], vec[5], vec[6] = _king_exposure(board, mover)
+    vec[7] = _material(board, mover)
+    vec[8] = bool(hanging & chess.BB_SQUARES[move.to_square])
+
+    if hanging:
+        tags |= TAGS["hanging"]
+    if by_lower:
+        tags |= TAGS["attacked_by_lower"]
+    if vec[4] >= 3 or (vec[5] == 0 and vec[6] >= 2):
+        tags |= TAGS["king_exposed"]
+
+    reply = chess.Move.from_uci(refutation) if refutation else None
+    if reply is None or reply not in board.legal_moves:
+        return vec, tags
+
+    piece = board.piece_at(reply.from_square)
+    vec[12] = piece.piece_type
+
+    if board.gives_check(reply):
+        vec[9] = 1
+        tags |= TAGS["check"]
+    if board.is_capture(reply):
+        vec[10] = 1 if board.is_en_passant(reply) else _value(board, reply.to_square)
+        tags |= TAGS["capture"]
+        if hanging & chess.BB_SQUARES[reply.to_square]:
+            tags |= TAGS["wins_hanging"]
+
+    after = board.copy(stack=False)
+    after.push(reply)
+
+    # fork: the refuting piece hits two targets that are the king, undefended or worth more
+    attacker_value = PIECE_VALUES[piece.piece_type]
+    targets = 0
+    for sq in chess.scan_forward(after.attacks_mask(reply.to_square) & after.occupied_co[mover]):
+        value = _value(after, sq)
+        if value > attacker_value or not after.attackers_mask(mover, sq):
+            targets += 1
+    vec[11] = targets
+    if targets >= 2:
+        tags |= TAGS["fork"]
+        if piece.piece_type == chess.KNIGHT:
+            tags |= TAGS["knight_fork"]
+
+    pinned = sum(
+        1 for sq in chess.scan_forward(after.occupied_co[mover] & ~after.kings)
+        if after.is_pinned(mover, sq)
+    )
+    vec[13] = pinned
+    if pinned:
+        tags |= TAGS["pin"]
+
+    if after.is_check() and not after.checkers() & chess.BB_SQUARES[reply.to_square]:
+        tags |= TAGS["discovered"]
+    if after.is_checkmate():
+        tags |= TAGS["mate"]
+        king = after.king(mover)
+        if chess.square_rank(king) == (0 if mover == chess.WHITE else 7):
+            tags |= TAGS["back_rank"]
+
+    return vec, tags
+
+
+# ============================================================
+#   TACTICAL FACTS FOR THE LLM PROMPT
+# ============================================================
+def _piece_list(board, mask):
+    return ", ".join(
+        f"{board.piece_at(sq).symbol().upper()}{chess.square_name(sq)}"
+        for sq in chess.scan_forward(mask)
+    )
+
+
+def tactical_facts(board_before: chess.Board, move: chess.Move, refutation: str = "") -> str:
+    """
+    One compact line of verifiable facts about a bad move, e.g.
+      material -1 | hanging: Nc3 | attacked by cheaper: Qd1 | king zone attacked: 2 |
+      opponent checks: Bb4+, Qa5+ | refutation: Nf2+ (check, fork)
+    The model then explains instead of having to work these out itself.
+    """
+    mover = board_before.turn
+    board = board_before.copy(stack=False)
+    board.push(move)
+
+    hanging, by_lower = _threats(board, mover)
+    king_attacked, _, _ = _king_exposure(board, mover)
+    facts = [f"material {_material(board, mover):+d}"]
+    if board.is_check():
+        facts.append("the move gives check")
+    if hanging:
+        facts.append(f"hanging: {_piece_list(board, hanging)}")
+    if by_lower & ~hanging:
+        facts.append(f"attacked by cheaper: {_piece_list(board, by_lower & ~hanging)}")
+    if king_attacked:
+        facts.append(f"king zone attacked: {king_attacked}")
+
+    checks = [board.san(m) for m in board.legal_moves if board.gives_check(m)]
+    if checks:
+        facts.append(f"opponent checks: {', '.join(checks[:4])}")
+
+    reply = chess.Move.from_uci(refutation) if refutation else None
+    if reply is not None and reply in board.legal_moves:
+        _, tags = ply_features(board_before, move, refutation)
+        motifs = [t for t in tag_names(tags) if t not in ("hanging", "attacked_by_lower", "king_exposed")]
+        facts.append(f"refutation: {board.san(reply)}" + (f" ({', '.join(motifs)})" if motifs else ""))
+    return " | ".join(facts)
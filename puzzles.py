@@ -0,0 +1,208 @@
+# puzzles.py
+"""
+Training puzzles from flagged plies.
+
+A puzzle starts right before the opponent's punishing reply. Rows use the
+Lichess puzzle database layout: FEN is the position before the mistake,
+Moves = the mistake + the solution. The mistake is auto-played, and the
+solver finds the rest.
+
+The solution is the engine line stored with each flagged ply during the
+analysis (MistakePattern.pv, the "pv" column of the pattern index), so no
+new search is needed to find it. Engine time is only spent on checking
+that the solution is unique. Every solver move of the line is searched
+with multipv=2 under a small node budget (CHECK_NODES):
+
+  - the move must leave the solver winning (MIN_SOLVER_WIN, win%)
+  - the second-best move must be clearly worse (UNIQUE_WIN_DROP, win% points)
+
+The line is cut after the last solver move that passes. The puzzle is
+dropped if the first one fails.
+
+    data/puzzles.csv.gz — PuzzleId,FEN,Moves,Themes,Player,GameId,Ply,Classification
+
+Ids already in the file are skipped. New puzzles are appended as another
+gzip member, so the file grows incrementally. Plies that failed the check
+are listed in <file>.rejected and are not searched again.
+"""
+import asyncio
+import csv
+import gzip
+import io
+import os
+from typing import List, Optional
+
+import chess
+import chess.engine
+
+from metrics import win_probability
+
+
+PUZZLES_PATH = "data/puzzles.csv.gz"
+COLUMNS = ("PuzzleId", "FEN", "Moves", "Themes", "Player", "GameId", "Ply", "Classification")
+
+CHECK_NODES = 300_000         # per uniqueness search (~0.2 s on one thread)
+MIN_SOLVER_WIN = 70.0         # solver's win% after the solution move
+UNIQUE_WIN_DROP = 20.0        # second-best move at least this many win% points worse
+MAX_SOLVER_MOVES = 4
+
+
+def puzzle_id(game_id: str, ply: int) -> str:
+    return f"{game_id}-{ply}"
+
+
+def load_puzzle_ids(path: str = PUZZLES_PATH) -> set:
+    if not os.path.exists(path):
+        return set()
+    with gzip.open(path, "rt", encoding="utf-8", newline="") as f:
+        return {row["PuzzleId"] for row in csv.DictReader(f) if row["PuzzleId"] != "PuzzleId"}
+
+
+def load_rejected_ids(path: str = PUZZLES_PATH) -> set:
+    if not os.path.exists(path + ".rejected"):
+        return set()
+    with open(path + ".rejected", encoding="utf-8") as f:
+        return set(f.read().split())
+
+
+# ============================================================
+#   UNIQUENESS CHECK
+# ============================================================
+def _only_move(candidates, solver, first):
+    """candidates: multipv results (white's perspective), best first."""
+    if len(candidates) < 2:
+        return not first            # a forced move is fine inside the line, not as the start
+    sign = 1 if solver == chess.WHITE else -1
+    best = float(win_probability(sign * candidates[0].cp))
+    second = float(win_probability(sign * candidates[1].cp))
+    return best >= MIN_SOLVER_WIN and best - second >= UNIQUE_WIN_DROP
+
+
+async def verify_line(pool, fen: str, mistake: str, pv: str, nodes: int = CHECK_NODES,
+                      priority: str = "bulk") -> List[str]:
+    """
+    Solution moves (UCI, starting with the punishing reply) that survive the
+    uniqueness check; [] if the first one does not. Ends on a solver move.
+    """
+    board = chess.Board(fen)
+    board.push(chess.Move.from_uci(mistake))
+    solver = board.turn
+    line = pv.split()
+    limit = chess.engine.Limit(nodes=nodes)
+
+    kept = []
+    async with pool.lease(pool.new_game_key(), priority) as engine:
+        for i in range(0, len(line), 2):
+            if i // 2 >= MAX_SOLVER_MOVES:
+                break
+            move = chess.Move.from_uci(line[i])
+            if move not in board.legal_moves:
+                break
+            candidates = await engine.candidates(board, 2, limit)
+            if not candidates or candidates[0].best_move != line[i]:
+                break               # the budget search prefers something else
+            if not _only_move(candidates, solver, first=not kept):
+                break
+            kept.append(line[i])
+            board.push(move)
+
+            if board.is_game_over() or i + 1 >= len(line):
+                break
+            reply = chess.Move.from_uci(line[i + 1])
+            if reply not in board.legal_moves:
+                break
+            kept.append(line[i + 1])
+            board.push(reply)
+
+    if len(kept) % 2 == 0:
+        kept = kept[:-1]            # never end on the opponent's move
+    return kept
+
+
+def _themes(row, fen, mistake, solution):
+    themes = list(row["tags"])
+    board = chess.Board(fen)
+    for uci in [mistake] + solution:
+        board.push(chess.Move.from_uci(uci))
+    if board.is_checkmate() and "mate" not in themes:
+        themes.append("mate")
+    themes.append("short" if len(solution) <= 3 else "long")
+    return themes
+
+
+# ============================================================
+#   BATCH GENERATION
+# ============================================================
+async def build_puzzles(patterns, pool, rows, nodes: int = CHECK_NODES, priority: str = "bulk",
+                        on_progress=None) -> List[dict]:
+    """
+    rows: pattern index row numbers, all checked concurrently on the pool.
+    Returns one entry per row: the puzzle dict, or its id if it was rejected.
+    """
+    done = 0
+
+    async def one(i):
+        nonlocal done
+        row = patterns.row(int(i))
+        solution = await verify_line(pool, row["fen"], row["uci"], row["pv"], nodes, priority)
+        done += 1
+        if on_progress is not None:
+            on_progress(done, len(rows))
+        if not solution:
+            return puzzle_id(row["game_id"], row["ply"])
+        return {
+            "PuzzleId": puzzle_id(row["game_id"], row["ply"]),
+            "FEN": row["fen"],
+            "Moves": " ".join([row["uci"]] + solution),
+            "Themes": " ".join(_themes(row, row["fen"], row["uci"], solution)),
+            "Player": row["player"],
+            "GameId": row["game_id"],
+            "Ply": row["ply"],
+            "Classification": row["classification"],
+        }
+
+    return await asyncio.gather(*(one(i) for i in rows))
+
+
+def append_puzzles(puzzles, path: str = PUZZLES_PATH, rejected=()):
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    if rejected:
+        with open(path + ".rejected", "a", encoding="utf-8") as f:
+            f.write("".join(f"{pid}\n" for pid in rejected))
+    if not puzzles:
+        return
+    buf = io.StringIO()
+    writer = csv.DictWriter(buf, fieldnames=COLUMNS)
+    if not os.path.exists(path):
+        writer.writeheader()
+    writer.writerows(puzzles)
+    with gzip.open(path, "at", encoding="utf-8", newline="") as f:
+        f.write(buf.getvalue())
+
+
+def generate_puzzles(patterns, client, path: str = PUZZLES_PATH, player: Optional[str] = None,
+                     min_class: str = "Blunder", nodes: int = CHECK_NODES, priority: str = "bulk") -> int:
+    """
+    patterns: PatternIndex; client: async_engine.EngineClient (its pool size
+    = engines checking in parallel). Returns the number of new puzzles.
+    """
+    known = load_puzzle_ids(path) | load_rejected_ids(path)
+    rows = [
+        i for i in patterns.filter(player=player, min_class=min_class)
+        if patterns.meta["pv"][i]
+        and puzzle_id(str(patterns.meta["game_id"][i]), int(patterns.ply[i])) not in known
+    ]
+    if not rows:
+        return 0
+    print(f"[INFO] Checking {len(rows)} flagged plies ({nodes} nodes per uniqueness search)...")
+
+    def progress(done, total):
+        if done % 100 == 0 or done == total:
+            print(f"[INFO] {done}/{total} checked")
+
+    checked = client.run(build_puzzles(patterns, client.pool, rows, nodes, priority, progress))
+    puzzles = [p for p in checked if isinstance(p, dict)]
+    append_puzzles(puzzles, path, rejected=[p for p in checked if isinstance(p, str)])
+    return len(puzzles)
@@ -0,0 +1,272 @@
+# retrieval_index.py
+"""
+On-disk vector index of annotated positions for retrieval-augmented prompts.
+
+Entries are flagged plies with an annotation:
+  - "explanation": per-move LLM explanations from the explanation cache
+  - "pattern":     flagged plies of the pattern index (engine refutation + motifs)
+
+Each entry is embedded from a short text description of the mistake
+(describe_mistake: moved piece, hanging pieces, king exposure, refutation
+motifs) with sentence-transformers, in batches. Vectors live in a FAISS
+index, metadata in sqlite next to it:
+
+    cache/retrieval/index.faiss
+    cache/retrieval/entries.sqlite
+
+Build is incremental: entries already stored (same fen, move, source) are
+skipped, only new ones are embedded. The index starts as an exact flat
+index; after TRAIN_SIZE entries it is converted once to IVF with 8-bit
+scalar quantization (IVF_LISTS lists, NPROBE probed), which keeps a query
+over 1M entries in the low milliseconds. Read-only loads memory-map the file.
+
+    pip install faiss-cpu sentence-transformers
+"""
+import os
+import sqlite3
+import threading
+from typing import Callable, Iterable, List, Optional
+
+import chess
+import numpy as np
+
+from explanation_cache import normalize_fen
+from position_features import FEATURE_NAMES, tag_names, ply_features
+
+
+RETRIEVAL_DIR = "cache/retrieval"
+DEFAULT_EMBEDDER = "sentence-transformers/all-MiniLM-L6-v2"
+
+EMBED_BATCH = 256
+IVF_LISTS = 1024
+TRAIN_SIZE = 40 * IVF_LISTS      # faiss wants ~39 training points per list
+NPROBE = 16
+
+
+def _faiss():
+    try:
+        import faiss
+    except ImportError:
+        raise RuntimeError("Retrieval index needs faiss: pip install faiss-cpu")
+    return faiss
+
+
+# ============================================================
+#   TEXT DESCRIPTION OF A MISTAKE
+# ============================================================
+def describe_mistake(fen: str, uci: str, refutation: str = "") -> str:
+    """
+    Same template, fed the same inputs (position, move, engine refutation),
+    for indexed entries and queries, so analogous mistakes embed close together.
+    """
+    board = chess.Board(fen)
+    move = chess.Move.from_uci(uci)
+    vec, tags = ply_features(board, move, refutation)
+    f = dict(zip(FEATURE_NAMES, vec.tolist()))
+
+    piece = board.piece_at(move.from_square)
+    parts = [
+        f"{'White' if board.turn == chess.WHITE else 'Black'} played "
+        f"{chess.piece_name(piece.piece_type) if piece else 'a piece'} {board.san(move)}.",
+        f"Material {f['material']:+.0f}.",
+    ]
+    if f["hanging_count"]:
+        parts.append(f"{f['hanging_count']:.0f} piece(s) left hanging, worth up to {f['hanging_value']:.0f}.")
+    if f["attacked_by_lower_count"]:
+        parts.append(f"{f['attacked_by_lower_count']:.0f} piece(s) attacked by cheaper pieces.")
+    parts.append(
+        f"King zone: {f['king_zone_attacked']:.0f} squares attacked, pawn shield {f['pawn_shield']:.0f}, "
+        f"{f['open_files_near_king']:.0f} open files."
+    )
+    if refutation:
+        board.push(move)
+        reply = chess.Move.from_uci(refutation)
+        if reply in board.legal_moves:
+            parts.append(f"Refutation {board.san(reply)}: {', '.join(tag_names(tags)) or 'positional'}.")
+    return " ".join(parts)
+
+
+# ============================================================
+#   INDEX
+# ============================================================
+class RetrievalIndex:
+    def __init__(self, folder: str = RETRIEVAL_DIR, read_only: bool = False,
+                 embedder: Optional[Callable[[List[str]], np.ndarray]] = None,
+                 model_name: str = DEFAULT_EMBEDDER):
+        """
+        read_only=True memory-maps the vector file (queries only, no add()).
+        embedder: texts -> float32 matrix (default: sentence-transformers model_name).
+        """
+        if not os.path.exists(folder):
+            os.makedirs(folder)
+        self.folder = folder
+        self.index_path = os.path.join(folder, "index.faiss")
+        self.read_only = read_only
+        self.model_name = model_name
+        self._embedder = embedder
+        self._model = None
+        self._lock = threading.Lock()
+
+        self._db = sqlite3.connect(os.path.join(folder, "entries.sqlite"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " id INTEGER PRIMARY KEY,"
+            " fen TEXT NOT NULL,"
+            " move TEXT NOT NULL,"
+            " source TEXT NOT NULL,"
+            " description TEXT NOT NULL,"
+            " text TEXT NOT NULL,"
+            " UNIQUE (fen, move, source))"
+        )
+        self._db.commit()
+
+        self.index = None
+        if os.path.exists(self.index_path):
+            faiss = _faiss()
+            flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY if read_only else 0
+            self.index = faiss.read_index(self.index_path, flags)
+            self._set_nprobe()
+
+    # ---------- EMBEDDING ----------
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if self._embedder is not None:
+            vectors = np.asarray(self._embedder(texts), dtype=np.float32)
+            return vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+
+        if self._model is None:
+            from sentence_transformers import SentenceTransformer
+            self._model = SentenceTransformer(self.model_name, device="cpu")
+        return self._model.encode(
+            texts, batch_size=EMBED_BATCH, normalize_embeddings=True, convert_to_numpy=True
+        ).astype(np.float32)
+
+    # ---------- INCREMENTAL BUILD ----------
+    def add(self, entries: Iterable[tuple]) -> int:
+        """
+        entries: (fen, move_uci, source, description, text). Entries already
+        in the index are skipped; new ones are embedded EMBED_BATCH at a time.
+        """
+        if self.read_only:
+            raise RuntimeError("RetrievalIndex was opened read_only.")
+
+        added = 0
+        batch_ids, batch_texts = [], []
+        with self._lock:
+            for fen, move, source, description, text in entries:
+                cur = self._db.execute(
+                    "INSERT OR IGNORE INTO entries (fen, move, source, description, text)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (normalize_fen(fen), move, source, description, text),
+                )
+                if cur.rowcount == 0:
+                    continue
+                batch_ids.append(cur.lastrowid)
+                batch_texts.append(description)
+                if len(batch_ids) == EMBED_BATCH:
+                    self._add_vectors(self.embed(batch_texts), batch_ids)
+                    added += len(batch_ids)
+                    batch_ids, batch_texts = [], []
+
+            if batch_ids:
+                self._add_vectors(self.embed(batch_texts), batch_ids)
+                added += len(batch_ids)
+            self._db.commit()
+        return added
+
+    def _add_vectors(self, vectors: np.ndarray, ids):
+        faiss = _faiss()
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        ids = np.asarray(ids, dtype=np.int64)
+
+        if self.index is None:
+            self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vectors.shape[1]))
+        self.index.add_with_ids(vectors, ids)
+
+        if isinstance(self.index, faiss.IndexIDMap2) and self.index.ntotal >= TRAIN_SIZE:
+            self._convert_to_ivf()
+
+    def _convert_to_ivf(self):
+        """Exact flat index -> IVF + SQ8, trained once on everything stored so far."""
+        faiss = _faiss()
+        flat = faiss.downcast_index(self.index.index)
+        d = flat.d
+        vectors = faiss.vector_to_array(flat.codes).view(np.float32).reshape(-1, d)
+        ids = faiss.vector_to_array(self.index.id_map)
+
+        quantizer = faiss.IndexFlatIP(d)
+        ivf = faiss.IndexIVFScalarQuantizer(
+            quantizer, d, IVF_LISTS, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT
+        )
+        ivf.train(vectors)
+        ivf.add_with_ids(vectors, ids)
+        self._quantizer = quantizer     # the IVF index does not own it until written
+        self.index = ivf
+        self._set_nprobe()
+        print(f"[INFO] Retrieval index converted to IVF ({ivf.ntotal} entries).")
+
+    def _set_nprobe(self):
+        if hasattr(self.index, "nprobe"):
+            self.index.nprobe = NPROBE
+
+    def save(self):
+        if self.index is None or self.read_only:
+            return
+        faiss = _faiss()
+        tmp = self.index_path + ".tmp"
+        faiss.write_index(self.index, tmp)
+        os.replace(tmp, self.index_path)
+
+    # ---------- SOURCES ----------
+    def add_explanations(self, cache) -> int:
+        """Per-move explanations of an ExplanationCache."""
+        return self.add(
+            (fen, move, "explanation", describe_mistake(fen, move, refutation), text)
+            for fen, move, refutation, text in cache.items()
+        )
+
+    def add_patterns(self, patterns) -> int:
+        """Flagged plies of a PatternIndex (annotation = severity, refutation, motifs)."""
+        def entries():
+            for i in range(len(patterns)):
+                row = patterns.row(i)
+                note = f"{row['classification']} (eval change {row['delta']})"
+                if row["refutation_san"]:
+                    note += f", refuted by {row['refutation_san']}"
+                yield (row["fen"], row["uci"], "pattern",
+                       describe_mistake(row["fen"], row["uci"], row["refutation"]), note)
+        return self.add(entries())
+
+    # ---------- QUERIES ----------
+    def search(self, description: str, k: int = 3, source: Optional[str] = None,
+               exclude_fen: Optional[str] = None) -> List[dict]:
+        if self.index is None or self.index.ntotal == 0:
+            return []
+        query = self.embed([description])
+        scores, ids = self.index.search(query, k * 4 if (source or exclude_fen) else k)
+
+        exclude = normalize_fen(exclude_fen) if exclude_fen else None
+        hits = []
+        for score, entry_id in zip(scores[0], ids[0]):
+            if entry_id < 0:
+                continue
+            row = self._db.execute(
+                "SELECT fen, move, source, description, text FROM entries WHERE id = ?",
+                (int(entry_id),),
+            ).fetchone()
+            if row is None or (source and row[2] != source) or row[0] == exclude:
+                continue
+            hits.append(dict(zip(("fen", "move", "source", "description", "text"), row), score=float(score)))
+            if len(hits) == k:
+                break
+        return hits
+
+    def similar_cases(self, fen: str, uci: str, refutation: str = "", k: int = 3,
+                      source: Optional[str] = "explanation") -> List[dict]:
+        """Annotated entries most similar to a mistake (its own position excluded)."""
+        return self.search(describe_mistake(fen, uci, refutation), k, source, exclude_fen=fen)
+
+    def __len__(self):
+        return 0 if self.index is None else self.index.ntotal
+
+    def close(self):
+        self._db.close()
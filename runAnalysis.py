@@ -2,10 +2,9 @@
 #from baseAnalyzer import analyze_latest_games
 from analyzer import analyze_latest_games
 
-def main():
-    username = "bielbart77"
+def main(username="bielbart77", max_games=5):
     print(f"Analysing latest games for {username} ...")
-    results = analyze_latest_games(username=username, max_games=5)
+    results = analyze_latest_games(username=username, max_games=max_games)
     print("Done. Results:\n")
     for r in results:
         print(r)
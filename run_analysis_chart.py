@@ -1,13 +1,42 @@
 #run_analysis_chart.py
+import numpy as np
 from analyzerChart import analyze_latest_games
 from plotter import generate_plots
-from plotter import generate_accuracy_plot, generate_top_blunders
+from plotter import generate_aggregate_plots, generate_top_blunders
+from aggregates import PlayerAggregates
+from opening_tree import OpeningTree
+from heatmap_cube import HeatmapCube
+from pattern_index import PatternIndex
+from metrics import PHASES, batch_metrics, phase_of_ply
+from baselines import Baselines, METRICS, band_label, band_of, result_sample
 
-def main():
-    username = "bielbart77"
+def main(username="bielbart77", max_games=10, perf_type="rapid", export_dir=None, export_format="arrow",
+         engines=1, precision=None, metric="accuracy", screen=False):
+    """
+    precision: approximate mode — analyse a stratified sample of the games (sampling.py).
+    screen: quiet plies skip the engine (static_eval.py).
+    """
     print(f"Analysing latest games for {username} ...")
 
-    results = analyze_latest_games(username=username, max_games=10, perf_type="rapid")
+    plan = None
+    if precision is not None:
+        from sampling import SamplingPlan
+        plan = SamplingPlan(precision=precision, metric=metric)
+
+    writer = None
+    if export_dir:
+        from export_arrow import ResultsWriter
+        writer = ResultsWriter(export_dir, fmt=export_format)
+
+    try:
+        results = analyze_latest_games(username=username, max_games=max_games, perf_type=perf_type,
+                                       on_result=writer.write if writer else None, engines=engines,
+                                       sampling=plan, screen=screen)
+    finally:
+        if writer:
+            writer.close()
+    if writer:
+        print(f"Columnar export saved in {export_dir}")
 
     print("Done. Results:\n")
     for r in results:
@@ -17,11 +46,34 @@ def main():
     generate_plots(results)
     print("Plots saved.")
 
-    summarize_all(results)
+    summarize_all(results, username)
+    if plan is not None:
+        print(plan.report())
     print("Global summary done.")
 
+    print("Updating player aggregates...")
+    agg = PlayerAggregates.load(username)
+    added = agg.update_many(results)
+    agg.save()
+    print(f"{added} new game(s) added to {agg.path}")
+
+    tree = OpeningTree.load(username)
+    tree.update_many(results)
+    tree.save()
+    print(f"Opening tree: {len(tree)} positions ({tree.path})")
+
+    cube = HeatmapCube.load(username)
+    cube.update_many(results)
+    cube.save()
+    print(f"Heatmap cube: {len(cube)} games ({cube.path})")
+
+    patterns = PatternIndex.load()
+    added = patterns.update_many(results)
+    patterns.save()
+    print(f"Pattern index: {added} new flagged plies, {len(patterns)} total ({patterns.path})")
+
     print("Generating Accuracy chart...")
-    generate_accuracy_plot(results)
+    generate_aggregate_plots(agg)
     print("Accuracy chart done.")
 
     print("Generating TOP blunders...")
@@ -29,20 +81,15 @@ def main():
     print("TOP blunders saved in plots/TOP_BLUNDERS.txt")
 
 
-def summarize_all(results):
-    total_cpl = []
-    total_inacc = 0
-    total_mist = 0
-    total_blunder = 0
+def summarize_all(results, username=None):
+    batch = batch_metrics([r.cpl_list for r in results])
 
-    for r in results:
-        total_cpl.extend(r.cpl_list)
-        total_inacc += r.count_inacc
-        total_mist += r.count_mist
-        total_blunder += r.count_blunder
+    total_inacc = sum(r.count_inacc for r in results)
+    total_mist = sum(r.count_mist for r in results)
+    total_blunder = sum(r.count_blunder for r in results)
 
-    avg_cpl = sum(abs(c) for c in total_cpl) / len(total_cpl)
-    accuracy = max(0, 100 - (avg_cpl / 30))
+    avg_cpl = float(batch.cpl.mean()) if batch.cpl.size else 0.0
+    accuracy = float(batch.accuracy.mean()) if batch.accuracy.size else 100.0
 
     print("\n===== GLOBAL SUMMARY =====")
     print(f"Overall Average CPL: {avg_cpl:.1f}")
@@ -50,8 +97,46 @@ def summarize_all(results):
     print(f"Total Inaccuracies: {total_inacc}")
     print(f"Total Mistakes: {total_mist}")
     print(f"Total Blunders: {total_blunder}")
+    phases = phase_of_ply(batch.ply_index)
+    for p, phase in enumerate(PHASES):
+        mask = phases == p
+        if mask.any():
+            print(f"{phase.capitalize():11} accuracy: {batch.accuracy[mask].mean():.1f}%  CPL: {batch.cpl[mask].mean():.1f}")
+    if username:
+        summarize_vs_baselines(results, username)
     print("==========================\n")
 
 
+def summarize_vs_baselines(results, username, table=None):
+    """
+    Where the player's games rank among sampled games of the same rating band
+    and time control (baselines.py): the median over the games of the share
+    of the band each game beats.
+    """
+    table = table or Baselines.load()
+    if not len(table):
+        return
+
+    ranks = {metric: [] for metric in METRICS}
+    ratings = []
+    for r in results:
+        color = r.color_of(username)
+        rating = None if color is None else (r.white_elo if color == "white" else r.black_elo)
+        if rating is None:
+            continue
+        ratings.append(rating)
+        for metric, value in result_sample(r, color).items():
+            rank = table.better_than(metric, value, rating, r.perf_type)
+            if rank is not None:
+                ranks[metric].append(rank)
+
+    if not any(ranks.values()):
+        return
+    print(f"--- vs. rating band {band_label(band_of(int(np.median(ratings))))} (better than ... of games) ---")
+    for metric, values in ranks.items():
+        if values:
+            print(f"{metric:21} {np.median(values):5.1f}%  ({len(values)} games)")
+
+
 if __name__ == "__main__":
     main()
@@ -4,35 +4,51 @@ import io
 import json
 import requests
 import chess.pgn
-from dotenv import load_dotenv
-from LLMChessAnalyzer import LLMChessAnalyzer
 
-load_dotenv()
+from scheduler import interactive
+
+# NOTE: LLMChessAnalyzer (transformers / torch) and dotenv are imported
+# inside the functions that need them, so fetch & print stays fast.
 
 
 def fetch_last_game(username: str):
     """Fetch last game with PGN + FENs via Lichess API."""
     print(f"[INFO] Fetching last game for {username}...")
+    return _fetch_last(username, 1)[0]
+
+
+def fetch_last_games(username: str, n: int):
+    """Fetch the last n games (newest first), same dicts as fetch_last_game."""
+    print(f"[INFO] Fetching last {n} games for {username}...")
+    return _fetch_last(username, n)
+
 
-    url = f"https://lichess.org/api/games/user/{username}?max=1&pgnInJson=true"
+def _fetch_last(username, n):
+    url = f"https://lichess.org/api/games/user/{username}?max={n}&pgnInJson=true"
     headers = {"Accept": "application/x-ndjson"}
 
     response = requests.get(url, headers=headers)
     if response.status_code != 200:
         raise RuntimeError(f"Failed to fetch PGN (status {response.status_code}).")
 
-    line = response.text.strip().split("\n")[0]
-    game_json = json.loads(line)
+    games = []
+    for line in response.text.strip().split("\n"):
+        if not line:
+            continue
+        game_json = json.loads(line)
 
-    if "pgn" not in game_json:
-        raise RuntimeError("PGN missing in Lichess response.")
+        if "pgn" not in game_json:
+            raise RuntimeError("PGN missing in Lichess response.")
 
-    return {
-        "pgn": game_json["pgn"],
-        "fens": game_json.get("fens", []),
-        "fen_final": game_json.get("fen", None),
-        "id": game_json.get("id", None)
-    }
+        games.append({
+            "pgn": game_json["pgn"],
+            "fens": game_json.get("fens", []),
+            "fen_final": game_json.get("fen", None),
+            "id": game_json.get("id", None)
+        })
+    if not games:
+        raise RuntimeError(f"No games found for {username}.")
+    return games
 
 
 def fetch_game_by_id(game_id: str):
@@ -85,25 +101,86 @@ def print_moves_from_pgn(pgn_text):
     print("=============\n")
 
 
-def main():
-    if len(sys.argv) < 3:
-        print("Usage:")
-        print("  python run_llm_game_by_id.py last USERNAME")
-        print("  python run_llm_game_by_id.py GAME_ID USERNAME")
+def fetch_game(mode: str, user: str):
+    """mode is either 'last' (last game of user) or a Lichess game id."""
+    if mode == "last":
+        return fetch_last_game(user)
+    return fetch_game_by_id(mode)
+
+
+def print_worst_moves(worst_moves):
+    print("\n=========== WORST MOVES (Stockfish) ===========")
+    for num, san, loss, *_ in worst_moves:
+        print(f"Move {num}: {san} (eval change: {loss})")
+
+
+@interactive()
+def run_worst_moves(pgn_text, stockfish_path="stockfish.exe", n_worst=2):
+    """Stockfish-only path: no model is loaded, transformers is never imported."""
+    from LLMChessAnalyzer import LLMChessAnalyzer
+
+    analyzer = LLMChessAnalyzer(model_path=None, stockfish_path=stockfish_path)
+    moves_san, _ = analyzer.parse_pgn_moves(pgn_text)
+    print_worst_moves(analyzer.find_worst_moves(moves_san, n=n_worst))
+
+
+@interactive()
+def run_llm_analysis(pgn_text, stockfish_path="stockfish.exe", n_worst=2, llm_options=None, stream=False):
+    """
+    llm_options: extra LLMChessAnalyzer kwargs (device, quantization, num_threads, assistant_model).
+    MISTRAL_MODEL_PATH may point to a HF snapshot or to a .gguf file.
+    stream=True prints the explanation while it is being generated.
+    Both entry points run as "interactive": watch / bulk jobs of other
+    processes pause their engines and LLM until they return (scheduler.py).
+    """
+    analyzer = _load_analyzer(stockfish_path, llm_options)
+
+    print("[INFO] Generating analysis...\n")
+
+    if stream:
+        moves_san, _ = analyzer.parse_pgn_moves(pgn_text)
+        worst = analyzer.find_worst_moves(moves_san, n=n_worst)
+
+        print("\n=========== LLM ANALYSIS ===========\n")
+        for piece in analyzer.explain_moves_stream(worst):
+            print(piece, end="", flush=True)
+        print()
+
+        print_worst_moves(worst)
         return
 
-    mode = sys.argv[1]
-    user = sys.argv[2]
+    result = analyzer.analyze_game(pgn_text, n_worst=n_worst)
 
-    if mode == "last":
-        game = fetch_last_game(user)
-    else:
-        game = fetch_game_by_id(mode)
+    print("\n=========== LLM ANALYSIS ===========\n")
+    print(result["analysis"])
 
-    pgn_text = game["pgn"]
+    print_worst_moves(result["worst_moves"])
 
-    # print moves in human-readable form
-    print_moves_from_pgn(pgn_text)
+
+@interactive()
+def run_llm_batch_analysis(games, stockfish_path="stockfish.exe", n_worst=2, llm_options=None):
+    """
+    run_llm_analysis for several games (dicts from fetch_last_games): the
+    model is loaded once and explains all games in one batched pass
+    (LLMChessAnalyzer.analyze_games).
+    """
+    analyzer = _load_analyzer(stockfish_path, llm_options)
+
+    print(f"[INFO] Generating analysis of {len(games)} games...\n")
+    results = analyzer.analyze_games([game["pgn"] for game in games], n_worst=n_worst)
+
+    for game, result in zip(games, results):
+        print(f"\n=========== LLM ANALYSIS: {game['id']} ===========\n")
+        print(result["analysis"])
+
+        print_worst_moves(result["worst_moves"])
+
+
+def _load_analyzer(stockfish_path, llm_options):
+    from dotenv import load_dotenv
+    from LLMChessAnalyzer import LLMChessAnalyzer
+
+    load_dotenv()
 
     print("[INFO] Initializing LLM analyzer...")
 
@@ -111,21 +188,36 @@ def main():
     if not llm_model_path:
         raise RuntimeError("MISTRAL_MODEL_PATH is not set in environment variables!")
 
-    analyzer = LLMChessAnalyzer(
+    # similar mistakes from earlier games (built by chart / watch / rag-index), if any
+    patterns_path = "data/patterns.npz"
+    retrieval_path = "cache/retrieval"
+
+    return LLMChessAnalyzer(
         model_path=llm_model_path,
-        stockfish_path="stockfish.exe"
+        stockfish_path=stockfish_path,
+        pattern_index=patterns_path if os.path.exists(patterns_path) else None,
+        retrieval_index=retrieval_path if os.path.exists(os.path.join(retrieval_path, "index.faiss")) else None,
+        **(llm_options or {})
     )
 
-    print("[INFO] Generating analysis...\n")
 
-    result = analyzer.analyze_game(pgn_text, n_worst=2)
+def main():
+    if len(sys.argv) < 3:
+        print("Usage:")
+        print("  python run_llm_game_by_id.py last USERNAME")
+        print("  python run_llm_game_by_id.py GAME_ID USERNAME")
+        return
+
+    mode = sys.argv[1]
+    user = sys.argv[2]
 
-    print("\n=========== LLM ANALYSIS ===========\n")
-    print(result["analysis"])
+    game = fetch_game(mode, user)
+    pgn_text = game["pgn"]
 
-    print("\n=========== WORST MOVES (Stockfish) ===========")
-    for num, san, loss in result["worst_moves"]:
-        print(f"Move {num}: {san} (eval change: {loss})")
+    # print moves in human-readable form
+    print_moves_from_pgn(pgn_text)
+
+    run_llm_analysis(pgn_text)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,176 @@
+# sampling.py
+"""
+Approximate cohort statistics from a stratified random sample of games.
+
+Questions like "average accuracy of our club in blitz this year" don't
+need every game analysed. SamplingPlan draws games in random order,
+stratified by (perf type, colour), and keeps the sample proportional to
+each stratum's share of the population. Drawing stops as soon as the
+confidence interval of the target metric is narrow enough.
+
+Units are (game, side) pairs: one per game of a single player, two for a
+game between two members of a cohort (the game is analysed once). The
+sampled games are analysed completely (analyzerChart.sample_games_async),
+so the results are ordinary GameAnalysisResults and every plot works on
+them unchanged. Per-unit metrics are baselines.result_sample:
+
+    accuracy, cpl, inaccuracies_per_100, mistakes_per_100, blunders_per_100
+
+A unit can lack a metric (NaN, e.g. a side without moves). Such units
+are not part of that metric's population. A stratum's size for the metric
+is estimated from the share of its analysed units that have a value:
+N'_h = N_h * n_h / a_h (a_h analysed units, n_h of them with a value).
+This is exact once the stratum is fully drawn. Strata where no analysed
+unit has a value are left out of N' altogether. Estimator (per metric),
+with W_h = N'_h / N' and the finite population correction on the drawn
+share, so a fully analysed stratum adds no uncertainty:
+
+    mean = sum_h W_h * mean_h
+    var  = sum_h W_h^2 * (1 - a_h / N_h) * s_h^2 / n_h
+    CI   = mean ± z * sqrt(var)
+
+The stopping rule is checked after every finished game. Each stratum needs
+at least `min_per_stratum` analysed units first (with or without a value),
+which guards against a lucky early variance estimate.
+"""
+import random
+from collections import defaultdict
+from dataclasses import dataclass
+from statistics import NormalDist
+from typing import Dict, Optional
+
+import numpy as np
+
+
+MIN_PER_STRATUM = 5
+DEFAULT_CONFIDENCE = 0.95
+
+
+@dataclass
+class Estimate:
+    metric: str
+    mean: float
+    half_width: float           # inf until every stratum has 2+ units
+    confidence: float
+    n: int                      # units analysed
+    population: int
+
+    def __str__(self):
+        spread = "± ?" if self.half_width == float("inf") else f"± {self.half_width:.2f}"
+        return (f"{self.metric:21} {self.mean:7.2f} {spread:8} "
+                f"({self.confidence:.0%} CI, {self.n}/{self.population} sampled)")
+
+
+class SamplingPlan:
+    def __init__(self, precision: float = 1.0, metric: str = "accuracy",
+                 confidence: float = DEFAULT_CONFIDENCE, min_per_stratum: int = MIN_PER_STRATUM,
+                 seed: Optional[int] = None):
+        """
+        precision: target CI half-width of `metric` (accuracy points, CPL, or
+        events per 100 moves); 0 = analyse the whole population.
+        """
+        self.precision = precision
+        self.metric = metric
+        self.confidence = confidence
+        self.min_per_stratum = min_per_stratum
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self._rng = random.Random(seed)
+        self.population = 0
+        self._queues = {}                        # stratum -> units not drawn yet (shuffled)
+        self._size = {}                          # stratum -> N_h
+        self._drawn = defaultdict(int)           # stratum -> units handed out
+        self._added = defaultdict(int)           # stratum -> units analysed (a_h)
+        self._stratum_of = {}
+        self._values = defaultdict(lambda: defaultdict(list))   # stratum -> metric -> values
+
+    # ---------- POPULATION ----------
+    def set_population(self, units, strata):
+        """units: hashable ids (e.g. (game index, colour)); strata: the stratum key of each."""
+        groups = defaultdict(list)
+        for unit, stratum in zip(units, strata):
+            groups[stratum].append(unit)
+            self._stratum_of[unit] = stratum
+        for stratum, members in groups.items():
+            self._rng.shuffle(members)
+            self._queues[stratum] = members
+            self._size[stratum] = len(members)
+        self.population = len(self._stratum_of)
+
+    # ---------- DRAWING ----------
+    def next_unit(self):
+        """Next unit to analyse (proportional allocation); None once precise enough or exhausted."""
+        if self.done():
+            return None
+        # strata whose first min_per_stratum units all lack the metric are left out of it
+        open_strata = [
+            s for s, q in self._queues.items()
+            if q and (self._values[s][self.metric] or self._added[s] < self.min_per_stratum)
+        ]
+        if not open_strata:
+            return None
+        stratum = min(open_strata, key=lambda s: self._drawn[s] / self._size[s])
+        self._drawn[stratum] += 1
+        return self._queues[stratum].pop()
+
+    def add(self, unit, values: Dict[str, float]):
+        stratum = self._stratum_of[unit]
+        self._added[stratum] += 1
+        for metric, value in values.items():
+            if value is not None and value == value:          # NaN = side without moves
+                self._values[stratum][metric].append(float(value))
+
+    def analysed(self) -> int:
+        return sum(self._added.values())
+
+    def done(self) -> bool:
+        for stratum, size in self._size.items():
+            if self._added[stratum] < min(self.min_per_stratum, size) and self._queues[stratum]:
+                return False
+        return self.estimate(self.metric).half_width <= self.precision
+
+    # ---------- ESTIMATES ----------
+    def _metric_sizes(self, metric: str) -> Dict[object, float]:
+        """N'_h per stratum: units expected to have `metric`; strata without any are left out."""
+        sizes = {}
+        for stratum, size in self._size.items():
+            added = self._added[stratum]
+            valid = len(self._values[stratum][metric])
+            if not added:
+                sizes[stratum] = float(size)          # nothing known yet
+            elif valid:
+                sizes[stratum] = size * valid / added
+        return sizes
+
+    def estimate(self, metric: str) -> Estimate:
+        sizes = self._metric_sizes(metric)
+        total = sum(sizes.values())
+        mean = var = covered = 0.0
+        n = 0
+        for stratum, size in sizes.items():
+            values = np.asarray(self._values[stratum][metric])
+            n += len(values)
+            if not len(values):
+                continue
+            weight = size / total
+            covered += weight
+            mean += weight * values.mean()
+            drawn_share = self._added[stratum] / self._size[stratum]
+            if drawn_share < 1:
+                if len(values) < 2:
+                    var = float("inf")
+                else:
+                    var += weight ** 2 * (1 - drawn_share) * values.var(ddof=1) / len(values)
+        if covered < 1.0 - 1e-9:
+            # strata without any unit yet: mean of the covered ones, no interval
+            mean = mean / covered if covered else float("nan")
+            var = float("inf")
+        return Estimate(metric, mean, self.z * var ** 0.5, self.confidence, n, self.population)
+
+    def estimates(self) -> Dict[str, Estimate]:
+        metrics = {m for values in self._values.values() for m in values}
+        return {m: self.estimate(m) for m in sorted(metrics)}
+
+    def report(self) -> str:
+        lines = [f"--- sampled estimates (target ± {self.precision} on {self.metric}) ---"]
+        lines += [str(e) for e in self.estimates().values()]
+        return "\n".join(lines)
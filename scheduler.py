@@ -0,0 +1,219 @@
+# scheduler.py
+"""
+Priority scheduling of engine and LLM work.
+
+Three priority classes, most urgent first:
+
+    interactive — one game someone is waiting for (run_llm_game_by_id, cli worst / llm, live)
+    watch       — watch mode, games that just finished
+    bulk        — chart / analyze batches, backfills
+
+Inside a process (async_engine.EnginePool):
+  - SlotScheduler hands out engine slots: a freed engine goes to the most
+    urgent waiter; within one class to the user holding the fewest engines
+    (per-user fairness), then first come first served
+  - a watch / bulk game gives its engine back at the next ply boundary
+    when a more urgent job waits (_Lease.checkpoint), and queues again
+
+Across processes (a nightly batch next to a one-off interactive run):
+  - an interactive process holds a marker file in data/scheduler/
+    (`interactive()`); watch / bulk engines pause at ply / game boundaries
+    while a live marker of another process exists, so the cores go to it
+  - `llm_slot()` caps concurrent LLM generations (LLM_MAX_JOBS) with
+    exclusive lock files; watch / bulk also wait while an interactive
+    process is running
+
+Stale files of crashed processes are detected by pid and removed.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+
+PRIORITIES = ("interactive", "watch", "bulk")
+
+SCHEDULER_DIR = "data/scheduler"
+LLM_MAX_JOBS = 1              # concurrent LLM generations on this machine
+POLL_SECONDS = 0.5
+MARKER_CHECK_SECONDS = 1.0    # interactive markers are re-read at most this often
+
+
+def priority_rank(priority: str) -> int:
+    try:
+        return PRIORITIES.index(priority)
+    except ValueError:
+        raise ValueError(f"Unknown priority {priority!r} (expected one of {PRIORITIES})")
+
+
+# ============================================================
+#   IN-PROCESS SLOTS
+# ============================================================
+class SlotScheduler:
+    """`slots` interchangeable resources (engines), granted by priority, then fairness, then arrival."""
+
+    def __init__(self, slots: int):
+        self.free = slots
+        self._waiters = []                # heap of [rank, held by user, seq, user, future]
+        self._held = Counter()            # user -> slots currently held
+        self._seq = itertools.count()
+
+    async def acquire(self, priority: str = "interactive", user=None):
+        rank = priority_rank(priority)
+        if self.free and not self._waiters:
+            self._grant_to(user)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, [rank, self._held[user], next(self._seq), user, future])
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(user)        # granted just before the cancel — hand it on
+            raise
+
+    def release(self, user=None):
+        self._held[user] -= 1
+        if self._held[user] <= 0:
+            del self._held[user]
+        self.free += 1
+        while self.free and self._waiters:
+            _, _, _, waiter, future = heapq.heappop(self._waiters)
+            if future.done():             # cancelled while waiting
+                continue
+            self._grant_to(waiter)
+            future.set_result(None)
+
+    def _grant_to(self, user):
+        self.free -= 1
+        self._held[user] += 1
+
+    def waiting_above(self, priority: str) -> bool:
+        """Is a more urgent job waiting for a slot?"""
+        rank = priority_rank(priority)
+        return any(w[0] < rank and not w[4].done() for w in self._waiters)
+
+
+# ============================================================
+#   CROSS-PROCESS MARKERS
+# ============================================================
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)   # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def _live_pids(prefix: str, folder: str = SCHEDULER_DIR):
+    """pids of `<prefix>*` files in folder whose process still runs (stale files removed)."""
+    if not os.path.isdir(folder):
+        return []
+    pids = []
+    for name in os.listdir(folder):
+        if not name.startswith(prefix):
+            continue
+        path = os.path.join(folder, name)
+        try:
+            with open(path, encoding="utf-8") as f:
+                pid = int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            continue
+        if not pid and time.time() - os.path.getmtime(path) < 10:
+            continue                      # just created, pid not written yet
+        if pid and _pid_alive(pid):
+            pids.append(pid)
+        else:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+    return pids
+
+
+@contextmanager
+def interactive(folder: str = SCHEDULER_DIR):
+    """Marks this process as interactive while the block runs."""
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, f"interactive-{os.getpid()}")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(str(os.getpid()))
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+_marker_cache = {"checked": 0.0, "busy": False}
+
+
+def interactive_elsewhere(folder: str = SCHEDULER_DIR) -> bool:
+    """Does another process hold an interactive marker? (cached for MARKER_CHECK_SECONDS)"""
+    now = time.monotonic()
+    if now - _marker_cache["checked"] >= MARKER_CHECK_SECONDS:
+        own = os.getpid()
+        _marker_cache["busy"] = any(pid != own for pid in _live_pids("interactive-", folder))
+        _marker_cache["checked"] = now
+    return _marker_cache["busy"]
+
+
+async def wait_for_interactive(priority: str, folder: str = SCHEDULER_DIR):
+    """watch / bulk: sleeps while another process runs an interactive job."""
+    if priority == "interactive":
+        return
+    while interactive_elsewhere(folder):
+        await asyncio.sleep(POLL_SECONDS)
+
+
+# ============================================================
+#   LLM CAP
+# ============================================================
+@contextmanager
+def llm_slot(priority: str = "interactive", max_jobs: int = LLM_MAX_JOBS, folder: str = SCHEDULER_DIR):
+    """
+    Holds one of `max_jobs` machine-wide LLM slots (blocking). watch / bulk
+    jobs additionally let any running interactive process go first.
+    """
+    priority_rank(priority)
+    os.makedirs(folder, exist_ok=True)
+    path = None
+    while path is None:
+        if priority != "interactive" and interactive_elsewhere(folder):
+            time.sleep(POLL_SECONDS)
+            continue
+        _live_pids("llm-", folder)        # clears slots of dead processes
+        for slot in range(max_jobs):
+            candidate = os.path.join(folder, f"llm-{slot}")
+            try:
+                fd = os.open(candidate, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                continue
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(str(os.getpid()))
+            path = candidate
+            break
+        else:
+            time.sleep(POLL_SECONDS)
+    try:
+        yield
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
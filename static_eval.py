@@ -0,0 +1,279 @@
+# static_eval.py
+"""
+Vectorized static evaluation for pre-screening plies before the engine.
+
+The positions of a whole game are turned into one (n, 12) uint64 array of
+piece bitboards (python-chess masks, one replay of the moves). Every term
+then runs as NumPy operations over all positions at once:
+
+  - material + piece-square tables (Simplified Evaluation Function)
+  - mobility: squares attacked per piece type, not occupied by own pieces
+    (shift / Kogge-Stone fills on the bitboards, no move generation)
+  - hanging pieces: the side to move gets most of the value of the best
+    undefended enemy piece it attacks
+
+The result is in centipawns from white's perspective, like the engine
+evals in GameAnalysisResult.cpl_list. It does not search, so it cannot see
+forks or mates. It is only used to decide which plies are obviously quiet:
+
+    screen_game(moves) -> bool per ply, True = send to the engine
+
+A ply is a candidate when it is tactical (capture, promotion, check, or a
+reply to check) or when the static eval swings by more than QUIET_SWING.
+The ply before each candidate is searched too, so candidates are
+classified against a real eval. One ply in every ANCHOR_EVERY is searched
+so the approximation cannot drift. GameAnalyzer(screen=True) fills the
+other plies with the last engine eval plus the static change since then.
+bench_static_eval.py measures the agreement with Stockfish.
+"""
+import chess
+import numpy as np
+
+
+QUIET_SWING = 40              # cp of static eval change (mover's view) still considered quiet
+ANCHOR_EVERY = 8              # plies — always search at least this often
+HANGING_SHARE = 0.8           # share of a hanging piece's value credited to the side to move
+
+# bitboard order: white P N B R Q K, then black P N B R Q K
+PIECE_TYPES = (chess.PAWN, chess.KNIGHT, chess.BISHOP, chess.ROOK, chess.QUEEN, chess.KING)
+MATERIAL = np.array([100, 320, 330, 500, 900, 0], dtype=np.float64)
+MOBILITY = np.array([0, 4, 5, 2, 1, 0], dtype=np.float64)       # cp per reachable square
+
+# piece-square tables, white's view, rank 8 first (as printed on a board)
+_PST = {
+    chess.PAWN: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        50, 50, 50, 50, 50, 50, 50, 50,
+        10, 10, 20, 30, 30, 20, 10, 10,
+        5, 5, 10, 25, 25, 10, 5, 5,
+        0, 0, 0, 20, 20, 0, 0, 0,
+        5, -5, -10, 0, 0, -10, -5, 5,
+        5, 10, 10, -20, -20, 10, 10, 5,
+        0, 0, 0, 0, 0, 0, 0, 0,
+    ],
+    chess.KNIGHT: [
+        -50, -40, -30, -30, -30, -30, -40, -50,
+        -40, -20, 0, 0, 0, 0, -20, -40,
+        -30, 0, 10, 15, 15, 10, 0, -30,
+        -30, 5, 15, 20, 20, 15, 5, -30,
+        -30, 0, 15, 20, 20, 15, 0, -30,
+        -30, 5, 10, 15, 15, 10, 5, -30,
+        -40, -20, 0, 5, 5, 0, -20, -40,
+        -50, -40, -30, -30, -30, -30, -40, -50,
+    ],
+    chess.BISHOP: [
+        -20, -10, -10, -10, -10, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 10, 10, 5, 0, -10,
+        -10, 5, 5, 10, 10, 5, 5, -10,
+        -10, 0, 10, 10, 10, 10, 0, -10,
+        -10, 10, 10, 10, 10, 10, 10, -10,
+        -10, 5, 0, 0, 0, 0, 5, -10,
+        -20, -10, -10, -10, -10, -10, -10, -20,
+    ],
+    chess.ROOK: [
+        0, 0, 0, 0, 0, 0, 0, 0,
+        5, 10, 10, 10, 10, 10, 10, 5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        -5, 0, 0, 0, 0, 0, 0, -5,
+        0, 0, 0, 5, 5, 0, 0, 0,
+    ],
+    chess.QUEEN: [
+        -20, -10, -10, -5, -5, -10, -10, -20,
+        -10, 0, 0, 0, 0, 0, 0, -10,
+        -10, 0, 5, 5, 5, 5, 0, -10,
+        -5, 0, 5, 5, 5, 5, 0, -5,
+        0, 0, 5, 5, 5, 5, 0, -5,
+        -10, 5, 5, 5, 5, 5, 0, -10,
+        -10, 0, 5, 0, 0, 0, 0, -10,
+        -20, -10, -10, -5, -5, -10, -10, -20,
+    ],
+    chess.KING: [
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -30, -40, -40, -50, -50, -40, -40, -30,
+        -20, -30, -30, -40, -40, -30, -30, -20,
+        -10, -20, -20, -20, -20, -20, -20, -10,
+        20, 20, 0, 0, 0, 0, 20, 20,
+        20, 30, 10, 0, 0, 10, 30, 20,
+    ],
+}
+
+
+def _square_weights():
+    """(12, 64) signed cp per piece on each square (a1 = 0): white positive, black negative."""
+    weights = np.zeros((12, 64))
+    for i, pt in enumerate(PIECE_TYPES):
+        table = np.array(_PST[pt], dtype=np.float64)
+        weights[i] = MATERIAL[i] + table.reshape(8, 8)[::-1].ravel()    # rank 1 first
+        weights[6 + i] = -(MATERIAL[i] + table)                         # black: mirrored ranks
+    return weights
+
+
+SQUARE_WEIGHTS = _square_weights()
+
+
+# ============================================================
+#   BITBOARD HELPERS (uint64 arrays)
+# ============================================================
+_U = np.uint64
+NOT_A = _U(0xFEFEFEFEFEFEFEFE)
+NOT_H = _U(0x7F7F7F7F7F7F7F7F)
+NOT_AB = _U(0xFCFCFCFCFCFCFCFC)
+NOT_GH = _U(0x3F3F3F3F3F3F3F3F)
+
+# (shift, left?, wrap mask) per direction
+_DIRS = {
+    "n": (8, True, None), "s": (8, False, None),
+    "e": (1, True, NOT_A), "w": (1, False, NOT_H),
+    "ne": (9, True, NOT_A), "nw": (7, True, NOT_H),
+    "se": (7, False, NOT_A), "sw": (9, False, NOT_H),
+}
+_ROOK_DIRS = ("n", "s", "e", "w")
+_BISHOP_DIRS = ("ne", "nw", "se", "sw")
+
+
+def _step(bb, direction):
+    shift, left, mask = _DIRS[direction]
+    moved = (bb << _U(shift)) if left else (bb >> _U(shift))
+    return moved if mask is None else moved & mask
+
+
+def _slide(pieces, empty, directions):
+    """Squares attacked by sliders (blockers included) — Kogge-Stone style fill per direction."""
+    attacks = np.zeros_like(pieces)
+    for d in directions:
+        flood = gen = pieces
+        for _ in range(6):
+            gen = _step(gen, d) & empty
+            flood = flood | gen
+        attacks |= _step(flood, d)
+    return attacks
+
+
+def _knight_attacks(n):
+    return (
+        ((n << _U(17)) & NOT_A) | ((n << _U(15)) & NOT_H)
+        | ((n << _U(10)) & NOT_AB) | ((n << _U(6)) & NOT_GH)
+        | ((n >> _U(17)) & NOT_H) | ((n >> _U(15)) & NOT_A)
+        | ((n >> _U(10)) & NOT_GH) | ((n >> _U(6)) & NOT_AB)
+    )
+
+
+def _king_attacks(k):
+    attacks = np.zeros_like(k)
+    for d in _DIRS:
+        attacks |= _step(k, d)
+    return attacks
+
+
+def _popcount(bb):
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(bb).astype(np.float64)
+    return np.unpackbits(bb.astype("<u8").view(np.uint8), axis=-1).reshape(bb.shape + (-1,)).sum(-1).astype(np.float64)
+
+
+def _side_attacks(bbs, side, empty):
+    """(n, 6) attacked squares per piece type of one side (0 = white, 1 = black)."""
+    p = bbs[:, 6 * side:6 * side + 6]
+    pawns = p[:, 0]
+    pawn_att = (_step(pawns, "ne") | _step(pawns, "nw")) if side == 0 else (_step(pawns, "se") | _step(pawns, "sw"))
+    return np.stack([
+        pawn_att,
+        _knight_attacks(p[:, 1]),
+        _slide(p[:, 2], empty, _BISHOP_DIRS),
+        _slide(p[:, 3], empty, _ROOK_DIRS),
+        _slide(p[:, 4], empty, _ROOK_DIRS + _BISHOP_DIRS),
+        _king_attacks(p[:, 5]),
+    ], axis=1)
+
+
+# ============================================================
+#   EVALUATION
+# ============================================================
+def board_bitboards(board: chess.Board) -> np.ndarray:
+    """(12,) uint64 piece bitboards of one position."""
+    return np.array(
+        [board.pieces_mask(pt, color) for color in (chess.WHITE, chess.BLACK) for pt in PIECE_TYPES],
+        dtype=np.uint64,
+    )
+
+
+def game_bitboards(moves, board=None):
+    """
+    Bitboards of the start position and of the position after every move:
+    (n + 1, 12) uint64, plus white_to_move (n + 1,) and the tactical flag of
+    every ply (capture / promotion / gives check / reply to check).
+    """
+    board = board.copy() if board is not None else chess.Board()
+    bbs = [board_bitboards(board)]
+    white_to_move = [board.turn == chess.WHITE]
+    tactical = []
+    for move in moves:
+        tactical.append(
+            board.is_check() or move.promotion is not None
+            or board.is_capture(move) or board.gives_check(move)
+        )
+        board.push(move)
+        bbs.append(board_bitboards(board))
+        white_to_move.append(board.turn == chess.WHITE)
+    return np.array(bbs, dtype=np.uint64), np.array(white_to_move), np.array(tactical, dtype=bool)
+
+
+def evaluate_bitboards(bbs, white_to_move) -> np.ndarray:
+    """Static evals (cp, white's perspective) of a batch of positions, shape (n,)."""
+    bbs = np.asarray(bbs, dtype=np.uint64)
+    bits = np.unpackbits(bbs.astype("<u8").view(np.uint8).reshape(len(bbs), 12, 8), axis=-1, bitorder="little")
+    score = np.einsum("nps,ps->n", bits, SQUARE_WEIGHTS)
+
+    own = [np.bitwise_or.reduce(bbs[:, 6 * s:6 * s + 6], axis=1) for s in (0, 1)]
+    empty = ~(own[0] | own[1])
+    attacks = [_side_attacks(bbs, s, empty) for s in (0, 1)]
+    mobility = [_popcount(attacks[s] & ~own[s][:, None]) @ MOBILITY for s in (0, 1)]
+    score += mobility[0] - mobility[1]
+
+    # hanging: attacked by the side to move, defended by nobody -> it can take the best one
+    covered = [np.bitwise_or.reduce(a, axis=1) for a in attacks]
+    stm = np.where(white_to_move, 0, 1)
+    gain = np.zeros(len(bbs))
+    for s in (0, 1):
+        victims = bbs[:, 6 * (1 - s):6 * (1 - s) + 5] & (covered[s] & ~covered[1 - s])[:, None]
+        best = np.max((victims != 0) * MATERIAL[:5], axis=1)
+        gain = np.where(stm == s, best, gain)
+    score += np.where(white_to_move, 1.0, -1.0) * HANGING_SHARE * gain
+    return score
+
+
+def evaluate_game(moves, board=None) -> np.ndarray:
+    """Static evals after every move (white's perspective), shape (n,)."""
+    bbs, white_to_move, _ = game_bitboards(moves, board)
+    return evaluate_bitboards(bbs, white_to_move)[1:]
+
+
+# ============================================================
+#   SCREENING
+# ============================================================
+def screen_game(moves, board=None, quiet_swing: float = QUIET_SWING, anchor_every: int = ANCHOR_EVERY):
+    """
+    Which plies need an engine eval: (search mask (n,) bool, static evals
+    of the start + every ply (n + 1,)). The last ply is always searched.
+    """
+    bbs, white_to_move, tactical = game_bitboards(moves, board)
+    static = evaluate_bitboards(bbs, white_to_move)
+    n = len(tactical)
+    if not n:
+        return np.zeros(0, dtype=bool), static
+
+    mover = np.where(white_to_move[:-1], 1.0, -1.0)
+    swing = mover * (static[1:] - static[:-1])
+    candidate = tactical | (np.abs(swing) > quiet_swing)
+
+    search = candidate.copy()
+    search[:-1] |= candidate[1:]             # the eval before a candidate ply, too
+    search[anchor_every - 1::anchor_every] = True
+    search[-1] = True
+    return search, static
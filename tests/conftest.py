@@ -0,0 +1,24 @@
+# tests/conftest.py
+"""
+The modules live at the repository root (flat layout); make them importable.
+Engine-backed tests run against tests/stand_in_uci.py instead of Stockfish.
+"""
+import os
+import sys
+
+import pytest
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(TESTS_DIR))
+
+STAND_IN_ENGINE = [sys.executable, os.path.join(TESTS_DIR, "stand_in_uci.py")]
+FIXTURES = os.path.join(TESTS_DIR, "fixtures")
+
+
+@pytest.fixture
+def engine():
+    from async_engine import EngineClient
+
+    client = EngineClient(STAND_IN_ENGINE, size=1, depth=1)
+    yield client
+    client.close()
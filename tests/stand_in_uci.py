@@ -0,0 +1,110 @@
+# tests/stand_in_uci.py
+"""
+Deterministic stand-in for Stockfish, speaking just enough UCI for
+async_engine.py. The score is material from the side to move after a
+capture-only quiescence search (plus check evasions), so hanging pieces
+and simple exchanges are scored the way an engine would score them. There
+is no real search and no randomness: the same position always gets the
+same score and best move.
+
+    EngineClient([sys.executable, "tests/stand_in_uci.py"], size=1, depth=1)
+"""
+import sys
+
+import chess
+
+MATE = 100000
+QUIESCENCE_PLIES = 8
+VALUES = {chess.PAWN: 100, chess.KNIGHT: 300, chess.BISHOP: 300, chess.ROOK: 500, chess.QUEEN: 900, chess.KING: 0}
+
+
+def material(board):
+    """Material balance from the side to move's perspective."""
+    score = 0
+    for piece in board.piece_map().values():
+        score += VALUES[piece.piece_type] if piece.color == board.turn else -VALUES[piece.piece_type]
+    return score
+
+
+def _ordered(board, moves):
+    """Most valuable victim first, then least valuable attacker; UCI order breaks ties."""
+    def key(move):
+        victim = board.piece_at(move.to_square)
+        attacker = board.piece_at(move.from_square)
+        return (-(VALUES[victim.piece_type] if victim else 100), VALUES[attacker.piece_type], move.uci())
+    return sorted(moves, key=key)
+
+
+def quiescence(board, alpha, beta, plies):
+    if board.is_checkmate():
+        return -MATE
+    in_check = board.is_check()
+    if not in_check:
+        stand_pat = material(board)
+        if stand_pat >= beta or plies == 0:
+            return stand_pat
+        alpha = max(alpha, stand_pat)
+    elif plies == 0:
+        return material(board)
+
+    moves = board.legal_moves if in_check else (m for m in board.legal_moves if board.is_capture(m))
+    for move in _ordered(board, list(moves)):
+        board.push(move)
+        score = -quiescence(board, -beta, -alpha, plies - 1)
+        board.pop()
+        if score >= beta:
+            return score
+        alpha = max(alpha, score)
+    return alpha
+
+
+def search(board):
+    """(score for the side to move, best move): one ply of all moves, then quiescence."""
+    best, best_move = -MATE - 1, None
+    for move in _ordered(board, list(board.legal_moves)):
+        board.push(move)
+        score = -quiescence(board, -MATE - 1, -best, QUIESCENCE_PLIES)
+        board.pop()
+        if score > best:
+            best, best_move = score, move
+    return best, best_move
+
+
+def main():
+    board = chess.Board()
+    for line in sys.stdin:
+        cmd = line.split()
+        if not cmd:
+            continue
+        if cmd[0] == "uci":
+            print("id name StandIn")
+            print("option name Threads type spin default 1 min 1 max 64")
+            print("uciok", flush=True)
+        elif cmd[0] == "isready":
+            print("readyok", flush=True)
+        elif cmd[0] == "position":
+            if cmd[1] == "startpos":
+                board = chess.Board()
+                rest = cmd[2:]
+            else:
+                end = cmd.index("moves") if "moves" in cmd else len(cmd)
+                board = chess.Board(" ".join(cmd[2:end]))
+                rest = cmd[end:]
+            for uci in rest[1:]:
+                board.push_uci(uci)
+        elif cmd[0] == "go":
+            if board.is_game_over():
+                print("bestmove (none)", flush=True)
+                continue
+            score, move = search(board)
+            if score >= MATE:
+                print(f"info depth 1 score mate 1 pv {move.uci()}")
+            else:
+                print(f"info depth 1 score cp {score} pv {move.uci()}")
+            print(f"bestmove {move.uci()}", flush=True)
+        elif cmd[0] == "quit":
+            break
+
+
+if __name__ == "__main__":
+    main()
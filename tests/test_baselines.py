@@ -0,0 +1,65 @@
+# tests/test_baselines.py
+import random
+
+import chess
+import chess.pgn
+import numpy as np
+import pytest
+
+import baselines
+from baselines import BaselineBuilder, Baselines, build_baselines
+
+
+def _write_games(path, n, seed=3):
+    """n random rated blitz games with an [%eval] on every ply."""
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for i in range(n):
+            game = chess.pgn.Game()
+            game.headers.update(Event="Rated Blitz game", Site=f"https://lichess.org/s{seed}g{i:05d}",
+                                WhiteElo=str(rng.randrange(900, 2500)), BlackElo=str(rng.randrange(900, 2500)),
+                                TimeControl="180+0")
+            node, board = game, chess.Board()
+            while board.ply() < 30 and not board.is_game_over():
+                move = rng.choice(list(board.legal_moves))
+                board.push(move)
+                node = node.add_variation(move)
+                node.set_eval(chess.engine.PovScore(chess.engine.Cp(rng.randrange(-300, 300)), chess.WHITE))
+            print(game, file=f, end="\n\n")
+
+
+@pytest.fixture
+def corpus(tmp_path, monkeypatch):
+    monkeypatch.setattr(baselines, "MIN_RANGE_BYTES", 4096)
+    paths = [str(tmp_path / "a.pgn"), str(tmp_path / "b.pgn")]
+    _write_games(paths[0], 40, seed=1)
+    _write_games(paths[1], 25, seed=2)
+    return paths
+
+
+def test_byte_ranges_cover_every_game_once(corpus):
+    whole = [h["Site"] for h in _headers(baselines.open_pgn(corpus[0]))]
+    jobs = [r for p, r in baselines._split_files(corpus[:1], processes=4)]
+    assert len(jobs) > 1
+    parts = [site for r in jobs for site in (h["Site"] for h in _headers(baselines.open_pgn_range(corpus[0], *r)))]
+    assert parts == whole
+
+
+def test_processes_build_the_same_table_as_one_pass(corpus, tmp_path):
+    one = build_baselines(corpus, sample_rate=1.0, path=str(tmp_path / "one.npz"))
+    many = build_baselines(corpus, sample_rate=1.0, path=str(tmp_path / "many.npz"), processes=3)
+
+    assert len(one) == 2 * 65
+    assert one.seen == many.seen
+    for metric in one.hist:
+        np.testing.assert_array_equal(one.hist[metric], many.hist[metric])
+    assert len(Baselines.load(str(tmp_path / "many.npz"))) == len(one)
+
+
+def _headers(f):
+    with f:
+        while True:
+            headers = chess.pgn.read_headers(f)
+            if headers is None:
+                return
+            yield headers
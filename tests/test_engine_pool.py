@@ -0,0 +1,158 @@
+# tests/test_engine_pool.py
+import asyncio
+
+import chess
+import pytest
+
+from async_engine import EnginePool
+from conftest import STAND_IN_ENGINE
+from scheduler import SlotScheduler
+
+
+@pytest.fixture(autouse=True)
+def no_markers(tmp_path, monkeypatch):
+    """Interactive markers of other processes live under data/scheduler — keep them out."""
+    monkeypatch.chdir(tmp_path)
+
+
+async def _settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+# ---------- SLOT SCHEDULER ----------
+def test_slots_go_to_the_most_urgent_waiter():
+    async def scenario():
+        slots = SlotScheduler(1)
+        await slots.acquire("bulk", "holder")
+        granted = []
+
+        async def wait(priority, user):
+            await slots.acquire(priority, user)
+            granted.append(priority)
+            slots.release(user)
+
+        tasks = [asyncio.create_task(wait(p, p)) for p in ("bulk", "watch", "interactive")]
+        await _settle()
+        assert slots.waiting_above("bulk") and not slots.waiting_above("interactive")
+        slots.release("holder")
+        await asyncio.gather(*tasks)
+        return granted, slots.free
+
+    granted, free = asyncio.run(scenario())
+    assert granted == ["interactive", "watch", "bulk"]
+    assert free == 1
+
+
+def test_slots_are_fair_between_users_of_one_class():
+    async def scenario():
+        slots = SlotScheduler(2)
+        await slots.acquire("bulk", "a")
+        await slots.acquire("bulk", "a")
+        granted = []
+
+        async def wait(user):
+            await slots.acquire("bulk", user)
+            granted.append(user)
+
+        tasks = [asyncio.create_task(wait("a")), asyncio.create_task(wait("b"))]
+        await _settle()
+        slots.release("a")                # "a" queued first, but holds more engines
+        await _settle()
+        for task in tasks:
+            task.cancel()
+        return granted
+
+    assert asyncio.run(scenario()) == ["b"]
+
+
+def test_cancelled_waiter_does_not_leak_a_slot():
+    async def scenario():
+        slots = SlotScheduler(1)
+        await slots.acquire("bulk", "holder")
+        cancelled = asyncio.create_task(slots.acquire("interactive", "gone"))
+        waiting = asyncio.create_task(slots.acquire("watch", "next"))
+        await _settle()
+        cancelled.cancel()
+        await _settle()
+        slots.release("holder")
+        await waiting
+        slots.release("next")
+        return slots.free, dict(slots._held)
+
+    assert asyncio.run(scenario()) == (1, {})
+
+
+# ---------- ENGINE POOL ----------
+def _board(*sans):
+    board = chess.Board()
+    for san in sans:
+        board.push_san(san)
+    return board
+
+
+def test_bulk_game_yields_its_engine_to_interactive_job():
+    async def scenario():
+        order = []
+        async with EnginePool(STAND_IN_ENGINE, size=1, depth=1) as pool:
+            async def bulk_game():
+                async with pool.lease("bulk-game", "bulk", "bulk-user") as engine:
+                    board = chess.Board()
+                    for san in ("e4", "e5", "Nf3", "Nc6", "Bb5", "a6"):
+                        board.push_san(san)
+                        await engine.evaluate(board)
+                        order.append("bulk")
+                        await asyncio.sleep(0.01)
+                        await engine.checkpoint()
+
+            async def interactive_job():
+                await asyncio.sleep(0.02)
+                await pool.evaluate(_board("d4"), game="one-off", priority="interactive")
+                order.append("interactive")
+
+            await asyncio.gather(bulk_game(), interactive_job())
+            return order, len(pool._idle), pool._slots.free, pool.size
+
+    order, idle, free, size = asyncio.run(scenario())
+    assert order.index("interactive") < len(order) - 1      # did not wait for the whole bulk game
+    assert idle == free == size
+
+
+def test_cancel_during_checkpoint_releases_the_engine_once():
+    async def scenario():
+        async with EnginePool(STAND_IN_ENGINE, size=1, depth=1) as pool:
+            in_checkpoint = asyncio.Event()
+            interactive_may_finish = asyncio.Event()
+
+            async def bulk_game():
+                async with pool.lease("bulk-game", "bulk", "bulk-user") as engine:
+                    await engine.evaluate(_board("e4"))
+                    while not pool._slots.waiting_above("bulk"):
+                        await asyncio.sleep(0.001)
+                    in_checkpoint.set()
+                    await engine.checkpoint()           # hands over, then queues again
+                    await engine.evaluate(_board("e4", "e5"))
+
+            async def interactive_job():
+                async with pool.lease("one-off", "interactive", "me") as engine:
+                    await engine.evaluate(_board("d4"))
+                    await interactive_may_finish.wait()
+
+            bulk = asyncio.create_task(bulk_game())
+            await asyncio.sleep(0.05)
+            job = asyncio.create_task(interactive_job())
+            await in_checkpoint.wait()
+            await _settle()
+            assert not bulk.done()                      # queued behind the interactive lease
+            bulk.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await bulk
+            interactive_may_finish.set()
+            await job
+
+            idle = list(pool._idle)
+            return len(idle), len({id(e) for e in idle}), pool._slots.free, pool.size
+
+    idle, distinct, free, size = asyncio.run(scenario())
+    assert idle == distinct == size
+    assert free == size
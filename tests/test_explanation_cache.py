@@ -0,0 +1,64 @@
+# tests/test_explanation_cache.py
+import chess
+import pytest
+
+from LLMChessAnalyzer import LLMChessAnalyzer, WorstMove, section_body
+from explanation_cache import ExplanationCache
+
+
+def _analyzer(tmp_path):
+    analyzer = LLMChessAnalyzer(None, stockfish_path=None, cache_path=None)
+    analyzer.model_id = "test-model"
+    analyzer.cache = ExplanationCache(str(tmp_path / "explanations.sqlite"))
+    return analyzer
+
+
+def _worst(fen, san, move_number, loss=-300):
+    board = chess.Board(fen)
+    return WorstMove(move_number, san, loss, fen=fen, uci=board.parse_san(san).uci())
+
+
+def test_section_body_drops_heading():
+    assert section_body("**Move 13: Nd4** (eval change: -466) – hangs the knight.", "Nd4") == "hangs the knight."
+    assert section_body("Move 13... Nd4\n\nThe knight hangs.", "Nd4") == "The knight hangs."
+    assert section_body("no heading here", "Nd4") == "no heading here"
+
+
+def test_cached_section_reused_at_other_move_number(tmp_path):
+    analyzer = _analyzer(tmp_path)
+    board = chess.Board()
+    for san in ["e4", "e5", "Qh5", "Nc6", "Bc4"]:
+        board.push_san(san)
+    early = _worst(board.fen(), "Nf6", move_number=3)
+
+    answers = iter(["Move 3: Nf6\nAllows Qxf7 mate.\n"])
+    analyzer.ask_llm = lambda bad_moves: next(answers)
+    assert analyzer.explain_moves([early]) == "Move 3: Nf6\nAllows Qxf7 mate."
+
+    # same position and move, reached later (different move counters) next to a fresh move
+    later_fen = board.fen().rsplit(" ", 2)[0] + " 0 11"
+    later = _worst(later_fen, "Nf6", move_number=11)
+    other = _worst(chess.STARTING_FEN, "f3", move_number=1)
+
+    prompted = []
+
+    def ask(bad_moves):
+        prompted.extend(bad_moves)
+        return "Move 1: f3\nWeakens the king.\n"
+
+    analyzer.ask_llm = ask
+    text = analyzer.explain_moves([later, other])
+
+    assert prompted == [other]
+    assert "Move 11: Nf6\nAllows Qxf7 mate." in text
+    assert "Move 3" not in text
+    assert "Move 1: f3\nWeakens the king." in text
+
+    streamed = "".join(analyzer.explain_moves_stream([later]))
+    assert streamed.strip() == "Move 11: Nf6\nAllows Qxf7 mate."
+
+
+def test_llm_only_analyzer_needs_engine_for_worst_moves():
+    analyzer = LLMChessAnalyzer(None, stockfish_path=None, cache_path=None)
+    with pytest.raises(RuntimeError, match="engine required"):
+        analyzer.analyze_game("1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0")
@@ -0,0 +1,79 @@
+# tests/test_live_analysis.py
+import json
+import os
+
+import chess
+import chess.pgn
+
+from analyzerChart import GameAnalyzer
+from conftest import FIXTURES
+from lichessAPI import LichessClient
+from live_analysis import LiveGameAnalyzer
+
+STREAM = os.path.join(FIXTURES, "live_stream.ndjson")
+
+
+class StandInResponse:
+    """requests.Response stand-in: the fixture in small chunks that split lines."""
+    status_code = 200
+
+    def __init__(self, data: bytes, chunk=37):
+        self.data = data
+        self.chunk = chunk
+
+    def iter_content(self, chunk_size=None):
+        for i in range(0, len(self.data), self.chunk):
+            yield self.data[i:i + self.chunk]
+
+
+def _client():
+    client = LichessClient()
+    with open(STREAM, "rb") as f:
+        data = f.read()
+    client.session.get = lambda url, **kwargs: StandInResponse(data)
+    return client
+
+
+def _events():
+    with open(STREAM, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _pgn(events):
+    board = chess.Board()
+    for obj in events[1:]:
+        if "lm" not in obj:
+            break
+        board.push_uci(obj["lm"])
+    return str(chess.pgn.Game.from_board(board))
+
+
+def test_follow_matches_batch_analysis(engine):
+    analyzer = GameAnalyzer(engine=engine)
+    live = list(LiveGameAnalyzer(analyzer, _client()).follow("StandIn1"))
+
+    events = _events()
+    moves = [obj for obj in events[1:] if "lm" in obj][:-1]      # the object after "mate" is never read
+    assert [e.uci for e in live] == [obj["lm"] for obj in moves]
+    assert [e.ply for e in live] == list(range(1, len(moves) + 1))
+    assert [(e.white_clock, e.black_clock) for e in live] == [(obj["wc"], obj["bc"]) for obj in moves]
+    assert live[-1].san == "Nf3#"
+
+    batch = analyzer.analyze_game(_pgn(events), patterns=False)
+    assert [e.eval for e in live] == list(batch.cpl_list)
+    flagged = [f"{e.ply}. {e.san} — {e.classification} (Δ = {e.delta})" for e in live if e.classification]
+    assert flagged and flagged == batch.mistakes
+
+
+def test_process_joins_mid_game(engine):
+    analyzer = GameAnalyzer(engine=engine)
+    events = _events()
+    board = chess.Board()
+    for obj in events[1:7]:
+        board.push_uci(obj["lm"])
+    state = dict(events[0], fen=board.fen(), turns=6)
+
+    live = list(LiveGameAnalyzer(analyzer, client=_client()).process([state] + events[7:]))
+
+    assert live[0].ply == 7 and live[0].uci == events[7]["lm"]
+    assert live[-1].san == "Nf3#"
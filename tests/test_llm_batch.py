@@ -0,0 +1,45 @@
+# tests/test_llm_batch.py
+import pytest
+
+torch = pytest.importorskip("torch")
+transformers = pytest.importorskip("transformers")
+tokenizers = pytest.importorskip("tokenizers")
+
+from LLMChessAnalyzer import LLMChessAnalyzer
+
+
+@pytest.fixture(autouse=True)
+def no_markers(tmp_path, monkeypatch):
+    """llm_slot keeps its markers under data/scheduler — keep them out."""
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    """Randomly initialised two-layer GPT-2 with a byte-level tokenizer: no download."""
+    from tokenizers import Tokenizer, decoders, models, pre_tokenizers
+    from transformers import GPT2Config, GPT2LMHeadModel, PreTrainedTokenizerFast
+
+    alphabet = pre_tokenizers.ByteLevel.alphabet()
+    vocab = {ch: i for i, ch in enumerate(sorted(alphabet))}
+    vocab["<|endoftext|>"] = len(vocab)
+    tok = Tokenizer(models.BPE(vocab=vocab, merges=[]))
+    tok.pre_tokenizer = pre_tokenizers.ByteLevel(add_prefix_space=False)
+    tok.decoder = decoders.ByteLevel()
+
+    torch.manual_seed(0)
+    config = GPT2Config(vocab_size=len(vocab), n_positions=4096, n_embd=32, n_layer=2, n_head=2,
+                        bos_token_id=len(vocab) - 1, eos_token_id=len(vocab) - 1)
+
+    llm = LLMChessAnalyzer(model_path=None, stockfish_path=None)
+    llm.tokenizer = PreTrainedTokenizerFast(tokenizer_object=tok, eos_token="<|endoftext|>")
+    llm.model = GPT2LMHeadModel(config).eval()
+    llm.backend = "transformers"
+    return llm
+
+
+def test_batch_matches_one_game_at_a_time(analyzer):
+    a = [(13, "Nd4", -466)]
+    b = [(21, "Qxb7", -310), (59, "Ke3", -278)]     # longer prompt: padded row
+
+    assert analyzer.ask_llm_batch([a, b]) == [analyzer.ask_llm(a), analyzer.ask_llm(b)]
@@ -0,0 +1,64 @@
+# tests/test_static_screen.py
+import os
+
+import chess.pgn
+import numpy as np
+import pytest
+
+from analyzerChart import GameAnalyzer
+from conftest import FIXTURES
+from static_eval import screen_game
+
+# filled-in evals of quiet plies may drift from the engine by the static eval's
+# positional terms, but never by more than about a pawn
+MAX_FILLED_ERROR = 120
+
+
+def _games():
+    with open(os.path.join(FIXTURES, "screen_games.pgn"), encoding="utf-8") as f:
+        while (game := chess.pgn.read_game(f)) is not None:
+            yield game
+
+
+def _filled_in(search, static, evals):
+    """The eval GameAnalyzer(screen=True) gives each ply, computed from the full pass."""
+    out = np.empty(len(evals), dtype=np.int64)
+    anchor_cp, anchor_static = 0, static[0]
+    for i, cp in enumerate(evals):
+        if search[i]:
+            out[i] = cp
+            anchor_cp, anchor_static = cp, static[i + 1]
+        else:
+            out[i] = int(round(anchor_cp + static[i + 1] - anchor_static))
+    return out
+
+
+@pytest.mark.parametrize("game", list(_games()), ids=lambda g: g.headers["Site"].rsplit("/", 1)[-1])
+def test_screened_evals_match_full_engine_pass(engine, game):
+    pgn = str(game)
+    full = GameAnalyzer(engine=engine).analyze_game(pgn, patterns=False)
+    screened = GameAnalyzer(engine=engine, screen=True).analyze_game(pgn, patterns=False)
+    search, static = screen_game(list(game.mainline_moves()))
+
+    full_cp = np.asarray(full.cpl_list, dtype=np.int64)
+    screened_cp = np.asarray(screened.cpl_list, dtype=np.int64)
+    assert len(screened_cp) == len(full_cp) == len(search)
+
+    # searched plies carry the engine eval, skipped ones anchor + static change
+    np.testing.assert_array_equal(screened_cp[search], full_cp[search])
+    np.testing.assert_array_equal(screened_cp, _filled_in(search, static, full_cp))
+
+    # quiet plies agree with the engine
+    assert np.abs(screened_cp - full_cp)[~search].max(initial=0) <= MAX_FILLED_ERROR
+
+    # no blunder of the full pass is lost
+    blunders = [m for m in full.mistakes if "Blunder" in m]
+    assert blunders and set(blunders) <= set(screened.mistakes)
+
+
+def test_quiet_game_skips_plies():
+    game = list(_games())[1]
+    search, static = screen_game(list(game.mainline_moves()))
+    assert 0 < search.sum() < len(search)
+    assert search[-1]
+    assert len(static) == len(search) + 1
@@ -0,0 +1,268 @@
+# watch.py
+"""
+Watch mode: long-running poller that analyses new games minutes after they end.
+
+    python cli.py watch bielbart77 other_user --interval 300 --workers 2
+
+- one `since` cursor per username (persisted in data/watch_state.json):
+  the end time (lastMoveAt) of the latest analysed game. Lichess filters
+  `since` on the creation time, so each poll asks for games created up to
+  the longest plausible game of the perf type before the cursor
+  (CURSOR_OVERLAP_MS). Without --perf the classical window is used, and
+  correspondence games are only caught when watched with
+  --perf correspondence.
+- a game whose analysis fails is retried on the next polls and dropped
+  (marked seen) after MAX_ATTEMPTS failures
+- Lichess rate limits are respected: one request at a time, a fixed gap
+  between requests and a full minute pause after HTTP 429
+- new games go to a queue served by worker threads that share one asyncio
+  engine pool (async_engine.py, one Stockfish process per worker); each
+  game keeps its engine and warm hash from first to last ply, unless an
+  interactive job needs it (scheduler.py, priority "watch", fair per user)
+- per-user aggregates (aggregates.py) are updated with each new game and
+  the trend charts are rendered from them; heatmaps / top blunders are
+  refreshed from the user's recent results; the opening tree
+  (opening_tree.py), the heatmap cube (heatmap_cube.py) and the pattern
+  index (pattern_index.py) grow by the new game
+"""
+import json
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+from aggregates import PlayerAggregates
+from analyzerChart import GameAnalyzer
+from async_engine import EngineClient
+from opening_tree import OpeningTree
+from heatmap_cube import HeatmapCube
+from pattern_index import PatternIndex
+from lichessAPI import LichessClient, RateLimitedError
+
+
+STATE_PATH = "data/watch_state.json"
+
+# games can finish long after they were created — re-ask for the longest
+# plausible game of the perf type (dedup by id keeps the engine work
+# proportional to new games only)
+_HOUR_MS = 60 * 60 * 1000
+CURSOR_OVERLAP_MS = {
+    "ultrabullet": _HOUR_MS // 4,
+    "bullet": _HOUR_MS // 2,
+    "blitz": _HOUR_MS,
+    "rapid": 2 * _HOUR_MS,
+    "classical": 8 * _HOUR_MS,
+    "correspondence": 30 * 24 * _HOUR_MS,
+}
+DEFAULT_OVERLAP_MS = CURSOR_OVERLAP_MS["classical"]
+MAX_ATTEMPTS = 3
+SEEN_IDS_KEPT = 300
+RECENT_RESULTS_KEPT = 50
+GAME_TIMEOUT = 15 * 60       # s — a hung engine must not block a worker forever
+
+
+# ============================================================
+#   CURSOR STATE
+# ============================================================
+def _ended_at(game) -> Optional[int]:
+    return game.last_move_at or game.created_at
+
+
+class WatchState:
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self.users: Dict[str, dict] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.users = json.load(f)
+
+    def user(self, username: str) -> dict:
+        return self.users.setdefault(username.lower(), {"since": None, "seen": []})
+
+    def mark_seen(self, username: str, game_id: str, ended_at: Optional[int]):
+        u = self.user(username)
+        u["seen"] = (u["seen"] + [game_id])[-SEEN_IDS_KEPT:]
+        if ended_at and (u["since"] is None or ended_at > u["since"]):
+            u["since"] = ended_at
+
+    def save(self):
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.exists(folder):
+            os.makedirs(folder)
+        tmp = self.path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.users, f)
+        os.replace(tmp, self.path)
+
+
+# ============================================================
+#   WATCHER
+# ============================================================
+class GameWatcher:
+    def __init__(
+        self,
+        usernames: List[str],
+        perf_type: Optional[str] = None,
+        interval: float = 300,
+        workers: int = 2,
+        request_gap: float = 3.0,
+        backfill: int = 0,
+        stockfish_path: str = "stockfish.exe",
+        state_path: str = STATE_PATH,
+    ):
+        self.usernames = usernames
+        self.perf_type = perf_type
+        self.interval = interval
+        self.request_gap = request_gap
+        self.backfill = backfill
+        self.client = LichessClient()
+        self.state = WatchState(state_path)
+        self.jobs = queue.Queue()
+        self.recent = {u.lower(): deque(maxlen=RECENT_RESULTS_KEPT) for u in usernames}
+        self._lock = threading.Lock()          # state + pyplot are not thread-safe
+        self._stop = threading.Event()
+        self._queued = set()                   # enqueued, not analysed yet
+        self._failures = {}                    # game id -> failed analyses so far
+        self.aggregates = {}                   # username -> PlayerAggregates
+        self.opening_trees = {}                # username -> OpeningTree
+        self.heatmap_cubes = {}                # username -> HeatmapCube
+        self.patterns = PatternIndex.load()    # flagged plies of all watched games
+
+        self.engine = EngineClient(stockfish_path, size=workers, options=GameAnalyzer.ENGINE_OPTIONS)
+        self.workers = [
+            threading.Thread(target=self._worker, args=(GameAnalyzer(engine=self.engine, priority="watch"),),
+                             daemon=True)
+            for _ in range(workers)
+        ]
+
+    # ---------- POLLING ----------
+    def poll_user(self, username: str) -> int:
+        """Fetches games newer than the user's cursor, enqueues unseen ones. Returns count."""
+        with self._lock:
+            u = self.state.user(username)
+            if u["since"] is None and not self.backfill:
+                # first sight: start watching from now on
+                u["since"] = int(time.time() * 1000)
+                return 0
+            first_poll = u["since"] is None
+            overlap = CURSOR_OVERLAP_MS.get(self.perf_type, DEFAULT_OVERLAP_MS)
+            since = None if first_poll else max(0, u["since"] - overlap)
+
+        games = self.client.get_user_games(
+            username=username,
+            max_games=self.backfill if first_poll else 50,
+            perf_type=self.perf_type,
+            since=since,
+        )
+
+        with self._lock:
+            skip = set(self.state.user(username)["seen"]) | self._queued
+            new_games = [g for g in games if g.game_id not in skip]
+            self._queued.update(g.game_id for g in new_games)
+
+        # API returns newest first — analyse in chronological order
+        for g in sorted(new_games, key=lambda g: g.created_at or 0):
+            self.jobs.put((username, g))
+        return len(new_games)
+
+    def run(self):
+        for w in self.workers:
+            w.start()
+
+        print(f"[INFO] Watching {len(self.usernames)} user(s), poll every {self.interval}s ...")
+        try:
+            while not self._stop.is_set():
+                cycle_start = time.time()
+                for username in self.usernames:
+                    try:
+                        n = self.poll_user(username)
+                        if n:
+                            print(f"[INFO] {username}: {n} new game(s) queued")
+                    except RateLimitedError:
+                        print("[WARN] Rate limited by Lichess — pausing 60s")
+                        self._stop.wait(60)
+                    except Exception as e:
+                        print(f"[WARN] Polling {username} failed: {e}")
+                    self._stop.wait(self.request_gap)
+
+                with self._lock:
+                    self.state.save()
+                self._stop.wait(max(0.0, self.interval - (time.time() - cycle_start)))
+        except KeyboardInterrupt:
+            print("[INFO] Stopping watch mode...")
+        finally:
+            self._stop.set()
+            with self._lock:
+                self.state.save()
+            self.engine.close()
+
+    # ---------- ANALYSIS WORKERS ----------
+    def _worker(self, analyzer: GameAnalyzer):
+        while not self._stop.is_set():
+            try:
+                username, game = self.jobs.get(timeout=1)
+            except queue.Empty:
+                continue
+            try:
+                result = analyzer.analyze_game(game.pgn, timeout=GAME_TIMEOUT, user=username)
+                self.on_result(username, game, result)
+            except Exception as e:
+                self._analysis_failed(username, game, e)
+            finally:
+                with self._lock:
+                    self._queued.discard(game.game_id)
+                self.jobs.task_done()
+
+    def _analysis_failed(self, username, game, error):
+        """Retried on the next polls; after MAX_ATTEMPTS the game is marked seen and dropped."""
+        with self._lock:
+            attempts = self._failures[game.game_id] = self._failures.get(game.game_id, 0) + 1
+            if attempts >= MAX_ATTEMPTS:
+                del self._failures[game.game_id]
+                self.state.mark_seen(username, game.game_id, _ended_at(game))
+        if attempts >= MAX_ATTEMPTS:
+            print(f"[WARN] Analysis of {game.game_id} failed {attempts} times, dropped: {error}")
+        else:
+            print(f"[WARN] Analysis of {game.game_id} failed (attempt {attempts}/{MAX_ATTEMPTS}): {error}")
+
+    def on_result(self, username, game, result):
+        import matplotlib
+        matplotlib.use("Agg")    # rendering happens in worker threads
+        from plotter import generate_aggregate_plots, generate_cpl_plots, generate_top_blunders
+        from heatmap_generator import generate_all_heatmaps, render_range_comparison
+
+        with self._lock:
+            self.state.mark_seen(username, game.game_id, _ended_at(game))
+            self._failures.pop(game.game_id, None)
+            recent = self.recent[username.lower()]
+            recent.append(result)
+
+            agg = self.aggregates.get(username.lower())
+            if agg is None:
+                agg = self.aggregates[username.lower()] = PlayerAggregates.load(username)
+            agg.update(result)
+            agg.save()
+
+            tree = self.opening_trees.get(username.lower())
+            if tree is None:
+                tree = self.opening_trees[username.lower()] = OpeningTree.load(username)
+            if tree.update(result):
+                tree.save()
+            cube = self.heatmap_cubes.get(username.lower())
+            if cube is None:
+                cube = self.heatmap_cubes[username.lower()] = HeatmapCube.load(username)
+            if cube.update(result):
+                cube.save()
+            if self.patterns.add_result(result):
+                self.patterns.save()
+
+            out_dir = os.path.join("plots", username.lower())
+            generate_cpl_plots([result], out_dir=out_dir)
+            generate_aggregate_plots(agg, out_dir=out_dir)
+            generate_top_blunders(list(recent), out_dir=out_dir)
+            generate_all_heatmaps(list(recent), out_dir=os.path.join(out_dir, "heatmaps"))
+            render_range_comparison(cube, out_dir=os.path.join(out_dir, "heatmaps"))
+
+        print(f"[INFO] {username}: analysed {result.game_id} — accuracy {result.accuracy:.1f}%")